@@ -0,0 +1,151 @@
+import json
+import hashlib
+
+import numpy as np
+
+from survey_codec import YES
+
+'''
+Coloring of the ranked actions by what the user already does.
+
+An action is green when the user answered "Yes" to an action-reaction
+question related to it, and red otherwise. The question -> related actions
+relations are compiled into bitmasks over the actions (bit i is the i-th
+action of the action mapping), so the set of actions a user already does is
+one OR-reduction over the masks of their "Yes" answers. Coloring a ranked list
+is then a vectorized lookup of the action bits in that mask.
+
+For a single survey the masks are plain Python ints, which is cheaper than
+numpy for one list of a few dozen actions. For batches they are stored as
+uint64 words (n_questions x n_words), which allows any number of actions.
+'''
+
+WORD_BITS = 64
+
+class ActionColoring:
+    """Compiled action mapping and question relations for coloring rankings."""
+
+    def __init__(self, action_mapping, action_questions):
+        """
+        Args:
+            action_mapping (list): Entries with 'code', 'action' and 'number'
+            action_questions (list): Questions with 'id' and optionally 'relation'
+            (action numbers)
+        """
+        self.codes = [item['code'] for item in action_mapping]
+        self.names = [item['action'] for item in action_mapping]
+        self.numbers = [item['number'] for item in action_mapping]
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        # Changes whenever the mapping or the relations change
+        self.version = hashlib.sha256(json.dumps([action_mapping, action_questions],
+                                                 sort_keys=True).encode()).hexdigest()[:12]
+
+        # Bit of every action, and the word/shift it sits in
+        self.n_words = max(1, -(-len(self.codes) // WORD_BITS))
+        bits = np.arange(len(self.codes))
+        self._word = bits // WORD_BITS
+        self._shift = (bits % WORD_BITS).astype(np.uint64)
+
+        # Actions by number (several entries may share a number)
+        number_bits = {}
+        for i, number in enumerate(self.numbers):
+            number_bits.setdefault(number, []).append(i)
+
+        self.answer_keys = [f"q{question['id']}" for question in action_questions]
+        self.int_masks = [0] * len(action_questions)
+        for q, question in enumerate(action_questions):
+            for number in question.get('relation', ()):
+                for i in number_bits.get(number, ()):
+                    self.int_masks[q] |= 1 << i
+
+        self.masks = np.zeros((len(action_questions), self.n_words), dtype=np.uint64)
+        for q, mask in enumerate(self.int_masks):
+            for w in range(self.n_words):
+                self.masks[q, w] = (mask >> (w * WORD_BITS)) & (2**WORD_BITS - 1)
+
+    def doing_mask(self, user_response):
+        """Bitmask (Python int) of the actions a user already does."""
+        mask = 0
+        for key, question_mask in zip(self.answer_keys, self.int_masks):
+            if user_response.get(key) == YES:
+                mask |= question_mask
+        return mask
+
+    def yes_answers(self, user_responses):
+        """Which questions each user answered with "Yes".
+
+        Args:
+            user_responses (list): Survey answers ({'q1': 'Yes', ...})
+
+        Returns:
+            ndarray: Boolean matrix (n_responses x n_questions)
+        """
+        return np.array([[response.get(key) == YES for key in self.answer_keys]
+                         for response in user_responses], dtype=bool).reshape(
+                             len(user_responses), len(self.answer_keys))
+
+    def doing_masks(self, user_responses):
+        """Bitmask of the actions every user already does.
+
+        Args:
+            user_responses (list): Survey answers
+
+        Returns:
+            ndarray: Masks (n_responses x n_words)
+        """
+        yes = self.yes_answers(user_responses)
+        return np.bitwise_or.reduce(np.where(yes[:, :, np.newaxis], self.masks, np.uint64(0)),
+                                    axis=1, initial=np.uint64(0))
+
+    def green(self, indices, doing_masks):
+        """Look up the action bits in the users' masks.
+
+        Args:
+            indices (ndarray): Action indices per user (n_responses x n_ranked),
+            -1 for unknown actions
+            doing_masks (ndarray): Masks (n_responses x n_words)
+
+        Returns:
+            ndarray: Whether each ranked action is green (n_responses x n_ranked)
+        """
+        known = indices >= 0
+        safe = np.where(known, indices, 0)
+        words = np.take_along_axis(doing_masks, self._word[safe], axis=1)
+        return known & (((words >> self._shift[safe]) & np.uint64(1)) == 1)
+
+    def colored(self, codes, green):
+        """Build the colored action entries for one ranked list."""
+        colored_actions = []
+        for code, is_green in zip(codes, green):
+            i = self.code_index.get(code)
+            if i is None:
+                # Handle case where code is not found in mapping
+                colored_actions.append({
+                    'code': code,
+                    'action': f"Unknown action for code: {code}",
+                    'number': 0,
+                    'color': 'red'
+                })
+            else:
+                colored_actions.append({
+                    'code': code,
+                    'action': self.names[i],
+                    'number': self.numbers[i],
+                    'color': 'green' if is_green else 'red'
+                })
+        return colored_actions
+
+    def color(self, codes, user_response):
+        """Color one ranked list of action codes.
+
+        Args:
+            codes (list): Ranked action codes
+            user_response (Dict): Survey answers of the user
+
+        Returns:
+            list: Entries with 'code', 'action', 'number' and 'color'
+        """
+        mask = self.doing_mask(user_response)
+        green = [i is not None and (mask >> i) & 1 == 1
+                 for i in map(self.code_index.get, codes)]
+        return self.colored(codes, green)
@@ -0,0 +1,222 @@
+import json
+import hashlib
+
+from flask import Blueprint, current_app, request, jsonify, make_response
+
+from config import API_CONFIG
+from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, ANSWER_FIELDS, encode_answers, \
+    parse_int
+from materialized import result_version
+
+'''
+Stateless JSON API of the recommendations, i.e. for the partner kiosk app.
+
+The client sends the raw survey answers and gets the ranked and colored
+actions back, without a session or a database round trip:
+
+GET  /api/recommendations?q1=Yes&q2=No&...&ti=3&cost=4&freq=2&effc=5[&k=10]
+POST /api/recommendations        {"answers": {...}, "k": 10}
+POST /api/recommendations/batch  {"profiles": [{...}, ...], "k": 10}
+
+The answers are either a dict keyed by the survey fields (q1-q16 "Yes"/"No",
+ti, cost, freq and effc 1-5) or a list of the 20 values in that order, as
+the survey page posts them. Unanswered questions may be left out (or null),
+the four preferences are required. k limits the ranked actions returned.
+
+A batch of profiles is ranked with one lookup into the precomputed ranking
+table (itself one batched TOPSIS pass over all preference combinations, see
+ranking_table.py) and colored in one vectorized pass.
+
+Every response carries an ETag derived from the inputs, k and the version of
+the decision matrix, TOPSIS settings and action coloring, so clients and
+proxies can cache it; a request with a matching If-None-Match gets a 304
+before anything is ranked. The batch size limit and the Cache-Control max-age
+are read from the API_* variables in .env, see config.py.
+'''
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+class InvalidProfile(ValueError):
+    """The answers of a profile (or the request) cannot be ranked."""
+
+def parse_answers(answers):
+    """Validate the answers of one profile.
+
+    Args:
+        answers (Dict or list): Answers keyed by ANSWER_FIELDS, or the 20
+        values in ANSWER_FIELDS order
+
+    Raises:
+        InvalidProfile: If an answer is invalid or a preference is missing
+
+    Returns:
+        [Dict, tuple]: The survey dict ({'q1': 'Yes', ..., 'ti': 3}) and its
+        encoded answers (see encode_answers), which identify the result
+    """
+    if isinstance(answers, dict):
+        unknown = set(answers) - set(ANSWER_FIELDS)
+        if unknown:
+            raise InvalidProfile(f"Unknown fields: {', '.join(sorted(unknown))}")
+        values = [answers.get(field) for field in ANSWER_FIELDS]
+    elif isinstance(answers, list):
+        values = answers
+    else:
+        raise InvalidProfile("Expected the answers as a dict or a list")
+
+    try:
+        encoded = encode_answers(values)
+    except ValueError as e:
+        raise InvalidProfile(str(e)) from e
+    preferences = encoded[-len(PREFERENCE_FIELDS):]
+    missing = [field for field, level in zip(PREFERENCE_FIELDS, preferences) if level is None]
+    if missing:
+        raise InvalidProfile(f"Missing preferences: {', '.join(missing)}")
+
+    user_response = dict(zip(QUESTION_FIELDS, values))
+    user_response.update(zip(PREFERENCE_FIELDS, preferences))
+    return user_response, encoded
+
+def parse_k(k):
+    """Number of ranked actions to return, None for all."""
+    if k is None:
+        return None
+    value = parse_int(k)
+    if value is None or value < 1:
+        raise InvalidProfile(f"Invalid k: {k!r}")
+    return value
+
+class Recommender:
+    """Ranks and colors answer profiles with the app's current model.
+
+    Args:
+        compiled_model (callable): Returns the app's (matrix version,
+        TopsisModel, RankingTable)
+        action_coloring (callable): Returns the app's ActionColoring
+    """
+
+    def __init__(self, compiled_model, action_coloring):
+        self.compiled_model = compiled_model
+        self.action_coloring = action_coloring
+        # (version, model, table, coloring, position of each model action in the coloring)
+        self._current = None
+
+    def current(self):
+        import numpy as np
+
+        _, model, table = self.compiled_model()
+        coloring = self.action_coloring()
+        current = self._current
+        if current is None or current[1] is not model or current[3] is not coloring:
+            coloring_index = np.array([coloring.code_index.get(action, -1)
+                                       for action in model.actions.tolist()], dtype=np.intp)
+            current = (result_version(model.version, coloring.version), model, table, coloring,
+                       coloring_index)
+            self._current = current
+        return current
+
+    def recommend(self, user_responses, k=None, current=None):
+        """Rank and color the actions for many profiles at once.
+
+        Args:
+            user_responses (list): Survey dicts, see parse_answers
+            k (int, optional): Only return the top-k actions. Defaults to None.
+            current (tuple, optional): Result of current() to rank with
+
+        Returns:
+            list: Colored actions per profile, as ActionColoring.colored
+        """
+        import numpy as np
+
+        _, model, table, coloring, coloring_index = current or self.current()
+        rows = np.array([table.key_index(tuple(response[field] for field in PREFERENCE_FIELDS))
+                         for response in user_responses], dtype=np.intp)
+        order = table.order[rows].astype(np.intp)[:, :k]
+        green = coloring.green(coloring_index[order], coloring.doing_masks(user_responses))
+        codes = model.actions[order].tolist()
+        return [coloring.colored(row_codes, row_green)
+                for row_codes, row_green in zip(codes, green.tolist())]
+
+def etag_for(version, k, encoded_profiles):
+    return hashlib.sha256(json.dumps([version, k, encoded_profiles]).encode()).hexdigest()[:32]
+
+def cached_response(etag, build):
+    """The response with its ETag, or a 304 if the client has it already."""
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(jsonify(build()))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={API_CONFIG['max_age']}"
+    return response
+
+def error(message, status=400):
+    return jsonify({'status': 'error', 'errors': [message]}), status
+
+@api.errorhandler(InvalidProfile)
+def invalid_profile(e):
+    return error(str(e))
+
+@api.route('/recommendations', methods=['GET', 'POST'])
+def recommendations():
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'answers' not in data:
+            raise InvalidProfile("Expected a JSON object with 'answers'")
+        answers, k = data['answers'], data.get('k')
+    else:
+        unknown = set(request.args) - set(ANSWER_FIELDS) - {'k'}
+        if unknown:
+            raise InvalidProfile(f"Unknown fields: {', '.join(sorted(unknown))}")
+        answers = {field: request.args[field] for field in ANSWER_FIELDS if field in request.args}
+        k = request.args.get('k')
+
+    user_response, encoded = parse_answers(answers)
+    k = parse_k(k)
+    recommender = current_app.extensions['recommender']
+    current = recommender.current()
+    version = current[0]
+    return cached_response(etag_for(version, k, [encoded]), lambda: {
+        'status': 'success',
+        'version': version,
+        'actions': recommender.recommend([user_response], k, current)[0],
+    })
+
+@api.route('/recommendations/batch', methods=['POST'])
+def recommendations_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('profiles'), list):
+        raise InvalidProfile("Expected a JSON object with a list of 'profiles'")
+    profiles = data['profiles']
+    if len(profiles) > API_CONFIG['batch_limit']:
+        return error(f"At most {API_CONFIG['batch_limit']} profiles per request, "
+                     f"got {len(profiles)}", 413)
+
+    user_responses, encoded = [], []
+    for i, answers in enumerate(profiles):
+        try:
+            user_response, profile_encoded = parse_answers(answers)
+        except InvalidProfile as e:
+            raise InvalidProfile(f"Profile {i}: {e}") from e
+        user_responses.append(user_response)
+        encoded.append(profile_encoded)
+    k = parse_k(data.get('k'))
+
+    recommender = current_app.extensions['recommender']
+    current = recommender.current()
+    version = current[0]
+    return cached_response(etag_for(version, k, encoded), lambda: {
+        'status': 'success',
+        'version': version,
+        'results': recommender.recommend(user_responses, k, current) if user_responses else [],
+    })
+
+def init_app(app, compiled_model, action_coloring):
+    """Register the API with the app's model and action coloring.
+
+    Args:
+        app (Flask): The app
+        compiled_model (callable): Returns (matrix version, TopsisModel, RankingTable)
+        action_coloring (callable): Returns the ActionColoring
+    """
+    app.extensions['recommender'] = Recommender(compiled_model, action_coloring)
+    app.register_blueprint(api)
@@ -1,59 +1,58 @@
 #Flask: Flask operations
 #render_template: for rendering the html template
-#json: for reading the questions from the json file
 #os: reading the questions.json file
 
 from flask import Flask, render_template, url_for, request, jsonify, session, redirect
-import json
 import os
-import mysql.connector
 from mysql.connector import Error 
-from db import get_connection
-from werkzeug.security import generate_password_hash, check_password_hash
+from db import PoolExhausted
+from repository import get_repository, UsernameTaken, init_app as init_repository
+from passwords import hash_password, verify_password, HashingBusy
+from api import init_app as init_api
+from metrics import timed, init_app as init_metrics
 from dotenv import load_dotenv
-from topsis import *
-import pandas
-import numpy
+from content import get_registry
+from survey_codec import PREFERENCE_FIELDS, ANSWER_FIELDS, encode_answers
+from materialized import RESULT_COLUMNS, result_version, encode_result, decode_result
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+# The ranking path (pandas and numpy via topsis) is imported on first use,
+# so workers boot and serve the static pages without loading it
 
 
 #Opening Flask app names "app"
 app = Flask(__name__)
 load_dotenv()
 app.secret_key = os.getenv("SECRET_KEY")
+# One database connection per request, returned to the pool when it ends
+init_repository(app)
+# Request, ranking stage and database timings at /metrics
+init_metrics(app)
+
+# Build the ranking table at startup instead of on the first results request
+PRELOAD_RANKING = os.getenv("PRELOAD_RANKING", "0").lower() in ("1", "true", "yes")
 
-user_answers_store = None
+# JSON content files are loaded once per process and reloaded only when they change
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+content = get_registry(BASE_DIR)
 
 #Load question the json file
 def load_questions():
-    with open('questions.json', 'r') as file:
-        return json.load(file)
+    return content.questions()
 
 #Load action_reaction questions
 def load_action_data():
-    with open('action_reaction_questions.json', 'r') as file:
-        return json.load(file)
+    return content.action_questions()
 
 #Load action mapping data
 def load_action_mapping():
-    with open('action_mapping.json', 'r') as file:
-        return json.load(file)
+    return content.action_mapping()
 
-# Load challenge questions from separate JSON files
+# Load challenge questions (pages 1-5, missing pages are skipped)
 def load_challenge_questions():
-    challenge_data = []
-    
-    # Load each challenge page from separate JSON files
-    for page_num in range(1, 6):  # Pages 1-5
-        filename = f'challenge_page{page_num}.json'
-        try:
-            with open(filename, 'r') as file:
-                page_data = json.load(file)
-                challenge_data.append(page_data)
-        except FileNotFoundError:
-            print(f"Warning: {filename} not found. Skipping page {page_num}")
-            continue
-    
-    return challenge_data
+    return content.challenge_pages()
 
 #Normalize the ratings for the TOPSIS
 def normalize_ratings(ratings: dict) -> dict:
@@ -62,7 +61,15 @@ def normalize_ratings(ratings: dict) -> dict:
         return {k: 0 for k in ratings}
     return {k: round(v / total, 8) for k, v in ratings.items()}
 
-DBP_ranking_dict = {
+# Reference data shared by all request threads, read-only so no request can
+# change it for the others
+def freeze(settings):
+    """Read-only view of a (nested) settings dict."""
+    if isinstance(settings, Mapping):
+        return MappingProxyType({key: freeze(value) for key, value in settings.items()})
+    return settings
+
+DBP_ranking_dict = MappingProxyType({
         "THM": 1,
         "IDBP": 1,
         "BrDBP": 1,
@@ -80,10 +87,10 @@ DBP_ranking_dict = {
         "VOC": 12,
         "HDBP": 12,
         "AOX": 12
-}
+})
 
     
-action_cat_ranking_dict = {
+action_cat_ranking_dict = MappingProxyType({
         "RW": 1,
         "CA": 1,
         "PN": 1,
@@ -92,51 +99,79 @@ action_cat_ranking_dict = {
         "BL": 1,
         "CK": 1,
         "A_other": 1
-}
+})
 
     
-dec_matrix_settings = {
+dec_matrix_settings = MappingProxyType({
        "input_file": "./input/input_data_topsis_IQR_merge-DBP_all-DBP.xlsx",
         "cost_time_setting": "IQR",
         "collect_DBP": "all-DBP"
-}
-
-
-def topsis(r_dict: dict):
-    weight_settings = {"all_DBP": {"type": 1,"weight": r_dict["effc_w"]},"cost_tier": {"type": 1,"weight": r_dict["cost_w"]},
-                   "time_tier": {"type": 1,"weight": r_dict["time_w"]},"repeat_tier": {"type": 1,"weight": r_dict["freq_w"]}}
-
-    # Load data file
-    input_filename = dec_matrix_settings['input_file']
-
-    input_data_df = pd.read_excel(input_filename,index_col = [0])
-    input_data_df = input_data_df.drop(columns=["all_Other"], errors="ignore")
-        
-    #logging.info(f"Starting TOPSIS run: {"expert-weights"}")
-        
-    # Check the data for zero columns (i.e., all entries zero)
-    input_data_df = check_data(input_data_df, map_acronyms = False)
-        
-    # Set DBP weight distributions
-    weight_settings = distribute_DBP_weights(input_data_df, weight_settings, 
-                                                DBP_ranking_dict, 
-                                                 DBP_merged = True)
-        
-        # Check settings for criteria
-    input_data_df, crit_type_dict = check_criteria(input_data_df, 
-                                                       weight_settings, 
-                                                       action_cat_ranking_dict)
-    for col in input_data_df.columns:
-        if col not in weight_settings:
-            logging.warning(f"⚠️ Column '{col}' not found in weight settings!")
-
-
-        # Check settings for weights and retrieve direct weights dictionary
-    weight_dict = check_weights(weight_settings)
-        
-        # Do TOPSIS
-    out_df = do_TOPSIS(input_data_df, weight_dict, crit_type_dict)
-    return out_df['Score']
+})
+
+# Decision matrix is loaded once per process and reloaded only when the file changes
+matrix_store = None
+
+def get_matrix_store():
+    """Return the decision matrix store, loading the matrix on first use."""
+    global matrix_store
+    if matrix_store is None:
+        from decision_matrix import get_store
+        matrix_store = get_store(os.path.join(BASE_DIR, dec_matrix_settings['input_file']))
+    return matrix_store
+
+# Top-level TOPSIS criteria and the normalized rating that sets their weight
+RATING_CRITERIA = MappingProxyType({
+        "all_DBP": "effc_w",
+        "cost_tier": "cost_w",
+        "time_tier": "time_w",
+        "repeat_tier": "freq_w"
+})
+
+# Settings the TOPSIS model is compiled from (same schema as input/*_settings.json).
+# The weights are only defaults, each survey is ranked with its own weights.
+model_settings = freeze({
+        "settings_name": "action-reaction",
+        "DBP-merged": True,
+        "dec_matrix_settings": dec_matrix_settings,
+        "DBP_ranking": DBP_ranking_dict,
+        "action_category_ranking": action_cat_ranking_dict,
+        "weight_settings": {criterion: {"type": 1, "weight": 0.25} for criterion in RATING_CRITERIA}
+})
+
+# (decision matrix version, TopsisModel, RankingTable)
+compiled_model = None
+compiled_model_lock = threading.Lock()
+
+def get_compiled_model():
+    """Return the compiled TOPSIS model and its ranking table, recompiling both
+    when the decision matrix has changed since they were built."""
+    global compiled_model
+    input_data_df, matrix_version = get_matrix_store().get_versioned()
+    if compiled_model is None or compiled_model[0] != matrix_version:
+        with compiled_model_lock:
+            if compiled_model is None or compiled_model[0] != matrix_version:
+                from topsis import TopsisModel
+                from ranking_table import build_ranking_table
+                with timed('compile_model'):
+                    model = TopsisModel(model_settings, input_data_df, matrix_version)
+                with timed('ranking_table'):
+                    table = build_ranking_table(model, preference_weights)
+                compiled_model = (matrix_version, model, table)
+    return compiled_model
+
+def get_topsis_model():
+    return get_compiled_model()[1]
+
+def get_ranking_table():
+    return get_compiled_model()[2]
+
+def preference_weights(answers):
+    """Turn a preference answer tuple (ti, cost, freq, effc) into the top-level
+    TOPSIS weights, in RATING_CRITERIA order, the same way the results pages do."""
+    user_response = dict(zip(PREFERENCE_FIELDS, answers))
+    pref_dict = {k: v for d in extract_additional_info(user_response) for k, v in d.items()}
+    r_dict = normalize_ratings(pref_dict)
+    return [r_dict[rating] for rating in RATING_CRITERIA.values()]
 
 # Index route of the app
 @app.route('/')
@@ -203,28 +238,30 @@ def login():
                 'errors': errors
             })
         
-        # Check user credentials
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        
+        # Check user credentials, the user's most recent survey comes with the same query
         try:
-            cursor.execute("SELECT id, username, password_hash FROM users WHERE username = %s", (username,))
-            user = cursor.fetchone()
+            repository = get_repository()
+            user = repository.find_login(username)
+            # Do not hold the database connection while the password is checked
+            repository.close()
+            # Checked in the password hashing pool, a 503 when it is saturated
+            valid, new_hash = verify_password(user['password_hash'], password) if user else (False, None)
             
-            if user and check_password_hash(user['password_hash'], password):
+            if valid:
+                if new_hash:
+                    # Stored hash was made with other parameters, upgrade it
+                    try:
+                        repository.update_password_hash(user['id'], new_hash)
+                    except Error as e:
+                        repository.rollback()
+                        app.logger.warning(f"Could not rehash the password of {username}: {e}")
+                
                 # Login successful
                 session['user_id'] = user['id']
                 session['username'] = user['username']
                 
-                # Get user's most recent survey
-                cursor.execute(
-                    "SELECT id FROM answers WHERE user_id = %s ORDER BY answered_at DESC LIMIT 1",
-                    (user['id'],)
-                )
-                recent_survey = cursor.fetchone()
-                
-                if recent_survey:
-                    session['response_id'] = recent_survey['id']
+                if user['recent_survey_id']:
+                    session['response_id'] = user['recent_survey_id']
                     redirect_url = url_for('action_reaction_results')
                 else:
                     redirect_url = url_for('my_surveys')
@@ -247,9 +284,6 @@ def login():
                 'status': 'error',
                 'errors': ['Database error occurred. Please try again.']
             })
-        finally:
-            cursor.close()
-            conn.close()
     
     return render_template('login.html')
 
@@ -295,63 +329,21 @@ def register():
         if password != confirm_password:
             errors.append("Passwords do not match")
         
-        # Check if username already exists
-        if not errors:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            try:
-                cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-                existing_user = cursor.fetchone()
-                
-                if existing_user:
-                    errors.append("Username already exists. Please choose a different one.")
-                
-            except Error as e:
-                app.logger.error(f"Database error checking username: {e}")
-                errors.append("Database error occurred. Please try again.")
-            finally:
-                cursor.close()
-                conn.close()
-        
         if errors:
             return jsonify({
                 'status': 'error',
                 'errors': errors
             })
         
-        # Create user account and link survey answers
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        
+        # Create user account and link survey answers, in one transaction
         try:
             # Hash the password
-            password_hash = generate_password_hash(password)
-            
-            # Insert new user
-            cursor.execute(
-                "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
-                (username, password_hash)
-            )
-            conn.commit()
+            password_hash = hash_password(password)
             
-            user_id = cursor.lastrowid
-            
-            # insert the survey answers with the user_id
-            cols = "user_id, " + ", ".join(
-                [f"q{i}" for i in range(1, 17)]
-                + ["ti", "cost", "freq", "effc"]
-            )
-            placeholders = ", ".join(["%s"] * 21)  # 21 values including user_id
-            sql = f"INSERT INTO answers ({cols}) VALUES ({placeholders})"
-            
-            # Prepare values with user_id at the beginning
-            answer_values = [user_id] + pending_answers
-            
-            cursor.execute(sql, answer_values)
-            conn.commit()
-            
-            response_id = cursor.lastrowid
+            # The UNIQUE username rejects a taken username, no need to check first
+            user_id, response_id = get_repository().create_user_with_survey(
+                username, password_hash, encode_answers(pending_answers), 
+                stored_result_values(pending_answers))
             
             # Store user info and response ID in session
             session['user_id'] = user_id
@@ -368,58 +360,48 @@ def register():
                 'redirect_url': url_for('action_reaction_results')
             })
             
+        except UsernameTaken:
+            return jsonify({
+                'status': 'error',
+                'errors': ["Username already exists. Please choose a different one."]
+            })
         except Error as e:
-            conn.rollback()
             app.logger.error(f"Database error creating user and linking answers: {e}")
             return jsonify({
                 'status': 'error',
                 'errors': ['Failed to create account and save survey data. Please try again.']
             })
-        finally:
-            cursor.close()
-            conn.close()
     
     return render_template('register.html')
 
 # action_reaction
 @app.route('/action_reaction', methods=['GET', 'POST'])
 def action_reaction():
-    global user_answers_store
     if request.method == 'POST':
         data = request.get_json()
-        user_answers_store = data['answers']
         
         try:
-            selected_values = [item['selected'] for item in user_answers_store]
+            # Answers of this request only, kept in the session until registration
+            selected_values = [item['selected'] for item in data['answers']]
         except (KeyError, TypeError):
             raise ValueError("Expected a list of dicts each with a 'selected' key")
         
         if len(selected_values) != 20:
             raise ValueError(f"Expected 18 answers, got {len(selected_values)}")
+        # Validates the answers and packs them into the compact answer columns
+        answer_columns = encode_answers(selected_values)
         # Check if user is already logged in
         user_id = session.get('user_id')
         
         if user_id:
             # User is already logged in, save survey directly to their account
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
+            repository = get_repository()
             
             try:
-                # Insert the survey answers with the existing user_id
-                cols = "user_id, " + ", ".join(
-                    [f"q{i}" for i in range(1, 17)]
-                    + ["ti", "cost", "freq", "effc"]
-                )
-                placeholders = ", ".join(["%s"] * 21)
-                sql = f"INSERT INTO answers ({cols}) VALUES ({placeholders})"
-                
-                # Prepare values with user_id at the beginning
-                answer_values = [user_id] + selected_values
-                
-                cursor.execute(sql, answer_values)
-                conn.commit()
-                
-                response_id = cursor.lastrowid
+                # Insert the survey answers and their result with the existing user_id
+                response_id = repository.add_survey(user_id, answer_columns, 
+                                                    stored_result_values(selected_values))
+                repository.commit()
                 
                 # Update session with new response ID
                 session['response_id'] = response_id
@@ -432,15 +414,12 @@ def action_reaction():
                 })
                 
             except Error as e:
-                conn.rollback()
+                repository.rollback()
                 app.logger.error(f"Database error saving survey for existing user: {e}")
                 return jsonify({
                     'status': 'error',
                     'message': 'Failed to save survey data. Please try again.'
                 })
-            finally:
-                cursor.close()
-                conn.close()
         else:
             # User is not logged in, store answers temporarily and redirect to registration
             session['pending_survey_answers'] = selected_values
@@ -453,64 +432,6 @@ def action_reaction():
     action_data = load_action_data()
     return render_template('action_reaction.html', action_data=action_data)
 
-def map_codes_to_colored_actions(codes_series, user_response):
-    """
-    Map codes from series to colored actions based on user responses
-    """
-    # Load required data
-    action_mapping = load_action_mapping()
-    action_questions = load_action_data()
-    
-    # Create a mapping from code to action details
-    code_to_action = {item['code']: item for item in action_mapping}
-    
-    #print(user_response['q2'])
-    # Get all numbers that should be green (user answered "Yes")
-    green_numbers = set()
-    
-    # Process first 16 questions (the ones with relations)
-    for i in range(16):  # Questions 1-16 have relations
-        question_key = f"q{i+1}"
-        if question_key in user_response and user_response[question_key] == "Yes":
-            # Find the corresponding question in action_questions
-            question_data = next((q for q in action_questions if q['id'] == i+1), None)
-            #print(question_data)
-            if question_data and 'relation' in question_data:
-                #print(question_data['relation'])
-                green_numbers.update(question_data['relation'])
-    #print(green_numbers)
-    # Map codes to colored actions
-    colored_actions = []
-    
-    # Convert series to list if it's a pandas Series
-    if hasattr(codes_series, 'tolist'):
-        codes_list = codes_series.tolist()
-    else:
-        codes_list = list(codes_series)
-    
-    for code in codes_list:
-        if code in code_to_action:
-            action_info = code_to_action[code]
-            action_number = action_info['number']
-            color = 'green' if action_number in green_numbers else 'red'
-            
-            colored_actions.append({
-                'code': code,
-                'action': action_info['action'],
-                'number': action_number,
-                'color': color
-            })
-        else:
-            # Handle case where code is not found in mapping
-            colored_actions.append({
-                'code': code,
-                'action': f"Unknown action for code: {code}",
-                'number': 0,
-                'color': 'red'
-            })
-    
-    return colored_actions
-
 # action-reaction-results
 @app.route('/action-reaction-results')
 def action_reaction_results():
@@ -523,94 +444,118 @@ def action_reaction_results():
         return redirect(url_for('action_reaction'))
     
     # Fetch the user's responses from database with user verification
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-
     try:
         # Get the user's responses - verify it belongs to the logged-in user
-        sql = "SELECT * FROM answers WHERE id = %s AND user_id = %s"
-        cursor.execute(sql, (response_id, user_id))
-        user_response = cursor.fetchone()
+        user_response = get_repository().get_survey(response_id, user_id)
         
         if not user_response:
             app.logger.warning(f"No response found for response_id {response_id} and user_id {user_id}")
             return redirect(url_for('action_reaction'))
         
         # Extract only the additional information (ti, cost, freq, effc)
-        additional_info = extract_additional_info(user_response)
         additional_info_disp = extract_additional_info_disp(user_response)
-        data_series = get_user_data_series(user_response, additional_info)
-        
 
-        # Map codes to colored actions based on user responses
-        colored_actions = map_codes_to_colored_actions(data_series, user_response)
-        # Convert Series to DataFrame for HTML display
-        # df_html = convert_series_to_html(data_series)
-
-        # Get user information
-        cursor.execute("SELECT username, created_at FROM users WHERE id = %s", (user_id,))
-        user_info = cursor.fetchone()
+        # Ranked codes and colored actions, stored with the survey
+        data_series, colored_actions = get_survey_result(user_response)
         
-    except Exception as e:
+    except (Error, LookupError, TypeError, ValueError) as e:
         app.logger.error(f"Error in action_reaction_results: {e}")
         return redirect(url_for('login'))
-    finally:
-        cursor.close()
-        conn.close()
     
     return render_template('action_reaction_results.html', 
                          response_id=response_id,
                          username=username,
-                         user_info=user_info,
                          additional_info=additional_info_disp,
                          colored_actions = colored_actions,
                          data_series = data_series)
 
-def get_user_data_series(user_response, additional_info):
-    pref_dict = {k: v for d in additional_info for k, v in d.items()}
+@timed('rank_survey')
+def rank_survey(user_response, compiled=None):
+    """Rank the actions for the preferences of a survey.
+
+    Args:
+        user_response (Dict): Survey answers
+        compiled (tuple, optional): Result of get_compiled_model() to rank with
+
+    Returns:
+        ndarray: Indices into the model's actions, from best to worst
+    """
+    _, model, table = compiled or get_compiled_model()
+
+    # Precomputed ranking for the user's preference answers
+    index = table.key_index(tuple(user_response.get(field) for field in PREFERENCE_FIELDS))
+    if index is not None:
+        return table.order[index]
+
+    # Fall back to live computation for combinations outside the table
+    pref_dict = {k: v for d in extract_additional_info(user_response) for k, v in d.items()}
     rating_norm = normalize_ratings(pref_dict)
-    s = topsis(rating_norm)
-    s.name = "Recommended Actions"
-    return s
+    return model.rank_indices({criterion: rating_norm[rating] 
+                               for criterion, rating in RATING_CRITERIA.items()})
+
+def compute_survey_result(user_response):
+    """Rank and color the actions of a survey with the current model.
 
-def convert_series_to_html(data_series):
-    """Convert pandas Series to HTML table format"""
+    Returns:
+        [str, ndarray, list]: Result version, ranked action indices and the
+        colored actions
+    """
+    compiled = get_compiled_model()
+    model = compiled[1]
+    coloring = content.action_coloring()
+    order = rank_survey(user_response, compiled)
+    with timed('color_actions'):
+        colored_actions = coloring.color(model.actions[order].tolist(), user_response)
+    return result_version(model.version, coloring.version), order, colored_actions
+
+def stored_result_values(selected_values):
+    """Values of RESULT_COLUMNS for a new survey.
+
+    Args:
+        selected_values (list): The submitted answers in ANSWER_FIELDS order
+
+    Returns:
+        list: Encoded ranking, colors and version, or NULLs if the result could
+        not be computed (it is then computed when the survey is first viewed)
+    """
     try:
-        # Convert Series to DataFrame
-        if isinstance(data_series, pd.Series):
-            # Create DataFrame from Series
-            df = data_series.to_frame()
-            
-            # If the series doesn't have a name, give it one
-            if df.columns[0] == 0:  # Default numeric column name
-                df.columns = ['Recommended Actions']
-            
-            app.logger.info(f"Converted Series to DataFrame with shape: {df.shape}")
-            
-        elif isinstance(data_series, pd.DataFrame):
-            df = data_series
-            app.logger.info(f"Already a DataFrame with shape: {df.shape}")
-            
-        else:
-            # Fallback: create DataFrame from list or other data
-            df = pd.DataFrame({'Recommended Actions': data_series})
-            app.logger.info(f"Created DataFrame from other data type: {type(data_series)}")
-        
-        # Convert to HTML
-        html_table = df.to_html(
-            classes='dataframe-table', 
-            index=False, 
-            border=0, 
-            escape=False,
-            table_id='results-table'
-        )
-        
-        return html_table
-        
+        version, order, colored_actions = compute_survey_result(dict(zip(ANSWER_FIELDS, selected_values)))
     except Exception as e:
-        app.logger.error(f"Error converting data to HTML: {e}")
-        return "<p>Error: Unable to display results</p>"
+        app.logger.warning(f"Could not compute the survey result at insert: {e}")
+        return [None] * len(RESULT_COLUMNS)
+    return [*encode_result([action['code'] for action in colored_actions],
+                           [action['color'] == 'green' for action in colored_actions]), version]
+
+def get_survey_result(user_response):
+    """Return the ranked action codes and colored actions of a stored survey.
+
+    The result stored with the survey is used when its version is current.
+    Otherwise it is recomputed and written back to the row.
+
+    Args:
+        user_response (Dict): Decoded answers row, including RESULT_COLUMNS
+
+    Returns:
+        [list, list]: Ranked action codes and the colored actions
+    """
+    model = get_topsis_model()
+    coloring = content.action_coloring()
+    if user_response.get('ranking_version') == result_version(model.version, coloring.version):
+        codes, green = decode_result(user_response['ranking'], user_response['colors'])
+        if codes is not None:
+            with timed('color_actions'):
+                return codes, coloring.colored(codes, green)
+
+    version, _, colored_actions = compute_survey_result(user_response)
+    codes = [action['code'] for action in colored_actions]
+    ranking, colors = encode_result(codes, [action['color'] == 'green' for action in colored_actions])
+    repository = get_repository()
+    try:
+        repository.store_result(user_response['id'], ranking, colors, version)
+    except Error as e:
+        repository.rollback()
+        app.logger.warning(f"Could not store the result of survey {user_response['id']}: {e}")
+    return codes, colored_actions
 
 #Extract preferences data for diplaying in the html
 def extract_additional_info_disp(user_response):
@@ -665,26 +610,13 @@ def my_surveys():
     if not user_id:
         return redirect(url_for('action_reaction'))
     
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
     try:
         # Get all surveys for this user
-        sql = """
-        SELECT id, answered_at
-        FROM answers 
-        WHERE user_id = %s 
-        ORDER BY answered_at DESC
-        """
-        cursor.execute(sql, (user_id,))
-        surveys = cursor.fetchall()
+        surveys = get_repository().list_surveys(user_id)
         
     except Error as e:
         app.logger.error(f"Database error fetching user surveys: {e}")
         surveys = []
-    finally:
-        cursor.close()
-        conn.close()
     
     return render_template('my_surveys.html', surveys=surveys, username=username)
 
@@ -697,39 +629,25 @@ def view_survey_result(survey_id):
     if not user_id:
         return redirect(url_for('login'))
     
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
     try:
         # Get the specific survey - verify it belongs to the logged-in user
-        sql = "SELECT * FROM answers WHERE id = %s AND user_id = %s"
-        cursor.execute(sql, (survey_id, user_id))
-        user_response = cursor.fetchone()
+        user_response = get_repository().get_survey(survey_id, user_id)
         
         if not user_response:
             return redirect(url_for('my_surveys'))
         
         # Extract only the additional information (ti, cost, freq, effc)
-        additional_info = extract_additional_info(user_response)
         additional_info_disp = extract_additional_info_disp(user_response)
-        #df = topsis(r_dict)
-        data_series = get_user_data_series(user_response, additional_info)
-        
 
-        # Map codes to colored actions based on user responses
-        colored_actions = map_codes_to_colored_actions(data_series, user_response)
-        # Convert Series to HTML
-        # df_html = convert_series_to_html(data_series)
+        # Ranked codes and colored actions, stored with the survey
+        data_series, colored_actions = get_survey_result(user_response)
         
         # Set this response as the current one in session for navigation
         session['response_id'] = survey_id
         
-    except Exception as e:
+    except (Error, LookupError, TypeError, ValueError) as e:
         app.logger.error(f"Error in view_survey_result: {e}")
         return redirect(url_for('my_surveys'))
-    finally:
-        cursor.close()
-        conn.close()
     
     return render_template('action_reaction_results.html', 
                          response_id=survey_id,
@@ -740,6 +658,17 @@ def view_survey_result(survey_id):
                          from_history=True) 
 
 
+# All database connections of this worker stayed in use for DB_POOL_TIMEOUT,
+# or too many password hashes are pending
+@app.errorhandler(PoolExhausted)
+@app.errorhandler(HashingBusy)
+def server_busy(e):
+    app.logger.warning(f"Server busy: {e}")
+    return jsonify({
+        'status': 'error',
+        'errors': ['The server is busy. Please try again.']
+    }), 503, {'Retry-After': '1'}
+
 # Logout route
 @app.route('/logout')
 def logout():
@@ -757,6 +686,12 @@ def challenge():
     challenge_data = load_challenge_questions()
     return render_template('challenge.html', challenge_data=challenge_data)
 
+# Stateless JSON recommendations for the kiosk app, ranked with the same model
+init_api(app, get_compiled_model, content.action_coloring)
+
+# Warm-up: precompute the rankings for all preference combinations at startup
+if PRELOAD_RANKING:
+    get_ranking_table()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, ANSWER_FIELDS, YES, NO, \
+    SELECT_COLUMNS, encode_answers, decode_answers
+
+'''
+Benchmark of the survey history queries on the old and the compact answers
+schema, with SQLite as a local stand-in for MySQL, i.e.,
+
+python benchmarks/bench_history.py --rows 10000000 --users 500000
+
+Every schema variant is filled with the same synthetic surveys (appended in
+time order, users drawn uniformly) and the queries of the app are timed for
+random users:
+
+- latest:  the newest survey of a user (/login)
+- history: all surveys of a user, newest first (/my-surveys)
+- result:  one survey by id and user, decoded into the survey dict (results pages)
+
+Variants:
+
+- legacy_noindex: VARCHAR schema without any secondary index
+- legacy:         VARCHAR schema with an index on user_id, which InnoDB creates
+                  for the foreign key
+- compact:        bitfield/TINYINT schema with the (user_id, answered_at) index
+
+The database files are kept with --keep, and reused when they already exist.
+'''
+
+LEGACY_COLUMNS = ("id INTEGER PRIMARY KEY, user_id INTEGER, "
+                  + ", ".join(f"{field} VARCHAR(20)" for field in ANSWER_FIELDS)
+                  + ", answered_at INTEGER NOT NULL")
+COMPACT_COLUMNS = ("id INTEGER PRIMARY KEY, user_id INTEGER, yes_answers SMALLINT NOT NULL, "
+                   "answered_mask SMALLINT NOT NULL, "
+                   + ", ".join(f"{field} TINYINT" for field in PREFERENCE_FIELDS)
+                   + ", answered_at INTEGER NOT NULL")
+
+VARIANTS = {
+    'legacy_noindex': (LEGACY_COLUMNS, None),
+    'legacy': (LEGACY_COLUMNS, "CREATE INDEX idx_answers_user ON answers (user_id)"),
+    'compact': (COMPACT_COLUMNS,
+                "CREATE INDEX idx_answers_user_answered ON answers (user_id, answered_at)"),
+}
+
+QUERIES = {
+    'latest': "SELECT id FROM answers WHERE user_id = ? ORDER BY answered_at DESC LIMIT 1",
+    'history': "SELECT id, answered_at FROM answers WHERE user_id = ? ORDER BY answered_at DESC",
+}
+
+def synthetic_surveys(n_rows, n_users, seed):
+    """Generate (id, user_id, answers, answered_at) in time order."""
+    rng = random.Random(seed)
+    answered_at = 1700000000
+    for row_id in range(1, n_rows + 1):
+        answered_at += rng.randint(0, 5)
+        answers = [rng.choice((YES, NO)) for _ in QUESTION_FIELDS] \
+            + [str(rng.randint(1, 5)) for _ in PREFERENCE_FIELDS]
+        yield row_id, rng.randint(1, n_users), answers, answered_at
+
+def build(filename, variant, n_rows, n_users, seed, batch_size=100000):
+    """Create and fill one schema variant."""
+    columns, index_sql = VARIANTS[variant]
+    conn = sqlite3.connect(filename)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(f"CREATE TABLE answers ({columns})")
+
+    if variant == 'compact':
+        rows = ((row_id, user_id, *encode_answers(answers), answered_at)
+                for row_id, user_id, answers, answered_at in synthetic_surveys(n_rows, n_users, seed))
+        n_values = 5 + len(PREFERENCE_FIELDS)
+    else:
+        rows = ((row_id, user_id, *answers, answered_at)
+                for row_id, user_id, answers, answered_at in synthetic_surveys(n_rows, n_users, seed))
+        n_values = 3 + len(ANSWER_FIELDS)
+    sql = f"INSERT INTO answers VALUES ({', '.join(['?'] * n_values)})"
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            conn.executemany(sql, batch)
+            batch.clear()
+    conn.executemany(sql, batch)
+    if index_sql:
+        conn.execute(index_sql)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def time_queries(conn, variant, user_ids, row_ids):
+    """Time the history queries.
+
+    Returns:
+        Dict: {query: latencies in ms}
+    """
+    latencies = {name: [] for name in ('latest', 'history', 'result')}
+    conn.row_factory = sqlite3.Row
+    if variant == 'compact':
+        result_sql = f"SELECT {SELECT_COLUMNS} FROM answers WHERE id = ? AND user_id = ?"
+    else:
+        result_sql = "SELECT * FROM answers WHERE id = ? AND user_id = ?"
+
+    for user_id, (row_id, row_user_id) in zip(user_ids, row_ids):
+        for name, sql in QUERIES.items():
+            start = time.perf_counter()
+            conn.execute(sql, (user_id,)).fetchall()
+            latencies[name].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        row = conn.execute(result_sql, (row_id, row_user_id)).fetchone()
+        user_response = dict(row)
+        if variant == 'compact':
+            user_response = decode_answers(user_response)
+        assert user_response['q1'] in (YES, NO)
+        latencies['result'].append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 \
+        else values[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the survey history queries "
+                                     "on the old and the compact answers schema.")
+    parser.add_argument('--rows', type=int, default=10000000,
+                        help="Number of surveys. Defaults to 10000000")
+    parser.add_argument('--users', type=int,
+                        help="Number of users. Defaults to rows / 20")
+    parser.add_argument('--queries', type=int, default=2000,
+                        help="Number of users queried per variant. Defaults to 2000")
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS),
+                        help="Schema variants to benchmark. Defaults to all")
+    parser.add_argument('--dir', help="Directory of the database files. Defaults to a "
+                        "temporary directory")
+    parser.add_argument('--keep', action='store_true', help="Keep the database files")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed. Defaults to 0")
+    parser.add_argument('--json', help="Save the results to this JSON file")
+    args = parser.parse_args()
+    n_users = args.users or max(1, args.rows // 20)
+
+    db_dir = args.dir or tempfile.mkdtemp(prefix="bench_history_")
+    os.makedirs(db_dir, exist_ok=True)
+    rng = random.Random(args.seed + 1)
+    user_ids = [rng.randint(1, n_users) for _ in range(args.queries)]
+    survey_ids = [rng.randint(1, args.rows) for _ in range(args.queries)]
+
+    results = {'rows': args.rows, 'users': n_users, 'variants': {}}
+    for variant in args.variants:
+        filename = os.path.join(db_dir, f"answers_{variant}_{args.rows}_{n_users}.sqlite")
+        build_s = None
+        if not os.path.exists(filename):
+            start = time.perf_counter()
+            build(filename, variant, args.rows, n_users, args.seed)
+            build_s = time.perf_counter() - start
+
+        conn = sqlite3.connect(filename)
+        row_ids = [conn.execute("SELECT id, user_id FROM answers WHERE id = ?",
+                                (survey_id,)).fetchone() for survey_id in survey_ids]
+        # Without an index every query is a full scan, so only a few are run
+        n_queries = args.queries if VARIANTS[variant][1] else max(5, args.queries // 200)
+        latencies = time_queries(conn, variant, user_ids[:n_queries], row_ids[:n_queries])
+        conn.close()
+
+        summary = {name: {'p50_ms': percentile(values, 50), 'p95_ms': percentile(values, 95),
+                          'p99_ms': percentile(values, 99), 'n': len(values)}
+                   for name, values in latencies.items()}
+        results['variants'][variant] = {'file_mb': os.path.getsize(filename) / 2**20,
+                                        'build_s': build_s, 'queries': summary}
+
+        built = f", built in {build_s:.0f} s" if build_s is not None else ""
+        print(f"\n{variant} ({os.path.getsize(filename) / 2**20:.0f} MB{built})")
+        for name, stats in summary.items():
+            print(f"  {name:<8} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+                  f"p99 {stats['p99_ms']:8.3f} ms  (n={stats['n']})")
+
+        if not args.keep and not args.dir:
+            os.remove(filename)
+
+    if not args.keep and not args.dir:
+        os.rmdir(db_dir)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+import subprocess
+import http.client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''
+Benchmark of login throughput against the latency of the static pages while
+the logins run, with the password hashes computed inline in the request
+threads and in the bounded process pool of passwords.py, i.e.,
+
+python benchmarks/bench_password_hashing.py --logins 16 --duration 10
+
+For every mode the app is served by a threaded werkzeug server in its own
+process, on a SQLite stand-in database (standin_db.py) seeded with users. The
+benchmark then runs `--logins` client threads that log in back to back, and
+one thread requesting a static page every `--static-interval` seconds. A
+login answered with 503 is retried after its Retry-After. It reports the
+logins per second (and 503s) and the static page latency percentiles, next to
+the static page latency without load.
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_PAGE = "/dashboard"
+
+def serve(args):
+    """Serve the app on the stand-in database (runs in the server process)."""
+    import signal
+    import logging
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.disable(logging.WARNING)
+    import app
+    import passwords
+    from standin_db import StandinDatabase
+
+    app.app.secret_key = app.app.secret_key or "bench"
+    StandinDatabase(args.db).install(size=args.pool_size)
+    passwords.hasher = passwords.PasswordHasher(args.method, args.hash_workers, args.queue_depth)
+    if args.hash_workers:
+        # Start the workers before the clients do
+        passwords.hasher.hash("warm-up")
+
+    # Exit cleanly on terminate(), so the password hash workers exit with the server
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = make_server("127.0.0.1", args.port, app.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+def request(port, method, path, body=None):
+    """One request on a new connection.
+
+    Returns:
+        [int, float, str]: Status, latency in ms and the Retry-After header
+    """
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                 headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    latency = (time.perf_counter() - start) * 1000
+    return response.status, latency, response.getheader("Retry-After")
+
+def percentiles(values):
+    if len(values) < 2:
+        return {'p50_ms': values[0] if values else None, 'p95_ms': None, 'p99_ms': None,
+                'max_ms': values[0] if values else None, 'n': len(values)}
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50_ms': q[49], 'p95_ms': q[94], 'p99_ms': q[98], 'max_ms': max(values),
+            'n': len(values)}
+
+def run_mode(args, db_file, usernames, hash_workers):
+    """Start a server and run the load against it."""
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--db", db_file, "--port", "0",
+         "--method", args.method, "--hash-workers", str(hash_workers),
+         "--queue-depth", str(args.queue_depth), "--pool-size", str(args.pool_size)],
+        cwd=APP_DIR, stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(server.stdout.readline())
+        for _ in range(20):
+            request(port, "GET", STATIC_PAGE)
+        idle = [request(port, "GET", STATIC_PAGE)[1] for _ in range(args.static_samples)]
+
+        stop = threading.Event()
+        logins = {'ok': 0, 'busy': 0, 'failed': 0, 'latencies': []}
+        static = []
+        lock = threading.Lock()
+
+        def login_client(offset):
+            i = offset
+            while not stop.is_set():
+                body = {"username": usernames[i % len(usernames)], "password": "secret123"}
+                status, latency, retry_after = request(port, "POST", "/login", body)
+                with lock:
+                    if status == 200:
+                        logins['ok'] += 1
+                        logins['latencies'].append(latency)
+                    elif status == 503:
+                        logins['busy'] += 1
+                    else:
+                        logins['failed'] += 1
+                if status == 503:
+                    # As a client would, wait before trying again
+                    stop.wait(float(retry_after or 1))
+                i += args.logins
+
+        def static_client():
+            while not stop.is_set():
+                static.append(request(port, "GET", STATIC_PAGE)[1])
+                stop.wait(args.static_interval)
+
+        threads = [threading.Thread(target=login_client, args=(i,)) for i in range(args.logins)]
+        threads.append(threading.Thread(target=static_client))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {'hash_workers': hash_workers,
+            'logins_per_second': logins['ok'] / elapsed,
+            'logins_ok': logins['ok'], 'logins_503': logins['busy'],
+            'logins_failed': logins['failed'],
+            'login_latency': percentiles(logins['latencies']),
+            'static_idle': percentiles(idle),
+            'static_under_load': percentiles(static)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login throughput against static "
+                                     "page latency, with inline and pooled password hashing.")
+    parser.add_argument('--logins', type=int, default=16,
+                        help="Concurrent login clients. Defaults to 16")
+    parser.add_argument('--duration', type=float, default=10,
+                        help="Seconds of load per mode. Defaults to 10")
+    parser.add_argument('--method', default='scrypt',
+                        help="Password hash method. Defaults to scrypt")
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1,
+                        help="Hash worker processes of the pooled mode. Defaults to the CPU count")
+    parser.add_argument('--queue-depth', type=int, default=8,
+                        help="Hashes that may wait for a worker. Defaults to 8")
+    parser.add_argument('--pool-size', type=int, default=8,
+                        help="Database connections of the server. Defaults to 8")
+    parser.add_argument('--static-interval', type=float, default=0.05,
+                        help="Seconds between static page requests. Defaults to 0.05")
+    parser.add_argument('--static-samples', type=int, default=100,
+                        help="Static page requests without load. Defaults to 100")
+    parser.add_argument('--users', type=int, default=200, help="Seeded users. Defaults to 200")
+    parser.add_argument('--json', help="Save the results to this JSON file")
+    # Internal: run the server of one mode
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    from standin_db import StandinDatabase
+
+    standin = StandinDatabase()
+    try:
+        usernames, _ = standin.seed(args.users, password_method=args.method)
+        results = {'method': args.method, 'logins': args.logins, 'duration_s': args.duration,
+                   'cpus': os.cpu_count(), 'modes': {}}
+        for mode, hash_workers in (('inline', 0), ('pool', args.hash_workers)):
+            results['modes'][mode] = run_mode(args, standin.filename, usernames, hash_workers)
+    finally:
+        standin.remove()
+
+    print(f"\n{args.logins} login clients for {args.duration:g} s, {args.method}, "
+          f"{os.cpu_count()} CPU(s)")
+    for mode, result in results['modes'].items():
+        idle, loaded = result['static_idle'], result['static_under_load']
+        print(f"\n{mode} ({result['hash_workers']} hash workers)")
+        print(f"  logins      {result['logins_per_second']:7.1f}/s  ok {result['logins_ok']}  "
+              f"503 {result['logins_503']}  failed {result['logins_failed']}  "
+              f"p50 {result['login_latency']['p50_ms'] or 0:.0f} ms")
+        print(f"  {STATIC_PAGE:<11} idle p50 {idle['p50_ms']:.1f} ms  under load p50 "
+              f"{loaded['p50_ms']:.1f} ms  p95 {loaded['p95_ms']:.1f} ms  "
+              f"p99 {loaded['p99_ms']:.1f} ms  max {loaded['max_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+'''
+Cold-start benchmark of the Flask app.
+
+Imports the app in fresh interpreters with `python -X importtime` and reports
+the wall time of `import app` and the import time per module (median over the
+runs). A separate probe serves the static pages through the Flask test client,
+checks that none of the heavy modules of the ranking path have been imported
+by then, and times the first ranking, i.e.,
+
+python benchmarks/bench_startup.py -n 10 --top 25 --json startup.json
+
+No database is needed, the connection pool is only created on the first query.
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded to serve the static pages
+HEAVY_MODULES = ("pandas", "numpy", "scipy", "pycountry", "topsis", "acronym_dictionary")
+
+STATIC_PAGES = ("/", "/dashboard", "/house_health")
+
+PROBE = '''
+import sys, json, time
+start = time.perf_counter()
+import app
+import_s = time.perf_counter() - start
+
+client = app.app.test_client()
+status = {page: client.get(page).status_code for page in %(pages)r}
+loaded = [m for m in %(heavy)r if m in sys.modules]
+
+start = time.perf_counter()
+answers = {"ti": "3", "cost": "3", "freq": "3", "effc": "3"}
+app.rank_survey(answers)
+first_ranking_s = time.perf_counter() - start
+
+print(json.dumps({"import_s": import_s, "status": status, "heavy_loaded": loaded,
+                  "first_ranking_s": first_ranking_s}))
+''' % {'pages': STATIC_PAGES, 'heavy': HEAVY_MODULES}
+
+def parse_importtime(stderr):
+    """Parse the output of `python -X importtime`.
+
+    Args:
+        stderr (str): Standard error of the interpreter
+
+    Returns:
+        Dict: {module: [self_us, cumulative_us]}
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        times[module.strip()] = [int(self_us), int(cumulative_us)]
+    return times
+
+def run_import(python):
+    """Import the app once in a fresh interpreter.
+
+    Returns:
+        [float, Dict]: Wall time of `import app` in seconds and the import
+        times per module
+    """
+    code = ("import time; start = time.perf_counter(); import app; "
+            "print(time.perf_counter() - start)")
+    result = subprocess.run([python, "-X", "importtime", "-c", code], cwd=APP_DIR,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1]), parse_importtime(result.stderr)
+
+def run_probe(python):
+    """Serve the static pages and run the first ranking in a fresh interpreter."""
+    result = subprocess.run([python, "-c", PROBE], cwd=APP_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start time of the app.")
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help="Number of fresh imports. Defaults to 5")
+    parser.add_argument('--top', type=int, default=20,
+                        help="Number of modules to list. Defaults to 20")
+    parser.add_argument('--json', help="Save the results to this JSON file")
+    parser.add_argument('--max-import-ms', type=float,
+                        help="Exit with an error if the median import time exceeds this")
+    parser.add_argument('--python', default=sys.executable,
+                        help="Interpreter to benchmark. Defaults to the current one")
+    args = parser.parse_args()
+
+    wall_times = []
+    module_runs = {}
+    for _ in range(args.runs):
+        wall_s, times = run_import(args.python)
+        wall_times.append(wall_s)
+        for module, values in times.items():
+            module_runs.setdefault(module, []).append(values)
+
+    modules = {module: {'self_ms': statistics.median(v[0] for v in runs) / 1000,
+                        'cumulative_ms': statistics.median(v[1] for v in runs) / 1000}
+               for module, runs in module_runs.items()}
+    import_ms = statistics.median(wall_times) * 1000
+    probe = run_probe(args.python)
+
+    print(f"import app: {import_ms:.1f} ms median over {args.runs} runs "
+          f"(min {min(wall_times) * 1000:.1f} ms)")
+    print(f"\n{'module':<45}{'self [ms]':>12}{'cumulative [ms]':>18}")
+    ranked = sorted(modules.items(), key=lambda item: item[1]['cumulative_ms'], reverse=True)
+    for module, times in ranked[:args.top]:
+        print(f"{module:<45}{times['self_ms']:>12.1f}{times['cumulative_ms']:>18.1f}")
+
+    print(f"\nStatic pages: {probe['status']}")
+    print(f"Heavy modules loaded after the static pages: {probe['heavy_loaded'] or 'none'}")
+    print(f"First ranking (loads the ranking path): {probe['first_ranking_s'] * 1000:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'runs': args.runs, 'import_ms': import_ms,
+                       'import_ms_runs': [t * 1000 for t in wall_times],
+                       'modules': modules, 'probe': probe}, file, indent=2)
+
+    failed = bool(probe['heavy_loaded'])
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"\nMedian import time {import_ms:.1f} ms exceeds {args.max_import_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
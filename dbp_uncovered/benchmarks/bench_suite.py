@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''
+Benchmark suite of the TOPSIS core and the app routes, to compare runs and
+catch performance regressions, i.e.,
+
+python benchmarks/bench_suite.py --json bench.json
+python benchmarks/bench_suite.py --baseline bench.json --threshold 0.2
+
+Cases (select some with --filter, i.e. --filter core/xlsx):
+
+- core/<matrix>/<stage>: check_data, distribute_DBP_weights, check_criteria
+  and do_TOPSIS with the expert-weights settings, on the bundled xlsx and on
+  synthetic matrices of --sizes actions (rows of the bundled matrix drawn at
+  random, with jitter). core/xlsx/load_xlsx reads the bundled xlsx.
+- app/compute_survey_result: ranking and coloring one survey, as the results
+  pages do when the stored result is out of date.
+- route/<path>: /, /challenge, /action-reaction-results and /my-surveys through
+  the Flask test client, logged in on a SQLite stand-in database
+  (standin_db.py) seeded with --users users of --history surveys.
+
+Every case runs once to warm up, then until it has run --min-time seconds
+and at least --min-repeats times. The median, minimum, mean and standard
+deviation per call are reported and saved with --json together with the
+machine, library versions and git commit. With --baseline the medians are
+compared to an earlier run and a case slower by more than --threshold (and
+by more than --min-delta seconds, below which differences are timer noise)
+is a regression; the exit code is then 1.
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETTINGS_FILE = os.path.join(APP_DIR, "input", "expert-weights_settings.json")
+DEFAULT_SIZES = "10,100,1000,10000,100000,1000000"
+
+def measure(func, min_time, min_repeats, max_repeats=10000):
+    """Time repeated calls of func.
+
+    Returns:
+        Dict: Median, minimum, mean and standard deviation per call in
+        seconds, and the number of calls
+    """
+    func()
+    times = []
+    total = 0.0
+    while (total < min_time or len(times) < min_repeats) and len(times) < max_repeats:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+    return {'median_s': statistics.median(times), 'min_s': min(times),
+            'mean_s': statistics.fmean(times),
+            'stdev_s': statistics.stdev(times) if len(times) > 1 else 0.0, 'n': len(times)}
+
+def synthetic_matrix(input_df, n_actions, seed=0):
+    """A decision matrix of n_actions rows drawn from input_df, with jitter."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    values = input_df.to_numpy()[rng.integers(0, len(input_df), n_actions)]
+    values = values + rng.integers(0, 2, values.shape)
+    return pd.DataFrame(values, index=[f"S{i}" for i in range(n_actions)],
+                        columns=input_df.columns)
+
+def core_cases(input_df, name, settings_dict):
+    """The TOPSIS stages on one decision matrix, each with the output of the one before."""
+    from topsis import check_data, distribute_DBP_weights, check_criteria, check_weights, \
+        do_TOPSIS
+
+    checked_df = check_data(input_df.copy(), map_acronyms = False)
+    weight_settings = distribute_DBP_weights(checked_df, settings_dict['weight_settings'],
+                                             settings_dict['DBP_ranking'],
+                                             DBP_merged = settings_dict.get('DBP-merged', True))
+    criteria_df, crit_type_dict = check_criteria(checked_df, weight_settings,
+                                                 settings_dict['action_category_ranking'])
+    weight_dict = check_weights(weight_settings)
+
+    return [
+        (f"core/{name}/check_data", lambda: check_data(input_df.copy(), map_acronyms = False)),
+        (f"core/{name}/distribute_DBP_weights",
+         lambda: distribute_DBP_weights(checked_df, settings_dict['weight_settings'],
+                                        settings_dict['DBP_ranking'],
+                                        DBP_merged = settings_dict.get('DBP-merged', True))),
+        (f"core/{name}/check_criteria",
+         lambda: check_criteria(checked_df, weight_settings,
+                                settings_dict['action_category_ranking'])),
+        (f"core/{name}/do_TOPSIS", lambda: do_TOPSIS(criteria_df, weight_dict, crit_type_dict)),
+    ]
+
+def app_cases(args, standin):
+    """Ranking one survey and the routes, logged in as a seeded user."""
+    import app
+
+    app.app.secret_key = app.app.secret_key or "bench"
+    user_response = {'ti': 3, 'cost': 4, 'freq': 2, 'effc': 5}
+    app.compute_survey_result(user_response)
+
+    usernames, survey_ids = standin.seed(args.users, surveys_per_user=args.history)
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        # The first user of the new stand-in database
+        session['user_id'] = 1
+        session['username'] = usernames[0]
+        session['response_id'] = survey_ids[0][-1]
+
+    def get(path):
+        def request():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return request
+
+    return [("app/compute_survey_result", lambda: app.compute_survey_result(user_response))] + [
+        (f"route{path}", get(path))
+        for path in ("/", "/challenge", "/action-reaction-results", "/my-surveys")]
+
+def environment():
+    import numpy as np
+    import pandas as pd
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'commit': commit or None, 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(results, baseline, threshold, min_delta):
+    """Changes of the medians against a baseline run.
+
+    Returns:
+        [list, list]: Rows (case, baseline, current, ratio, status) and the
+        regressed cases
+    """
+    rows, regressions = [], []
+    for case, result in results.items():
+        before = baseline['results'].get(case)
+        if before is None:
+            rows.append((case, None, result['median_s'], None, "new"))
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        delta = result['median_s'] - before['median_s']
+        if ratio > 1 + threshold and delta > min_delta:
+            status = "REGRESSION"
+            regressions.append(case)
+        elif ratio < 1 / (1 + threshold) and -delta > min_delta:
+            status = "faster"
+        else:
+            status = ""
+        rows.append((case, before['median_s'], result['median_s'], ratio, status))
+    return rows, regressions
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.3f} s"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TOPSIS core and the app "
+                                     "routes, and compare against an earlier run.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"Actions of the synthetic matrices. Defaults to {DEFAULT_SIZES}")
+    parser.add_argument('--filter', nargs='+', default=None,
+                        help="Only run the cases containing one of these strings")
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="Seconds to run each case for. Defaults to 0.5")
+    parser.add_argument('--min-repeats', type=int, default=5,
+                        help="Calls of each case at least. Defaults to 5")
+    parser.add_argument('--users', type=int, default=1000,
+                        help="Seeded users of the stand-in database. Defaults to 1000")
+    parser.add_argument('--history', type=int, default=20,
+                        help="Surveys of every seeded user. Defaults to 20")
+    parser.add_argument('--json', help="Save the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON file of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Slowdown of the median that is a regression. Defaults to 0.2")
+    parser.add_argument('--min-delta', type=float, default=20e-6,
+                        help="Slowdown in seconds below which a case is not a regression. "
+                        "Defaults to 20e-6")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    from decision_matrix import load_decision_matrix
+    from standin_db import StandinDatabase
+
+    with open(SETTINGS_FILE) as file:
+        settings_dict = json.load(file)
+    xlsx_file = os.path.join(APP_DIR, settings_dict['dec_matrix_settings']['input_file'])
+    input_df = load_decision_matrix(xlsx_file)
+
+    def selected(name):
+        return args.filter is None or any(part in name for part in args.filter)
+
+    # Cases are built lazily, so a filtered run skips building the big matrices
+    groups = [lambda: [("core/xlsx/load_xlsx", lambda: load_decision_matrix(xlsx_file))]
+              + core_cases(input_df, "xlsx", settings_dict)]
+    for size in (int(size) for size in args.sizes.split(",") if size):
+        if any(selected(f"core/n{size}/{stage}") for stage in
+               ("check_data", "distribute_DBP_weights", "check_criteria", "do_TOPSIS")):
+            groups.append(lambda size=size: core_cases(synthetic_matrix(input_df, size),
+                                                       f"n{size}", settings_dict))
+    standin = StandinDatabase()
+    if any(selected(name) for name in ("app/compute_survey_result", "route/", "route/challenge",
+                                       "route/action-reaction-results", "route/my-surveys")):
+        standin.install()
+        groups.append(lambda: app_cases(args, standin))
+
+    results = {}
+    try:
+        for build in groups:
+            for name, func in build():
+                if not selected(name):
+                    continue
+                results[name] = measure(func, args.min_time, args.min_repeats)
+                print(f"{name:<42} {format_seconds(results[name]['median_s']):>12}  "
+                      f"(min {format_seconds(results[name]['min_s'])}, n={results[name]['n']})",
+                      flush=True)
+    finally:
+        standin.remove()
+
+    report = {'environment': environment(),
+              'settings': {'sizes': args.sizes, 'min_time': args.min_time,
+                           'min_repeats': args.min_repeats, 'users': args.users,
+                           'history': args.history},
+              'results': results}
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        rows, regressions = compare(results, baseline, args.threshold, args.min_delta)
+        print(f"\nAgainst {args.baseline} (commit {baseline['environment'].get('commit')}), "
+              f"threshold {args.threshold:.0%}")
+        for case, before, after, ratio, status in rows:
+            print(f"{case:<42} {format_seconds(before):>12} -> {format_seconds(after):>12}  "
+                  f"{'' if ratio is None else f'{ratio:6.2f}x'}  {status}")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''
+Check that the top-k ranking is a prefix of the full ranking, i.e.,
+
+python benchmarks/check_top_k.py --matrices 2000
+
+Ties are where the two ranking paths (rank_according_to and rank_top_k) can
+disagree, so the scores are drawn from a few values only:
+
+- the score vector [0.5, 0.9, 0.5, 0.1, 0.9, 0.3, 0.5, 0.2]
+- --matrices random score matrices (1-50 rows of 1-40 actions) with many ties
+- TopsisModel.rank(w, k) for every k on the bundled decision matrix with
+  every action duplicated, so all closeness scores are tied in pairs
+
+rank(k=n) must equal rank()[:n] in all of them, and both must order tied
+actions as they come in the decision matrix. Any difference is a failure and
+the exit code is 1.
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETTINGS_FILE = os.path.join(APP_DIR, "input", "expert-weights_settings.json")
+
+def reference(data):
+    """Indices by score (descending), ties by position, one row at a time."""
+    return [sorted(range(len(row)), key=lambda i: (-row[i], i)) for row in data]
+
+def check_scores(data, failures, where):
+    import numpy as np
+    from topsis import rank_according_to, rank_top_k
+
+    data = np.atleast_2d(data)
+    index = np.arange(data.shape[-1])
+    full = rank_according_to(data, index)
+    if full.tolist() != reference(data.tolist()):
+        failures.append(f"{where}: full ranking does not order ties by position")
+    for k in range(1, data.shape[-1] + 1):
+        if not np.array_equal(rank_top_k(data, index, k), full[:, :k]):
+            failures.append(f"{where}: top-{k} differs from the full ranking")
+
+def check_model(failures):
+    import numpy as np
+    import pandas as pd
+    from decision_matrix import load_decision_matrix
+    from topsis import TopsisModel
+
+    with open(SETTINGS_FILE) as file:
+        settings_dict = json.load(file)
+    input_df = load_decision_matrix(os.path.join(APP_DIR,
+                                                 settings_dict['dec_matrix_settings']['input_file']))
+    copies = input_df.set_axis([f"{action}_copy" for action in input_df.index])
+    tied_df = pd.concat([input_df, copies])
+    model = TopsisModel(settings_dict, tied_df)
+
+    rng = np.random.default_rng(0)
+    weights = rng.integers(1, 6, (20, len(model.criteria))).astype(float)
+    weights /= weights.sum(axis=1, keepdims=True)
+    full = model.rank(weights)
+    for k in range(1, len(model.actions) + 1):
+        if not np.array_equal(model.rank(weights, k), full[:, :k]):
+            failures.append(f"TopsisModel.rank: k={k} differs from the full ranking")
+    # Every action is ranked right before its copy
+    position = {action: i for i, action in enumerate(model.actions.tolist())}
+    if any(position[row[i]] > position[row[i + 1]]
+           for row in full.tolist() for i in range(0, len(row), 2)):
+        failures.append("TopsisModel.rank: tied actions are not in decision matrix order")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the top-k ranking is a prefix "
+                                     "of the full ranking on tied scores.")
+    parser.add_argument('--matrices', type=int, default=2000,
+                        help="Random score matrices to check. Defaults to 2000")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed. Defaults to 0")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    import numpy as np
+
+    failures = []
+    check_scores(np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.3, 0.5, 0.2]), failures, "example")
+    rng = np.random.default_rng(args.seed)
+    for i in range(args.matrices):
+        shape = (int(rng.integers(1, 51)), int(rng.integers(1, 41)))
+        values = rng.choice(rng.random(rng.integers(1, 6)), shape)
+        check_scores(values, failures, f"matrix {i} {shape}")
+    check_model(failures)
+
+    for failure in failures[:20]:
+        print(f"  FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failures")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
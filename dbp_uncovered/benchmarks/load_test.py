@@ -0,0 +1,324 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''
+Load test replaying the user journey of the app, for capacity planning, i.e.,
+
+python benchmarks/load_test.py --users 50 --duration 60 --think-time 1
+
+Every virtual user repeats the journey of a new visitor, with its own
+cookies and a random think time (0.5-1.5x --think-time) between the steps:
+
+dashboard -> POST /action_reaction -> POST /register -> /action-reaction-results
+-> /my-surveys -> /survey-result/<id>
+
+Users start spread over --ramp-up seconds and stop after --duration seconds.
+A journey stops at the first failed step. By default the app is served by a
+threaded werkzeug server in a separate process, on a SQLite stand-in database
+(standin_db.py) installed behind db.get_connection, so no MySQL server is
+needed; --pool-size, --pool-timeout and --db-latency-ms set its connection
+pool and the latency per statement. With --url the journey runs against a
+running server instead.
+
+It reports the journeys and requests per second, and per route the requests,
+the error rate, the 503s (pool exhausted or password hashing busy) and the
+p50/p95/p99 latency. The pool counters of the server are read from /metrics
+afterwards, so pool exhaustion is reported separately from the other 503s.
+'''
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "secret123"
+
+def serve(args):
+    """Serve the app on the stand-in database (runs in the server process)."""
+    import signal
+    import logging
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.disable(logging.WARNING)
+    import app
+    import passwords
+    from standin_db import StandinDatabase
+
+    app.app.secret_key = app.app.secret_key or "load-test"
+    StandinDatabase(args.db, latency_ms=args.db_latency_ms).install(size=args.pool_size,
+                                                                    timeout=args.pool_timeout)
+    if args.hash_method:
+        passwords.hasher = passwords.PasswordHasher(args.hash_method, args.hash_workers)
+    # Compile the ranking model before the users arrive
+    app.get_ranking_table()
+
+    # Exit cleanly on terminate(), so the password hash workers exit with the server
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = make_server("127.0.0.1", args.port, app.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects as responses, a redirect is a failed step here."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def percentiles(values):
+    if len(values) < 2:
+        return {'p50_ms': values[0] if values else None, 'p95_ms': None, 'p99_ms': None,
+                'max_ms': values[0] if values else None}
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50_ms': q[49], 'p95_ms': q[94], 'p99_ms': q[98], 'max_ms': max(values)}
+
+class Stats:
+    """Latencies and outcomes per route, shared by the virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.journeys = {'completed': 0, 'failed': 0}
+
+    def record(self, route, status, latency_ms):
+        with self.lock:
+            route_stats = self.routes.setdefault(route, {'latencies': [], 'statuses': {}})
+            route_stats['latencies'].append(latency_ms)
+            route_stats['statuses'][status] = route_stats['statuses'].get(status, 0) + 1
+
+    def journey(self, completed):
+        with self.lock:
+            self.journeys['completed' if completed else 'failed'] += 1
+
+    def report(self, elapsed):
+        routes = {}
+        for route, route_stats in self.routes.items():
+            n = len(route_stats['latencies'])
+            errors = sum(count for status, count in route_stats['statuses'].items()
+                         if status != 200)
+            routes[route] = {'requests': n, 'errors': errors, 'error_rate': errors / n,
+                             'status_503': route_stats['statuses'].get(503, 0),
+                             'statuses': {str(status): count for status, count
+                                          in sorted(route_stats['statuses'].items(), key=str)},
+                             **percentiles(route_stats['latencies'])}
+        n_requests = sum(route['requests'] for route in routes.values())
+        return {'seconds': elapsed, 'journeys': dict(self.journeys),
+                'journeys_per_second': self.journeys['completed'] / elapsed,
+                'requests': n_requests, 'requests_per_second': n_requests / elapsed,
+                'errors': sum(route['errors'] for route in routes.values()),
+                'routes': routes}
+
+class VirtualUser(threading.Thread):
+    """Replays the journey of new visitors until the test ends."""
+
+    def __init__(self, number, args, base_url, stats, start_at, stop):
+        super().__init__(name=f"user{number}", daemon=True)
+        self.number = number
+        self.args = args
+        self.base_url = base_url
+        self.stats = stats
+        self.start_at = start_at
+        self.stop = stop
+        self.rng = random.Random(args.seed * 100003 + number)
+
+    def request(self, opener, route, path, body=None):
+        """One step of the journey.
+
+        Returns:
+            [int, str]: The status, and the body if it is 200 (None otherwise)
+        """
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={"Content-Type": "application/json"}
+                                         if data else {})
+        start = time.perf_counter()
+        try:
+            with opener.open(request, timeout=self.args.request_timeout) as response:
+                status, text = response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            status, text = e.code, None
+            e.close()
+        except OSError:
+            # Refused or reset connection, or a timeout
+            status, text = 'connection error', None
+        self.stats.record(route, status, (time.perf_counter() - start) * 1000)
+        return status, text if status == 200 else None
+
+    def think(self):
+        if self.args.think_time:
+            self.stop.wait(self.args.think_time * self.rng.uniform(0.5, 1.5))
+
+    def journey(self, index):
+        """One visitor from the dashboard to a stored result, False if a step failed."""
+        from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, YES, NO
+
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()),
+                                             NoRedirect)
+        answers = ([self.rng.choice((YES, NO)) for _ in QUESTION_FIELDS]
+                   + [str(self.rng.randint(1, 5)) for _ in PREFERENCE_FIELDS])
+        username = f"load{self.args.run_id}_{self.number}_{index}"
+
+        steps = [
+            ("GET /dashboard", "/dashboard", None),
+            ("POST /action_reaction", "/action_reaction",
+             {"answers": [{"selected": value} for value in answers]}),
+            ("POST /register", "/register",
+             {"username": username, "password": PASSWORD, "confirm_password": PASSWORD}),
+            ("GET /action-reaction-results", "/action-reaction-results", None),
+            ("GET /my-surveys", "/my-surveys", None),
+        ]
+        text = None
+        for route, path, body in steps:
+            if self.stop.is_set():
+                return None
+            status, text = self.request(opener, route, path, body)
+            if status != 200 or text is None or (body is not None and '"success"' not in text):
+                return False
+            self.think()
+
+        survey_ids = re.findall(r'/survey-result/(\d+)', text)
+        if not survey_ids or self.stop.is_set():
+            return None if survey_ids else False
+        status, text = self.request(opener, "GET /survey-result/<id>",
+                                    f"/survey-result/{survey_ids[0]}")
+        return status == 200 and text is not None
+
+    def run(self):
+        self.stop.wait(max(0.0, self.start_at - time.monotonic()))
+        index = 0
+        while not self.stop.is_set():
+            completed = self.journey(index)
+            if completed is not None:
+                self.stats.journey(completed)
+            index += 1
+
+def server_metrics(base_url):
+    """Pool counters of the server from /metrics, None if it has none."""
+    try:
+        with urllib.request.urlopen(base_url + "/metrics", timeout=10) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    values = {}
+    for name in ('dbp_db_pool_checkouts_total', 'dbp_db_pool_timeouts_total',
+                 'dbp_db_pool_wait_seconds_total'):
+        match = re.search(rf'^{name} (\S+)$', text, re.M)
+        if match:
+            values[name] = float(match.group(1))
+    return values or None
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the user journey of the app at a "
+                                     "given concurrency and report the latencies and errors.")
+    parser.add_argument('--users', type=int, default=20,
+                        help="Concurrent virtual users. Defaults to 20")
+    parser.add_argument('--duration', type=float, default=30,
+                        help="Seconds of load. Defaults to 30")
+    parser.add_argument('--ramp-up', type=float, default=5,
+                        help="Seconds over which the users start. Defaults to 5")
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help="Mean seconds between the steps of a journey. Defaults to 1")
+    parser.add_argument('--request-timeout', type=float, default=30,
+                        help="Seconds to wait for a response. Defaults to 30")
+    parser.add_argument('--url', help="Test this running server instead of a local one")
+    parser.add_argument('--pool-size', type=int, default=5,
+                        help="Database connections of the local server. Defaults to 5")
+    parser.add_argument('--pool-timeout', type=float, default=5,
+                        help="Seconds a request waits for a connection. Defaults to 5")
+    parser.add_argument('--db-latency-ms', type=float, default=1.0,
+                        help="Latency per statement of the stand-in database. Defaults to 1")
+    parser.add_argument('--hash-method', default=None,
+                        help="Password hash method of the local server. Defaults to "
+                        "PASSWORD_HASH_METHOD")
+    parser.add_argument('--hash-workers', type=int, default=1,
+                        help="Hash worker processes with --hash-method. Defaults to 1")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed. Defaults to 0")
+    parser.add_argument('--json', help="Save the results to this JSON file")
+    # Internal: run the local server
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    # Usernames are unique per run, so runs against the same server do not collide
+    args.run_id = f"{int(time.time()) % 100000}"
+    server = standin = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        from standin_db import StandinDatabase
+
+        standin = StandinDatabase()
+        command = [sys.executable, os.path.abspath(__file__), "--serve", "--db", standin.filename,
+                   "--pool-size", str(args.pool_size), "--pool-timeout", str(args.pool_timeout),
+                   "--db-latency-ms", str(args.db_latency_ms),
+                   "--hash-workers", str(args.hash_workers)]
+        if args.hash_method:
+            command += ["--hash-method", args.hash_method]
+        server = subprocess.Popen(command, cwd=APP_DIR, stdout=subprocess.PIPE, text=True)
+        base_url = f"http://127.0.0.1:{int(server.stdout.readline())}"
+
+    try:
+        stats = Stats()
+        stop = threading.Event()
+        start = time.monotonic()
+        users = [VirtualUser(i, args, base_url, stats,
+                             start + args.ramp_up * i / max(1, args.users), stop)
+                 for i in range(args.users)]
+        for user in users:
+            user.start()
+        time.sleep(args.duration)
+        stop.set()
+        for user in users:
+            user.join(args.request_timeout + 1)
+        elapsed = time.monotonic() - start
+        results = stats.report(elapsed)
+        results['users'] = args.users
+        results['think_time_s'] = args.think_time
+        results['server'] = server_metrics(base_url)
+        if standin is not None:
+            results['stored_surveys'] = standin.count("answers")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if standin is not None:
+            standin.remove()
+
+    print(f"\n{args.users} users, {args.duration:g} s, think time {args.think_time:g} s"
+          + (f", pool {args.pool_size}" if not args.url else f", {base_url}"))
+    print(f"journeys  {results['journeys']['completed']} completed, "
+          f"{results['journeys']['failed']} failed, {results['journeys_per_second']:.2f}/s")
+    print(f"requests  {results['requests']}, {results['requests_per_second']:.1f}/s, "
+          f"{results['errors']} errors")
+    print(f"\n{'route':<30} {'requests':>8} {'errors':>7} {'503':>5} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8}")
+    for route, route_stats in results['routes'].items():
+        print(f"{route:<30} {route_stats['requests']:>8} {route_stats['error_rate']:>7.1%} "
+              f"{route_stats['status_503']:>5} {route_stats['p50_ms'] or 0:>8.1f} "
+              f"{route_stats['p95_ms'] or 0:>8.1f} {route_stats['p99_ms'] or 0:>8.1f}")
+    if results['server']:
+        server_stats = results['server']
+        print(f"\npool      {server_stats.get('dbp_db_pool_checkouts_total', 0):.0f} checkouts, "
+              f"{server_stats.get('dbp_db_pool_timeouts_total', 0):.0f} exhausted "
+              f"(503), {server_stats.get('dbp_db_pool_wait_seconds_total', 0):.2f} s waited")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import functools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError, OperationalError
+
+from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, ANSWER_COLUMNS, YES, NO, \
+    encode_answers
+from materialized import RESULT_COLUMNS
+
+'''
+SQLite stand-in for the MySQL database of the app, for benchmarks and load
+tests without a MySQL server, i.e.,
+
+standin = StandinDatabase(latency_ms=0.5)
+standin.seed(users=1000, surveys_per_user=3)
+standin.install(size=5, timeout=2)
+
+After install() the app's db.get_connection() hands out stand-in connections
+through the app's own ConnectionPool, so checkout waits and pool exhaustion
+behave as with MySQL. The connections mimic the part of mysql.connector the
+app uses: cursors (dictionary, prepared), commit/rollback, in_transaction,
+ping and close. %s placeholders are translated, a duplicate key raises
+mysql.connector's IntegrityError (errno 1062) and TIMESTAMP columns are read
+as datetime.
+
+Every connection has its own SQLite connection to one WAL database file, so
+concurrent requests behave like separate sessions. latency_ms is added to
+every statement as a stand-in for the network round trip to the server.
+'''
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+  id             INTEGER PRIMARY KEY AUTOINCREMENT,
+  username       VARCHAR(100) NOT NULL UNIQUE,
+  password_hash  VARCHAR(255) NOT NULL,
+  created_at     TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS answers (
+  id             INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id        INTEGER REFERENCES users(id) ON DELETE CASCADE,
+  yes_answers    SMALLINT NOT NULL DEFAULT 0,
+  answered_mask  SMALLINT NOT NULL DEFAULT 0,
+  {', '.join(f'{field} TINYINT' for field in PREFERENCE_FIELDS)},
+  answered_at    TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  ranking        BLOB,
+  colors         BLOB,
+  ranking_version CHAR(12)
+);
+CREATE INDEX IF NOT EXISTS idx_answers_user_answered ON answers (user_id, answered_at);
+CREATE INDEX IF NOT EXISTS idx_answers_ranking_version ON answers (ranking_version);
+"""
+
+@functools.lru_cache(maxsize=256)
+def translate(sql):
+    """MySQL placeholders to SQLite ones."""
+    return sql.replace("%s", "?")
+
+class StandinCursor:
+    """Cursor of a stand-in connection, rows as tuples or dicts."""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._db.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        self._connection._round_trip()
+        try:
+            self._cursor.execute(translate(sql), tuple(params or ()))
+        except sqlite3.IntegrityError as e:
+            errno = errorcode.ER_DUP_ENTRY if "UNIQUE" in str(e) else errorcode.ER_NO_REFERENCED_ROW_2
+            raise IntegrityError(msg=str(e), errno=errno) from e
+        except sqlite3.OperationalError as e:
+            raise OperationalError(msg=str(e)) from e
+
+    def executemany(self, sql, seq_params):
+        self._connection._round_trip()
+        try:
+            self._cursor.executemany(translate(sql), [tuple(params) for params in seq_params])
+        except sqlite3.IntegrityError as e:
+            raise IntegrityError(msg=str(e), errno=errorcode.ER_DUP_ENTRY) from e
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+class StandinConnection:
+    """A session of the stand-in database, as a mysql.connector connection."""
+
+    def __init__(self, filename, latency_ms=0.0):
+        self._db = sqlite3.connect(filename, timeout=30, check_same_thread=False,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self.latency_ms = latency_ms
+        self.closed = False
+
+    def _round_trip(self):
+        if self.closed:
+            raise OperationalError(msg="MySQL Connection not available")
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def cursor(self, buffered=None, dictionary=None, prepared=None, **kwargs):
+        return StandinCursor(self, dictionary=bool(dictionary))
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def commit(self):
+        self._round_trip()
+        self._db.commit()
+
+    def rollback(self):
+        self._round_trip()
+        self._db.rollback()
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        self._round_trip()
+
+    def is_connected(self):
+        return not self.closed
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._db.close()
+
+class StandinDatabase:
+    """A SQLite database file with the app's schema.
+
+    Args:
+        filename (str, optional): Database file. Defaults to a new temporary file.
+        latency_ms (float, optional): Added to every statement. Defaults to 0.
+    """
+
+    def __init__(self, filename=None, latency_ms=0.0):
+        self.temporary = filename is None
+        if self.temporary:
+            fd, filename = tempfile.mkstemp(prefix="standin_", suffix=".sqlite")
+            os.close(fd)
+        self.filename = filename
+        self.latency_ms = latency_ms
+        with sqlite3.connect(filename) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        return StandinConnection(self.filename, self.latency_ms)
+
+    def install(self, **pool_settings):
+        """Make db.get_connection() of this process use the stand-in.
+
+        Args:
+            pool_settings: ConnectionPool settings (size, timeout, recycle,
+            ping_after), overriding the DB_POOL_* settings
+
+        Returns:
+            ConnectionPool: The app's pool
+        """
+        import db
+        from config import DB_POOL_CONFIG
+
+        if db.pool is not None:
+            db.pool.close()
+        db.pool = db.ConnectionPool(**{**DB_POOL_CONFIG, **pool_settings}, connect=self.connect)
+        return db.pool
+
+    def seed(self, users, surveys_per_user=1, password="secret123", password_method=None,
+             with_results=True, seed=0, batch_size=10000):
+        """Add users (user1, user2, ...) with random surveys.
+
+        Args:
+            users (int): Number of users
+            surveys_per_user (int, optional): Surveys of each user. Defaults to 1.
+            password (str, optional): Password of every user. Defaults to "secret123".
+            password_method (str, optional): Werkzeug hash method. Defaults to
+            the app's PASSWORD_HASH_METHOD.
+            with_results (bool, optional): Store the ranked and colored actions
+            with the surveys, as the app does at insert. Defaults to True.
+            seed (int, optional): Random seed. Defaults to 0.
+
+        Returns:
+            [list, list]: The usernames and the survey ids of each user
+        """
+        from werkzeug.security import generate_password_hash
+        from config import PASSWORD_HASH_CONFIG
+
+        # One hash for all users, the KDF would dominate the seeding otherwise
+        password_hash = generate_password_hash(password,
+                                               password_method or PASSWORD_HASH_CONFIG['method'])
+        if with_results:
+            from app import stored_result_values
+
+        rng = random.Random(seed)
+        conn = sqlite3.connect(self.filename, timeout=30)
+        first_user = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0] + 1
+        usernames = [f"user{i}" for i in range(first_user, first_user + users)]
+        conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+                         [(first_user + i, username, password_hash)
+                          for i, username in enumerate(usernames)])
+
+        columns = ("user_id",) + ANSWER_COLUMNS + (RESULT_COLUMNS if with_results else ())
+        sql = (f"INSERT INTO answers ({', '.join(columns)}) "
+               f"VALUES ({', '.join(['?'] * len(columns))})")
+        survey_ids = []
+        batch = []
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM answers").fetchone()[0] + 1
+        for user_id in range(first_user, first_user + users):
+            ids = []
+            for _ in range(surveys_per_user):
+                answers = ([rng.choice((YES, NO)) for _ in QUESTION_FIELDS]
+                           + [rng.randint(1, 5) for _ in PREFERENCE_FIELDS])
+                row = (user_id, *encode_answers(answers))
+                if with_results:
+                    row += tuple(stored_result_values(answers))
+                batch.append(row)
+                ids.append(next_id)
+                next_id += 1
+            survey_ids.append(ids)
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                batch.clear()
+        conn.executemany(sql, batch)
+        conn.commit()
+        conn.close()
+        return usernames, survey_ids
+
+    def count(self, table):
+        with sqlite3.connect(self.filename) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def remove(self):
+        """Delete the database file if it is temporary."""
+        if self.temporary:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.filename + suffix):
+                    os.remove(self.filename + suffix)
@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import html
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+'''
+Concurrency stress test of the request path, i.e.,
+
+python benchmarks/stress_threads.py --users 32 --surveys 5
+
+Every user is a thread with its own Flask test client (own session cookie),
+and all of them run the app at the same time in this process, as a threaded
+worker does: submit a survey, register, view the results, then submit more
+surveys and view each result, the survey history and the first result again.
+
+Each user answers differently, and every page is checked against what the
+user submitted: the username on the page, the ranked actions and their colors
+(computed up front, one survey at a time) and the number of surveys in the
+history. Any page showing another user's data, or an error, is a failure and
+the exit code is 1. A short GIL switch interval makes the threads interleave
+as much as possible. Runs on the SQLite stand-in database (standin_db.py).
+'''
+
+ROW_PATTERN = re.compile(r'<tr class="action-row (\w+)">\s*<td>\d+</td>\s*'
+                         r'<td class="action-description">(.*?)</td>', re.S)
+HELLO_PATTERN = re.compile(r'Hello <strong>(.*?)! </strong>')
+HISTORY_PATTERN = re.compile(r'Your Action Lists \((\d+)\)')
+
+def random_answers(rng):
+    """Answers of one survey, as posted by the survey page."""
+    from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, YES, NO
+
+    return ([rng.choice((YES, NO)) for _ in QUESTION_FIELDS]
+            + [str(rng.randint(1, 5)) for _ in PREFERENCE_FIELDS])
+
+def expected_rows(app, answers):
+    """(color, action) of the ranked actions the results page must show."""
+    from survey_codec import ANSWER_FIELDS
+
+    _, _, colored_actions = app.compute_survey_result(dict(zip(ANSWER_FIELDS, answers)))
+    return [(action['color'], html.escape(action['action'])) for action in colored_actions]
+
+class User(threading.Thread):
+    """One user clicking through the app."""
+
+    def __init__(self, app, name, surveys, expected, barrier):
+        super().__init__(name=name)
+        self.app = app
+        self.username = name
+        self.surveys = surveys
+        self.expected = expected
+        self.barrier = barrier
+        self.failures = []
+        self.requests = 0
+
+    def check(self, condition, message):
+        if not condition:
+            self.failures.append(f"{self.username}: {message}")
+
+    def get(self, client, path):
+        self.requests += 1
+        response = client.get(path)
+        self.check(response.status_code == 200, f"GET {path} returned {response.status_code}")
+        return response.get_data(as_text=True)
+
+    def post(self, client, path, body):
+        self.requests += 1
+        response = client.post(path, json=body)
+        data = response.get_json(silent=True) or {}
+        self.check(response.status_code == 200 and data.get('status') == 'success',
+                   f"POST {path} returned {response.status_code} {data}")
+
+    def check_results(self, page, index, where):
+        hello = HELLO_PATTERN.search(page)
+        greeted = hello.group(1) if hello else None
+        self.check(greeted == self.username, f"{where} greets {greeted}")
+        self.check(ROW_PATTERN.findall(page) == self.expected[index],
+                   f"{where} shows other actions than survey {index}")
+
+    def run(self):
+        client = self.app.app.test_client()
+        self.barrier.wait()
+        try:
+            for index, answers in enumerate(self.surveys):
+                body = {"answers": [{"selected": value} for value in answers]}
+                self.post(client, "/action_reaction", body)
+                if index == 0:
+                    self.post(client, "/register", {"username": self.username,
+                                                    "password": "secret123",
+                                                    "confirm_password": "secret123"})
+                self.check_results(self.get(client, "/action-reaction-results"), index,
+                                   f"results of survey {index}")
+
+            history = self.get(client, "/my-surveys")
+            count = HISTORY_PATTERN.search(history)
+            self.check(count and int(count.group(1)) == len(self.surveys),
+                       f"history lists {count and count.group(1)} surveys")
+            first_id = min(int(survey_id) for survey_id in
+                           re.findall(r'/survey-result/(\d+)', history))
+            self.check_results(self.get(client, f"/survey-result/{first_id}"), 0,
+                               "first survey from the history")
+        except Exception as e:
+            self.failures.append(f"{self.username}: {e!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the request path from many threads "
+                                     "and check that no results get mixed up.")
+    parser.add_argument('--users', type=int, default=32,
+                        help="Concurrent users (threads). Defaults to 32")
+    parser.add_argument('--surveys', type=int, default=5,
+                        help="Surveys submitted by every user. Defaults to 5")
+    parser.add_argument('--pool-size', type=int, default=8,
+                        help="Database connections. Defaults to 8")
+    parser.add_argument('--latency-ms', type=float, default=0.2,
+                        help="Stand-in database latency per statement. Defaults to 0.2")
+    parser.add_argument('--switch-interval', type=float, default=1e-5,
+                        help="GIL switch interval in seconds. Defaults to 1e-5")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed. Defaults to 0")
+    parser.add_argument('--json', help="Save the results to this JSON file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    import app
+    import passwords
+    from standin_db import StandinDatabase
+
+    app.app.secret_key = app.app.secret_key or "stress"
+    # Password hashing is not under test here, a cheap inline hash keeps the threads on the app
+    passwords.hasher = passwords.PasswordHasher("pbkdf2:sha256:1000", workers=0)
+    standin = StandinDatabase(latency_ms=args.latency_ms)
+    pool = standin.install(size=args.pool_size, timeout=30)
+
+    rng = random.Random(args.seed)
+    barrier = threading.Barrier(args.users)
+    users = []
+    for i in range(args.users):
+        surveys = [random_answers(rng) for _ in range(args.surveys)]
+        users.append(User(app, f"stress{i}", surveys,
+                          [expected_rows(app, answers) for answers in surveys], barrier))
+
+    sys.setswitchinterval(args.switch_interval)
+    start = time.perf_counter()
+    try:
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+    finally:
+        elapsed = time.perf_counter() - start
+        sys.setswitchinterval(0.005)
+        stored_surveys = standin.count("answers")
+        standin.remove()
+
+    failures = [failure for user in users for failure in user.failures]
+    n_requests = sum(user.requests for user in users)
+    results = {'users': args.users, 'surveys_per_user': args.surveys, 'requests': n_requests,
+               'seconds': round(elapsed, 3), 'stored_surveys': stored_surveys,
+               'failures': failures, 'pool': pool.stats()}
+    if stored_surveys != args.users * args.surveys:
+        failures.append(f"{stored_surveys} surveys stored, expected {args.users * args.surveys}")
+
+    print(f"{args.users} users x {args.surveys} surveys: {n_requests} requests in "
+          f"{elapsed:.1f} s ({n_requests / elapsed:.0f}/s), {stored_surveys} surveys stored, "
+          f"pool waited max {pool.stats()['wait_seconds_max'] * 1000:.0f} ms")
+    for failure in failures[:20]:
+        print(f"  FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failures")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -11,3 +11,31 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD'),
     'database': os.getenv('DB_NAME'),
 }
+
+# Connection pool of each app process, see db.py
+DB_POOL_CONFIG = {
+    'size':       int(os.getenv('DB_POOL_SIZE', 5)),
+    'timeout':    float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    'recycle':    float(os.getenv('DB_POOL_RECYCLE', 1800)),
+    'ping_after': float(os.getenv('DB_POOL_PING_AFTER', 30)),
+}
+
+# Password hashing of each app process, see passwords.py
+PASSWORD_HASH_CONFIG = {
+    'method':      os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+    'workers':     int(os.getenv('PASSWORD_HASH_WORKERS', 1)),
+    'queue_depth': int(os.getenv('PASSWORD_HASH_QUEUE', 8)),
+    'timeout':     float(os.getenv('PASSWORD_HASH_TIMEOUT', 10)),
+}
+
+# JSON recommendation API, see api.py
+API_CONFIG = {
+    'batch_limit': int(os.getenv('API_BATCH_LIMIT', 5000)),
+    'max_age':     int(os.getenv('API_CACHE_MAX_AGE', 300)),
+}
+
+# Metrics at /metrics, see metrics.py. Shared by the gunicorn workers through METRICS_DIR
+METRICS_CONFIG = {
+    'dir':            os.getenv('METRICS_DIR') or None,
+    'flush_interval': float(os.getenv('METRICS_FLUSH_INTERVAL', 5)),
+}
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import logging
+import threading
+
+'''
+In-memory registry of the JSON content files of the app (quiz questions,
+action-reaction questions, action mapping and the challenge pages).
+
+Every file is parsed once per process, and the action coloring the routes
+look things up in (see action_coloring.py) is compiled once from the action
+mapping and the action-reaction questions. The files are reloaded only when they change on disk: at most once
+per check interval a file is stat'ed, and it is parsed again when its mtime or
+size differs from the loaded copy. In between, content is served from memory
+without any file I/O.
+
+The returned content is shared between requests and must be treated as
+read-only.
+'''
+
+# Seconds between two checks of a content file for changes
+CHECK_INTERVAL = 1.0
+
+# Number of challenge pages (challenge_page1.json, ...)
+CHALLENGE_PAGES = 5
+
+class ContentFile:
+    """One JSON content file, reloaded when the file changes on disk."""
+
+    def __init__(self, filename, required=True, check_interval=CHECK_INTERVAL):
+        self.filename = os.path.abspath(filename)
+        self.required = required
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = None
+        self._stat_key = None
+        self._checked_at = None
+        self.reload_count = 0
+
+    def get(self):
+        """Return the parsed content, reloading it if the file changed.
+
+        Returns:
+            The parsed JSON content, or None if an optional file is missing
+        """
+        self._refresh()
+        return self._data
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+
+            try:
+                stat = os.stat(self.filename)
+                stat_key = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                if self.required:
+                    raise
+                stat_key = None
+
+            if self._checked_at is None or stat_key != self._stat_key:
+                self._load(stat_key)
+            self._checked_at = now
+
+    def _load(self, stat_key):
+        if stat_key is None:
+            logging.warning(f"Content file '{self.filename}' not found")
+            data = None
+        else:
+            with open(self.filename, 'r') as file:
+                data = json.load(file)
+
+        self._data, self._stat_key = data, stat_key
+        self.reload_count += 1
+        logging.info(f"Content file '{os.path.basename(self.filename)}' loaded")
+
+class ContentRegistry:
+    """All content files of the app, loaded once and kept in memory."""
+
+    def __init__(self, base_dir, check_interval=CHECK_INTERVAL):
+        def content_file(name, required=True):
+            return ContentFile(os.path.join(base_dir, name), required, check_interval)
+
+        self._questions = content_file('questions.json')
+        self._action_questions = content_file('action_reaction_questions.json')
+        self._action_mapping = content_file('action_mapping.json')
+        self._challenge_pages = [content_file(f'challenge_page{page_num}.json', required=False)
+                                 for page_num in range(1, CHALLENGE_PAGES + 1)]
+        self._coloring = None
+        self._coloring_lock = threading.Lock()
+
+    def questions(self):
+        """Quiz questions (questions.json)."""
+        return self._questions.get()
+
+    def action_questions(self):
+        """Action-reaction questions (action_reaction_questions.json)."""
+        return self._action_questions.get()
+
+    def action_mapping(self):
+        """Action mapping (action_mapping.json)."""
+        return self._action_mapping.get()
+
+    def challenge_pages(self):
+        """Challenge pages in page order, skipping missing pages."""
+        pages = (content.get() for content in self._challenge_pages)
+        return [page for page in pages if page is not None]
+
+    def action_coloring(self):
+        """Action coloring compiled from the action mapping and the
+        action-reaction questions, recompiled when either file changes."""
+        action_mapping = self.action_mapping()
+        action_questions = self.action_questions()
+        def is_stale(coloring):
+            return (coloring is None or coloring[0] is not action_mapping
+                    or coloring[1] is not action_questions)
+
+        coloring = self._coloring
+        if is_stale(coloring):
+            with self._coloring_lock:
+                coloring = self._coloring
+                if is_stale(coloring):
+                    from action_coloring import ActionColoring
+                    coloring = (action_mapping, action_questions,
+                                ActionColoring(action_mapping, action_questions))
+                    self._coloring = coloring
+        return coloring[2]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry(base_dir):
+    """Return the process-wide content registry for a directory.
+
+    Args:
+        base_dir (str): Directory containing the content files
+
+    Returns:
+        ContentRegistry: The registry for the directory
+    """
+    key = os.path.abspath(base_dir)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = ContentRegistry(key)
+        return _registries[key]
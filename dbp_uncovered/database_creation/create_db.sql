@@ -14,29 +14,26 @@ CREATE TABLE IF NOT EXISTS users (
 );
 
 -- 2. Answers table
+-- q1-q16 are packed into bitfields (bit i-1 is question q<i>): yes_answers has
+-- the bit set for "Yes", answered_mask for any answer. See survey_codec.py.
+-- Existing databases are converted with database_creation/migrate_answers.py
 CREATE TABLE IF NOT EXISTS answers (
   id             INT AUTO_INCREMENT PRIMARY KEY,
   user_id        INT             ,
-  q1             VARCHAR(20),
-  q2             VARCHAR(20),
-  q3             VARCHAR(20),
-  q4             VARCHAR(20),
-  q5             VARCHAR(20),
-  q6             VARCHAR(20),
-  q7             VARCHAR(20),
-  q8             VARCHAR(20),
-  q9             VARCHAR(20),
-  q10            VARCHAR(20),
-  q11            VARCHAR(20),
-  q12            VARCHAR(20),
-  q13            VARCHAR(20),
-  q14            VARCHAR(20),
-  q15            VARCHAR(20),
-  q16            VARCHAR(20),
-  ti 			 VARCHAR(20),
-  cost 			 VARCHAR(20),
-  freq 			 VARCHAR(20),
-  effc 			 VARCHAR(20),
+  yes_answers    SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+  answered_mask  SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+  ti             TINYINT UNSIGNED,
+  cost           TINYINT UNSIGNED,
+  freq           TINYINT UNSIGNED,
+  effc           TINYINT UNSIGNED,
   answered_at    TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  -- Recommendation result of the survey, see materialized.py
+  ranking        VARBINARY(4096),
+  colors         VARBINARY(64),
+  ranking_version CHAR(12),
+  -- Survey history of a user, newest first (/login, /my-surveys)
+  INDEX idx_answers_user_answered (user_id, answered_at),
+  -- Finding results computed with an old model version
+  INDEX idx_answers_ranking_version (ranking_version),
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from config import DB_CONFIG
+from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, PREFERENCE_LEVELS, \
+    SELECT_COLUMNS, decode_answers
+
+'''
+Online migration of the `answers` table from the VARCHAR schema (q1-q16, ti,
+cost, freq, effc as VARCHAR(20)) to the compact schema of create_db.sql.
+
+The app keeps running during the copy:
+
+1) the compact table `answers_compact` is created,
+2) triggers on `answers` mirror every insert, update and delete into it,
+3) the existing rows are copied in primary key chunks (INSERT IGNORE, so rows
+   already written by the triggers are kept),
+4) both tables are compared (row count and a random sample decoded through
+   survey_codec),
+5) with --swap, the tables are swapped in one atomic RENAME and the triggers
+   are dropped. The old table is kept as `answers_old` unless --drop-old is
+   given.
+
+The stored recommendation results (ranking, colors, ranking_version) start out
+empty and are computed when a survey is first viewed. Tables that were
+migrated before these columns existed only get the columns added, and a
+ranking column of the earlier VARBINARY(1024) is widened.
+
+Deploy the app version that reads the compact schema right after the swap, i.e.,
+
+python database_creation/migrate_answers.py --batch-size 10000 --swap
+
+Run it from the dbp_uncovered directory, it uses the DB_* settings in .env.
+'''
+
+SOURCE_TABLE = "answers"
+TARGET_TABLE = "answers_compact"
+OLD_TABLE = "answers_old"
+TRIGGER_PREFIX = "answers_compact_sync"
+
+CREATE_TARGET_SQL = f"""
+CREATE TABLE IF NOT EXISTS {TARGET_TABLE} (
+  id             INT AUTO_INCREMENT PRIMARY KEY,
+  user_id        INT             ,
+  yes_answers    SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+  answered_mask  SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+  ti             TINYINT UNSIGNED,
+  cost           TINYINT UNSIGNED,
+  freq           TINYINT UNSIGNED,
+  effc           TINYINT UNSIGNED,
+  answered_at    TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  ranking        VARBINARY(4096),
+  colors         VARBINARY(64),
+  ranking_version CHAR(12),
+  INDEX idx_answers_user_answered (user_id, answered_at),
+  INDEX idx_answers_ranking_version (ranking_version),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+)
+"""
+
+TARGET_COLUMNS = "id, user_id, yes_answers, answered_mask, " + ", ".join(PREFERENCE_FIELDS) \
+    + ", answered_at"
+
+def compact_expressions(prefix=""):
+    """SQL expressions that compute the compact columns from a VARCHAR row.
+
+    Args:
+        prefix (str, optional): Row prefix, i.e. 'NEW.' inside triggers
+
+    Returns:
+        str: Select list in TARGET_COLUMNS order
+    """
+    yes_bits = " | ".join(f"(({prefix}{field} <=> 'Yes') << {bit})"
+                          for bit, field in enumerate(QUESTION_FIELDS))
+    answered_bits = " | ".join(f"(({prefix}{field} IS NOT NULL) << {bit})"
+                               for bit, field in enumerate(QUESTION_FIELDS))
+    # FIELD() gives the position of the answer in the levels (0 if not found),
+    # which is the level itself for 1-5. Anything else becomes NULL.
+    levels = ", ".join(f"'{level}'" for level in PREFERENCE_LEVELS)
+    preferences = [f"NULLIF(FIELD(TRIM({prefix}{field}), {levels}), 0)"
+                   for field in PREFERENCE_FIELDS]
+    return ", ".join([f"{prefix}id", f"{prefix}user_id", f"({yes_bits})", f"({answered_bits})",
+                      *preferences, f"{prefix}answered_at"])
+
+def trigger_statements():
+    """Statements that create the triggers mirroring writes to the target."""
+    replace_new = (f"REPLACE INTO {TARGET_TABLE} ({TARGET_COLUMNS}) "
+                   f"VALUES ({compact_expressions('NEW.')})")
+    return [
+        f"CREATE TRIGGER {TRIGGER_PREFIX}_ins AFTER INSERT ON {SOURCE_TABLE} "
+        f"FOR EACH ROW {replace_new}",
+        f"CREATE TRIGGER {TRIGGER_PREFIX}_upd AFTER UPDATE ON {SOURCE_TABLE} "
+        f"FOR EACH ROW BEGIN DELETE FROM {TARGET_TABLE} WHERE id = OLD.id; {replace_new}; END",
+        f"CREATE TRIGGER {TRIGGER_PREFIX}_del AFTER DELETE ON {SOURCE_TABLE} "
+        f"FOR EACH ROW DELETE FROM {TARGET_TABLE} WHERE id = OLD.id",
+    ]
+
+def drop_trigger_statements():
+    return [f"DROP TRIGGER IF EXISTS {TRIGGER_PREFIX}_{kind}" for kind in ('ins', 'upd', 'del')]
+
+def copy_chunk_sql():
+    return (f"INSERT IGNORE INTO {TARGET_TABLE} ({TARGET_COLUMNS}) "
+            f"SELECT {compact_expressions()} FROM {SOURCE_TABLE} "
+            f"WHERE id > %s AND id <= %s LOCK IN SHARE MODE")
+
+# Stored results (materialized.py), added to tables that were migrated before
+ADD_RESULT_COLUMNS_SQL = f"""
+ALTER TABLE {SOURCE_TABLE}
+  ADD COLUMN ranking VARBINARY(4096),
+  ADD COLUMN colors VARBINARY(64),
+  ADD COLUMN ranking_version CHAR(12),
+  ADD INDEX idx_answers_ranking_version (ranking_version)
+"""
+
+# Rankings hold action codes since, which need more room than the action indices
+RANKING_LENGTH = 4096
+WIDEN_RANKING_SQL = f"ALTER TABLE {SOURCE_TABLE} MODIFY COLUMN ranking VARBINARY({RANKING_LENGTH})"
+
+def column_length(conn, table, column):
+    """Maximum length of a column of the current database, None if it has none."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT character_maximum_length FROM information_schema.columns "
+                   "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+                   (table, column))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+def has_column(conn, table, column):
+    """Whether a table of the current database has a column."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM information_schema.columns "
+                   "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+                   (table, column))
+    (n_columns,) = cursor.fetchone()
+    cursor.close()
+    return n_columns > 0
+
+def is_migrated(conn):
+    """Whether `answers` already has the compact schema."""
+    return not has_column(conn, SOURCE_TABLE, 'q1')
+
+def copy_rows(conn, batch_size, pause):
+    """Copy the existing rows in primary key chunks.
+
+    Args:
+        conn: MySQL connection
+        batch_size (int): Primary key range per chunk
+        pause (float): Seconds to sleep between chunks, to limit the load
+
+    Returns:
+        int: Number of rows inserted by the copy
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {SOURCE_TABLE}")
+    min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        logging.info("Source table is empty, nothing to copy")
+        return 0
+
+    copied = 0
+    start_time = time.perf_counter()
+    sql = copy_chunk_sql()
+    for start in range(min_id - 1, max_id, batch_size):
+        cursor.execute(sql, (start, start + batch_size))
+        conn.commit()
+        copied += cursor.rowcount
+        done = min(start + batch_size, max_id) - min_id + 1
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Copied up to id {start + batch_size} ({100 * done / (max_id - min_id + 1):.1f}%, "
+                     f"{copied / elapsed:.0f} rows/s)")
+        if pause:
+            time.sleep(pause)
+    cursor.close()
+    return copied
+
+def verify(conn, sample_size):
+    """Compare the source and target tables.
+
+    Args:
+        conn: MySQL connection
+        sample_size (int): Number of random rows to compare field by field
+
+    Returns:
+        list: Description of every mismatch found
+    """
+    cursor = conn.cursor(dictionary=True)
+    mismatches = []
+
+    cursor.execute(f"SELECT COUNT(*) AS n FROM {SOURCE_TABLE}")
+    n_source = cursor.fetchone()['n']
+    cursor.execute(f"SELECT COUNT(*) AS n FROM {TARGET_TABLE}")
+    n_target = cursor.fetchone()['n']
+    if n_source != n_target:
+        mismatches.append(f"row count {n_source} != {n_target}")
+
+    cursor.execute(f"SELECT MIN(id) AS lo, MAX(id) AS hi FROM {SOURCE_TABLE}")
+    bounds = cursor.fetchone()
+    if bounds['lo'] is not None:
+        ids = [random.randint(bounds['lo'], bounds['hi']) for _ in range(sample_size)]
+        for row_id in ids:
+            cursor.execute(f"SELECT * FROM {SOURCE_TABLE} WHERE id = %s", (row_id,))
+            source = cursor.fetchone()
+            cursor.execute(f"SELECT {SELECT_COLUMNS} FROM {TARGET_TABLE} WHERE id = %s", (row_id,))
+            target = decode_answers(cursor.fetchone())
+            if source is None and target is None:
+                continue
+            if source is None or target is None:
+                mismatches.append(f"id {row_id} only in one table")
+                continue
+            for field in QUESTION_FIELDS:
+                if source[field] != target[field] and source[field] in ('Yes', 'No', None):
+                    mismatches.append(f"id {row_id} {field}: {source[field]!r} != {target[field]!r}")
+            for field in PREFERENCE_FIELDS:
+                expected = source[field].strip() if source[field] is not None else None
+                expected = int(expected) if expected in {str(l) for l in PREFERENCE_LEVELS} else None
+                if expected != target[field]:
+                    mismatches.append(f"id {row_id} {field}: {source[field]!r} != {target[field]!r}")
+    cursor.close()
+    return mismatches
+
+def swap_tables(conn, drop_old):
+    """Swap the tables atomically and remove the triggers."""
+    cursor = conn.cursor()
+    cursor.execute(f"RENAME TABLE {SOURCE_TABLE} TO {OLD_TABLE}, {TARGET_TABLE} TO {SOURCE_TABLE}")
+    for statement in drop_trigger_statements():
+        cursor.execute(statement)
+    if drop_old:
+        cursor.execute(f"DROP TABLE {OLD_TABLE}")
+    conn.commit()
+    cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the answers table to the "
+                                     "compact schema while the app is running.")
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help="Primary key range copied per chunk. Defaults to 10000")
+    parser.add_argument('--pause', type=float, default=0.0,
+                        help="Seconds to sleep between chunks. Defaults to 0")
+    parser.add_argument('--verify-sample', type=int, default=1000,
+                        help="Random rows compared after the copy. Defaults to 1000")
+    parser.add_argument('--swap', action='store_true',
+                        help="Swap the tables after a successful verification")
+    parser.add_argument('--drop-old', action='store_true',
+                        help="Drop the old table after the swap")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only print the SQL statements")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if args.dry_run:
+        for statement in [CREATE_TARGET_SQL.strip(), *trigger_statements(), copy_chunk_sql()]:
+            print(statement + ";\n")
+        return
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        if is_migrated(conn):
+            if has_column(conn, SOURCE_TABLE, 'ranking_version'):
+                if (column_length(conn, SOURCE_TABLE, 'ranking') or 0) < RANKING_LENGTH:
+                    cursor = conn.cursor()
+                    cursor.execute(WIDEN_RANKING_SQL)
+                    conn.commit()
+                    cursor.close()
+                    logging.info(f"Widened the ranking column of '{SOURCE_TABLE}'")
+                else:
+                    logging.info(f"'{SOURCE_TABLE}' already has the compact schema, nothing to do")
+            else:
+                cursor = conn.cursor()
+                cursor.execute(ADD_RESULT_COLUMNS_SQL)
+                conn.commit()
+                cursor.close()
+                logging.info(f"Added the result columns to '{SOURCE_TABLE}'")
+            return
+
+        cursor = conn.cursor()
+        cursor.execute(CREATE_TARGET_SQL)
+        for statement in drop_trigger_statements() + trigger_statements():
+            cursor.execute(statement)
+        conn.commit()
+        cursor.close()
+        logging.info(f"Created '{TARGET_TABLE}' and the sync triggers")
+
+        copied = copy_rows(conn, args.batch_size, args.pause)
+        logging.info(f"Copied {copied} rows")
+
+        mismatches = verify(conn, args.verify_sample)
+        if mismatches:
+            for mismatch in mismatches[:20]:
+                logging.error(mismatch)
+            logging.error(f"Verification failed ({len(mismatches)} mismatches), tables not swapped")
+            sys.exit(1)
+        logging.info("Verification passed")
+
+        if args.swap:
+            swap_tables(conn, args.drop_old)
+            logging.info(f"Swapped tables, the old table is "
+                         f"{'dropped' if args.drop_old else f'kept as {OLD_TABLE}'}")
+        else:
+            logging.info("Triggers keep the tables in sync, rerun with --swap to switch over")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
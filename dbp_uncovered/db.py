@@ -1,12 +1,243 @@
-from mysql.connector import pooling
-from config import DB_CONFIG
+import os
+import time
+import logging
+import threading
 
-pool = pooling.MySQLConnectionPool(
-    pool_name     = "mypool",
-    pool_size     = 5,
-    **DB_CONFIG
-)
+import mysql.connector
+from config import DB_CONFIG, DB_POOL_CONFIG
+
+'''
+Database connection pool of the app.
+
+mysql.connector's own pool raises as soon as all its connections are in use,
+this pool makes a checkout wait (up to `timeout` seconds) for a connection to
+be returned instead. Connections are opened on demand up to `size`, checked
+with a ping when they have been idle for `ping_after` seconds and replaced
+once they are older than `recycle` seconds, so connections dropped by the
+server (wait_timeout) or a proxy are not handed out.
+
+The pool belongs to the process that created it: it is created on the first
+get_connection(), and a forked worker (i.e. gunicorn with preload) creates its
+own instead of sharing the parent's sockets. The size, timeout, recycle and
+ping settings are read from the DB_POOL_* variables in .env, see config.py.
+
+Connections are returned to the pool with conn.close(), as with
+mysql.connector's pool.
+'''
+
+class PoolExhausted(RuntimeError):
+    """No connection became available within the checkout timeout.
+
+    Not a mysql.connector.Error, so the routes' database error handling lets
+    it through to the app's 503 handler.
+    """
+
+class PooledConnection:
+    """A checked out connection of the pool, returned to it on close().
+
+    Everything else is passed on to the mysql.connector connection.
+    """
+
+    def __init__(self, pool, cnx, created_at, statements=None):
+        self._pool = pool
+        self._cnx = cnx
+        self.created_at = created_at
+        self.statements = {} if statements is None else statements
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def prepared(self, sql):
+        """Prepared statement cursor (dictionary rows) for a query.
+
+        The cursors are kept with the connection, so a query is prepared on
+        the server once per connection and reused by later checkouts. Pass
+        the same str object for the same query.
+        """
+        cursor = self.statements.get(sql)
+        if cursor is None:
+            cursor = self.statements[sql] = self._cnx.cursor(prepared=True, dictionary=True)
+        return cursor
+
+    def close(self):
+        # Closing twice must not return a connection someone else checked out
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.put(self._cnx, self.created_at, self.statements)
+
+class ConnectionPool:
+    """Blocking pool of MySQL connections with health checks and counters.
+
+    Args:
+        size (int, optional): Maximum number of connections. Defaults to 5.
+        timeout (float, optional): Seconds a checkout waits for a connection.
+        Defaults to 5.
+        recycle (float, optional): Seconds after which a connection is
+        replaced, 0 to never. Defaults to 1800.
+        ping_after (float, optional): Seconds idle after which a connection
+        is pinged before checkout, 0 to always. Defaults to 30.
+        connect (callable, optional): Opens a connection. Defaults to
+        mysql.connector.connect with DB_CONFIG.
+    """
+
+    def __init__(self, size=5, timeout=5.0, recycle=1800.0, ping_after=30.0, connect=None):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.connect = connect or (lambda: mysql.connector.connect(**DB_CONFIG))
+        self.pid = os.getpid()
+
+        self._idle = []
+        self._n_open = 0
+        self._condition = threading.Condition()
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'wait_seconds_total': 0.0,
+                       'wait_seconds_max': 0.0, 'opened': 0, 'recycled': 0,
+                       'failed_pings': 0, 'in_use_max': 0}
+
+    def get_connection(self, timeout=None):
+        """Check out a connection, waiting for one if all are in use.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to the pool's.
+
+        Raises:
+            PoolExhausted: If no connection became available in time
+
+        Returns:
+            PooledConnection: The connection, conn.close() returns it
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._condition:
+            while not self._idle and self._n_open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if not self._idle and self._n_open >= self.size:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhausted(f"No database connection available within "
+                                            f"{timeout:g} s (pool size {self.size})")
+            idle = self._idle.pop() if self._idle else None
+            if idle is None:
+                # Reserve the slot, the connection is opened outside the lock
+                self._n_open += 1
+            wait = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds_total'] += wait
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], wait)
+            self._stats['in_use_max'] = max(self._stats['in_use_max'], self.in_use)
+
+        try:
+            conn = self._check(*idle) if idle is not None else None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._condition:
+                self._n_open -= 1
+                self._condition.notify()
+            raise
+        return conn
+
+    def put(self, cnx, created_at, statements=None):
+        """Return a connection to the pool, discarding it if it is broken."""
+        try:
+            if cnx.in_transaction:
+                # Uncommitted work of the last user is not carried over
+                cnx.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+            self._discard(cnx)
+
+        with self._condition:
+            if healthy:
+                self._idle.append((cnx, created_at, time.monotonic(), statements))
+            else:
+                self._n_open -= 1
+            self._condition.notify()
+
+    def _open(self):
+        cnx = self.connect()
+        with self._condition:
+            self._stats['opened'] += 1
+        return PooledConnection(self, cnx, time.monotonic())
+
+    def _check(self, cnx, created_at, last_used, statements):
+        """Check out an idle connection, None if it had to be discarded."""
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            with self._condition:
+                self._stats['recycled'] += 1
+            self._discard(cnx)
+            return None
+        if now - last_used >= self.ping_after:
+            try:
+                cnx.ping(reconnect=False)
+            except Exception as e:
+                logging.warning(f"Discarding a broken database connection: {e}")
+                with self._condition:
+                    self._stats['failed_pings'] += 1
+                self._discard(cnx)
+                return None
+        return PooledConnection(self, cnx, created_at, statements)
+
+    def _discard(self, cnx):
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    @property
+    def in_use(self):
+        return self._n_open - len(self._idle)
+
+    def stats(self):
+        """Counters of the pool.
+
+        Returns:
+            Dict: size, open, in_use and idle connections, checkouts, timeouts,
+            total and maximum checkout wait in seconds, opened and recycled
+            connections, failed pings and the most connections in use
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({'size': self.size, 'open': self._n_open, 'in_use': self.in_use,
+                          'idle': len(self._idle)})
+        return stats
+
+    def close(self):
+        """Close the idle connections."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._n_open -= len(idle)
+        for cnx, *_ in idle:
+            self._discard(cnx)
+
+pool = None
+pool_lock = threading.Lock()
+
+def get_pool():
+    global pool
+    if pool is None or pool.pid != os.getpid():
+        with pool_lock:
+            if pool is None or pool.pid != os.getpid():
+                pool = ConnectionPool(**DB_POOL_CONFIG)
+    return pool
+
+def reset_pool():
+    """Forget the pool, i.e. in a forked child, without closing its connections."""
+    global pool, pool_lock
+    pool = None
+    pool_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_pool)
 
 def get_connection():
-    
-    return pool.get_connection()
\ No newline at end of file
+
+    return get_pool().get_connection()
+
+def pool_stats():
+    """Counters of this process' pool, None before the first connection."""
+    return pool.stats() if pool is not None and pool.pid == os.getpid() else None
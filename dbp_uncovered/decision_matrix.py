@@ -0,0 +1,344 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from topsis import check_data
+from metrics import timed
+
+'''
+Process-level store for the TOPSIS decision matrix.
+
+The decision matrix (xlsx) is parsed, checked and validated once per process
+instead of on every results request. On each access the store only stats the
+file; the workbook is parsed again when its mtime has changed *and* its content
+hash differs from the loaded copy.
+
+Every loaded copy carries a version id (prefix of the content hash) so caches
+derived from the decision matrix know when they have to be rebuilt.
+
+The checked matrix is also compiled into a binary file next to the xlsx, which
+every (gunicorn worker) process memory-maps read-only. All processes then share
+one physical copy of the values and loading takes no parsing. What is derived
+from it is not shared: a TopsisModel keeps its own `data` (the columns of its
+settings, with the action tiers mapped) and normalised `norm` arrays in every
+process, two float64 arrays of the matrix size per model. The xlsx stays
+the source of truth: the compiled file records the hash of the xlsx it was
+built from and is rebuilt when stale, i.e.,
+
+python decision_matrix.py ./input/input_data_topsis_IQR_merge-DBP_all-DBP.xlsx
+
+compiles it explicitly.
+'''
+
+# Columns that are never used in the TOPSIS analysis
+DROP_COLUMNS = ("all_Other",)
+
+# Compiled decision matrix file layout: magic, format version, header length,
+# JSON header, padding to DATA_ALIGNMENT, then the float64 values in C order
+COMPILED_MAGIC = b"DBPMAT\0\0"
+COMPILED_FORMAT_VERSION = 1
+COMPILED_SUFFIX = ".dbpmat"
+DATA_ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+def file_sha256(filename):
+    """Calculate the SHA-256 hex digest of a file's content.
+
+    Args:
+        filename (str): Path to the file
+
+    Returns:
+        str: Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def validate_decision_matrix(input_df):
+    """Validate a decision matrix before it is used in the TOPSIS analysis.
+
+    Args:
+        input_df (DataFrame): Dataframe containing the TOPSIS input data
+
+    Raises:
+        ValueError: If the matrix is empty, has duplicate actions, non-numeric
+        columns or missing values.
+    """
+    if input_df.empty:
+        raise ValueError("Decision matrix is empty")
+
+    if not input_df.index.is_unique:
+        duplicates = list(input_df.index[input_df.index.duplicated()])
+        raise ValueError(f"Decision matrix contains duplicate actions: {duplicates}")
+
+    non_numeric = [col for col in input_df.columns
+                   if not pd.api.types.is_numeric_dtype(input_df[col])]
+    if non_numeric:
+        raise ValueError(f"Decision matrix contains non-numeric columns: {non_numeric}")
+
+    if not np.isfinite(input_df.to_numpy(dtype=np.float64)).all():
+        raise ValueError("Decision matrix contains missing or infinite values")
+
+def load_decision_matrix(input_filename):
+    """Load, check and validate a decision matrix xlsx file.
+
+    Args:
+        input_filename (str): Path to the decision matrix xlsx file
+
+    Returns:
+        DataFrame: The checked decision matrix, indexed by action code
+    """
+    with timed('read_xlsx'):
+        input_df = pd.read_excel(input_filename, index_col = [0])
+    input_df = input_df.drop(columns=list(DROP_COLUMNS), errors="ignore")
+
+    # Check the data for zero columns (i.e., all entries zero)
+    input_df = check_data(input_df, map_acronyms = False)
+    validate_decision_matrix(input_df)
+
+    return input_df
+
+def criterion_metadata(column, adjusted):
+    """Describe a decision matrix column for the compiled file header.
+
+    Args:
+        column (str): Column name, i.e. 'all_THM' or 'cost_tier'
+        adjusted (bool): Whether check_data added 1 to the column
+
+    Returns:
+        Dict: Metadata of the criterion
+    """
+    if column.startswith(("all_", "positive_", "negative_", "other_")):
+        effect, dbp = column.split('_', 1)
+        return {'name': column, 'kind': 'DBP', 'effect': effect, 'dbp': dbp, 
+                'adjusted': adjusted}
+    return {'name': column, 'kind': 'tier', 'adjusted': adjusted}
+
+def compiled_filename_for(input_filename):
+    """Path of the compiled binary file belonging to a decision matrix xlsx."""
+    return os.path.splitext(input_filename)[0] + COMPILED_SUFFIX
+
+def compile_decision_matrix(input_filename, compiled_filename=None, sha256=None):
+    """Convert a decision matrix xlsx into the versioned binary format.
+
+    The file is written to a temporary name and moved into place, so processes
+    compiling at the same time never see a partial file.
+
+    Args:
+        input_filename (str): Path to the decision matrix xlsx file
+        compiled_filename (str, optional): Output path. Defaults to the xlsx
+        path with the COMPILED_SUFFIX extension.
+        sha256 (str, optional): Hash of the xlsx, if already known
+
+    Returns:
+        str: Path of the compiled file
+    """
+    if compiled_filename is None:
+        compiled_filename = compiled_filename_for(input_filename)
+    if sha256 is None:
+        sha256 = file_sha256(input_filename)
+    
+    with timed('read_xlsx'):
+        raw_df = pd.read_excel(input_filename, index_col = [0])
+    raw_df = raw_df.drop(columns=list(DROP_COLUMNS), errors="ignore")
+    adjusted = set(raw_df.columns[(raw_df == 0).all()])
+    input_df = check_data(raw_df, map_acronyms = False)
+    validate_decision_matrix(input_df)
+    
+    values = np.ascontiguousarray(input_df.to_numpy(dtype='<f8'))
+    header = {
+        'source_file': os.path.basename(input_filename),
+        'source_sha256': sha256,
+        'shape': list(values.shape),
+        'dtype': values.dtype.str,
+        'index': [str(action) for action in input_df.index],
+        'columns': [str(col) for col in input_df.columns],
+        'criteria': [criterion_metadata(str(col), col in adjusted) for col in input_df.columns],
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = _PREAMBLE.size + len(header_bytes)
+    padding = -data_offset % DATA_ALIGNMENT
+    
+    tmp_filename = f"{compiled_filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_filename, 'wb') as file:
+            file.write(_PREAMBLE.pack(COMPILED_MAGIC, COMPILED_FORMAT_VERSION, 
+                                      len(header_bytes) + padding))
+            file.write(header_bytes + b' ' * padding)
+            file.write(values.tobytes())
+        os.replace(tmp_filename, compiled_filename)
+    finally:
+        # Left behind only if the write or the move failed, i.e. a full disk
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+    
+    logging.info(f"Decision matrix compiled to '{compiled_filename}' (version {sha256[:12]})")
+    return compiled_filename
+
+def read_compiled_header(compiled_filename):
+    """Read the header of a compiled decision matrix file.
+
+    Args:
+        compiled_filename (str): Path of the compiled file
+
+    Returns:
+        [Dict, int]: The header, and the offset of the values in the file. 
+        The header is None if the file is missing or of another format version.
+    """
+    try:
+        with open(compiled_filename, 'rb') as file:
+            magic, version, header_length = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+            if magic != COMPILED_MAGIC or version != COMPILED_FORMAT_VERSION:
+                return None, 0
+            header = json.loads(file.read(header_length))
+    except (OSError, struct.error, ValueError):
+        return None, 0
+    return header, _PREAMBLE.size + header_length
+
+def load_compiled_matrix(compiled_filename):
+    """Memory-map a compiled decision matrix read-only.
+
+    Args:
+        compiled_filename (str): Path of the compiled file
+
+    Returns:
+        [DataFrame, Dict]: The decision matrix as a zero-copy view on the 
+        mapped file, and the file header
+    """
+    header, data_offset = read_compiled_header(compiled_filename)
+    if header is None:
+        raise ValueError(f"'{compiled_filename}' is not a compiled decision matrix "
+                         f"of format version {COMPILED_FORMAT_VERSION}")
+    
+    values = np.memmap(compiled_filename, dtype=np.dtype(header['dtype']), mode='r', 
+                       offset=data_offset, shape=tuple(header['shape']))
+    input_df = pd.DataFrame(values, index=header['index'], columns=header['columns'], 
+                            copy=False)
+    return input_df, header
+
+def load_or_compile_matrix(input_filename, sha256=None):
+    """Load the compiled binary version of a decision matrix, (re)compiling it
+    first when it is missing or was built from another version of the xlsx.
+
+    Args:
+        input_filename (str): Path to the decision matrix xlsx file
+        sha256 (str, optional): Hash of the xlsx, if already known
+
+    Returns:
+        DataFrame: The checked decision matrix, memory-mapped read-only
+    """
+    if sha256 is None:
+        sha256 = file_sha256(input_filename)
+    compiled_filename = compiled_filename_for(input_filename)
+    
+    header, _ = read_compiled_header(compiled_filename)
+    if header is None or header['source_sha256'] != sha256:
+        try:
+            compile_decision_matrix(input_filename, compiled_filename, sha256)
+        except OSError as e:
+            # i.e. a read-only deployment, fall back to parsing the xlsx
+            logging.warning(f"Could not write '{compiled_filename}': {e}")
+            return load_decision_matrix(input_filename)
+    
+    input_df, _ = load_compiled_matrix(compiled_filename)
+    return input_df
+
+class DecisionMatrixStore:
+    """Holds the checked decision matrix of one xlsx file for the lifetime of
+    the process and reloads it only when the file content changes.
+
+    The dataframe returned by get() is shared between requests and must be
+    treated as read-only. With `use_compiled` (the default) it is a view on 
+    the memory-mapped compiled file.
+    """
+
+    def __init__(self, input_filename, use_compiled=True):
+        self.input_filename = os.path.abspath(input_filename)
+        self.use_compiled = use_compiled
+        self._lock = threading.Lock()
+        self._df = None
+        self._sha256 = None
+        self._stat_key = None
+        self.reload_count = 0
+        self._refresh()
+
+    @property
+    def version(self):
+        """Version id of the currently loaded decision matrix."""
+        self._refresh()
+        return self._sha256[:12]
+
+    def get(self):
+        """Return the current decision matrix, reloading it if the file changed.
+
+        Returns:
+            DataFrame: The checked decision matrix
+        """
+        self._refresh()
+        return self._df
+
+    def get_versioned(self):
+        """Return the current decision matrix together with its version id.
+
+        Returns:
+            [DataFrame, str]: The checked decision matrix and its version id
+        """
+        self._refresh()
+        with self._lock:
+            return self._df, self._sha256[:12]
+
+    def _refresh(self):
+        stat = os.stat(self.input_filename)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return
+
+        with self._lock:
+            if stat_key == self._stat_key:
+                return
+
+            sha256 = file_sha256(self.input_filename)
+            if sha256 != self._sha256:
+                with timed('load_matrix'):
+                    if self.use_compiled:
+                        self._df = load_or_compile_matrix(self.input_filename, sha256)
+                    else:
+                        self._df = load_decision_matrix(self.input_filename)
+                self._sha256 = sha256
+                self.reload_count += 1
+                logging.info(f"Decision matrix loaded from '{self.input_filename}' "
+                             f"(version {sha256[:12]})")
+            self._stat_key = stat_key
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(input_filename):
+    """Return the process-wide store for a decision matrix file, creating (and
+    loading) it on first use.
+
+    Args:
+        input_filename (str): Path to the decision matrix xlsx file
+
+    Returns:
+        DecisionMatrixStore: The store for the given file
+    """
+    key = os.path.abspath(input_filename)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = DecisionMatrixStore(key)
+        return _stores[key]
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    for input_filename in sys.argv[1:]:
+        compile_decision_matrix(input_filename)
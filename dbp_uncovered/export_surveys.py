@@ -0,0 +1,210 @@
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+import mysql.connector
+
+from survey_codec import QUESTION_FIELDS, PREFERENCE_FIELDS, SELECT_COLUMNS, decode_answers
+
+'''
+Streaming export of the survey answers for analysis, i.e.,
+
+python export_surveys.py -o ./output/surveys.parquet --top-k 5
+
+All rows of the `answers` table, joined with the registration time of their
+user, are streamed from the database through a server-side (unbuffered)
+cursor and written chunk by chunk, so the memory use only depends on
+--chunk-size, not on the size of the table. The answers are decoded into one
+column per question (Yes/No/empty) and preference (1-5).
+
+Output is Parquet (one row group per chunk) if pyarrow is installed and CSV
+otherwise, or as chosen with --format. With --top-k the k best actions of each
+survey under the current model are added as columns top_1 ... top_k, ranked
+in chunks with the same vectorized TOPSIS as rerank_surveys.py.
+
+The file is written under a temporary name and renamed when complete. Run it
+from the dbp_uncovered directory, it uses the DB_* settings in .env.
+'''
+
+FORMATS = ('auto', 'csv', 'parquet')
+
+def select_sql():
+    """Query streaming all surveys with the registration time of their user."""
+    columns = ", ".join(f"a.{column.strip()}" for column in SELECT_COLUMNS.split(","))
+    return (f"SELECT {columns}, u.created_at AS user_created_at FROM answers a "
+            f"LEFT JOIN users u ON u.id = a.user_id ORDER BY a.id")
+
+def export_columns(top_k=0):
+    """Columns of the export, in output order."""
+    return (['id', 'user_id', 'user_created_at', 'answered_at'] + list(QUESTION_FIELDS)
+            + list(PREFERENCE_FIELDS) + [f"top_{i}" for i in range(1, top_k + 1)])
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class CsvChunkWriter:
+    """Writes chunks of rows to a CSV file with a header."""
+
+    def __init__(self, filename, columns):
+        self.columns = columns
+        self.file = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows([row.get(column) for column in self.columns] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetChunkWriter:
+    """Writes chunks of rows to a Parquet file, one row group per chunk."""
+
+    def __init__(self, filename, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {'id': pa.int64(), 'user_id': pa.int64(),
+                 'user_created_at': pa.timestamp('us'), 'answered_at': pa.timestamp('us')}
+        types.update({field: pa.int8() for field in PREFERENCE_FIELDS})
+        # Fixed schema, so chunks with only NULLs in a column still match
+        self.schema = pa.schema([(column, types.get(column, pa.string())) for column in columns])
+        self.pa = pa
+        self.writer = pq.ParquetWriter(filename, self.schema, compression='snappy')
+
+    def write(self, rows):
+        table = self.pa.Table.from_pydict(
+            {column: [row.get(column) for row in rows] for column in self.schema.names},
+            schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+WRITERS = {'csv': CsvChunkWriter, 'parquet': ParquetChunkWriter}
+
+def add_top_k(reranker, user_responses, top_k):
+    """Add the codes of the top-k actions (top_1 ... top_k) to each survey.
+
+    Surveys with incomplete preferences get empty top-k columns.
+    """
+    weights = [reranker.weights(user_response) for user_response in user_responses]
+    ranked = [user_response for user_response, w in zip(user_responses, weights)
+              if w is not None]
+    if not ranked:
+        return
+    order = reranker.model.rank_indices(np.array([w for w in weights if w is not None]),
+                                        k=top_k)
+    actions = reranker.model.actions
+    for user_response, indices in zip(ranked, order.tolist()):
+        for position, index in enumerate(indices, start=1):
+            user_response[f"top_{position}"] = actions[index]
+
+def run_export(conn, writer, reranker=None, top_k=0, chunk_size=10000, limit=None):
+    """Stream all surveys into a chunk writer.
+
+    Args:
+        conn: Connection the surveys are streamed from
+        writer (CsvChunkWriter | ParquetChunkWriter): Output
+        reranker (Reranker, optional): Ranks with the current model, required
+        for top_k
+        top_k (int, optional): Number of recommended actions to add. Defaults to 0.
+        chunk_size (int, optional): Surveys per chunk. Defaults to 10000.
+        limit (int, optional): Stop after this many surveys
+
+    Returns:
+        Dict: Summary of the export
+    """
+    # Unbuffered: rows are fetched from the server chunk by chunk
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    cursor.execute(select_sql())
+
+    exported = 0
+    start_time = time.perf_counter()
+    try:
+        while limit is None or exported < limit:
+            rows = cursor.fetchmany(chunk_size if limit is None
+                                    else min(chunk_size, limit - exported))
+            if not rows:
+                break
+            user_responses = [decode_answers(row) for row in rows]
+            if top_k:
+                add_top_k(reranker, user_responses, top_k)
+            writer.write(user_responses)
+
+            exported += len(rows)
+            elapsed = time.perf_counter() - start_time
+            logging.info(f"{exported} surveys up to id {user_responses[-1]['id']} "
+                         f"({exported / elapsed:.0f} surveys/s)")
+    finally:
+        try:
+            cursor.close()
+        except mysql.connector.Error as e:
+            # Rows left unread after --limit or an error, the connection is closed anyway
+            logging.warning(f"Could not close the survey cursor: {e}")
+
+    elapsed = time.perf_counter() - start_time
+    return {'surveys': exported, 'seconds': round(elapsed, 3),
+            'surveys_per_second': round(exported / elapsed, 1) if elapsed > 0 else None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export all surveys (and optionally their "
+                                     "recommended actions) for analysis.")
+    parser.add_argument('-o', '--output',
+                        help="Output file. Defaults to ./output/survey_export.<format>")
+    parser.add_argument('--format', choices=FORMATS, default='auto',
+                        help="Output format. Defaults to parquet if pyarrow is installed, "
+                        "csv otherwise")
+    parser.add_argument('-k', '--top-k', type=int, default=0,
+                        help="Add the codes of the k best actions of each survey. Defaults to 0")
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help="Surveys per chunk. Defaults to 10000")
+    parser.add_argument('--limit', type=int, help="Stop after this many surveys")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if args.top_k < 0:
+        parser.error("--top-k must not be negative")
+    output_format = args.format
+    if output_format == 'auto':
+        output_format = 'parquet' if parquet_available() else 'csv'
+    elif output_format == 'parquet' and not parquet_available():
+        parser.error("Parquet output requires pyarrow, use --format csv")
+    filename = args.output or f"./output/survey_export.{output_format}"
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+
+    from config import DB_CONFIG
+
+    reranker = None
+    if args.top_k:
+        from rerank_surveys import Reranker
+        reranker = Reranker()
+
+    tmp_filename = f"{filename}.tmp"
+    writer = WRITERS[output_format](tmp_filename, export_columns(args.top_k))
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        try:
+            summary = run_export(conn, writer, reranker, args.top_k, args.chunk_size, args.limit)
+        finally:
+            conn.close()
+            writer.close()
+        os.replace(tmp_filename, filename)
+    finally:
+        # Left behind only if the export or the move failed
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+    summary.update({'file': filename, 'format': output_format})
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import hashlib
+
+'''
+Recommendation results stored with each survey in the `answers` table.
+
+The answers of a survey never change after insert, so its ranked actions and
+their colors are computed once and stored in the row:
+
+- ranking: the ranked action codes, comma separated (i.e. b"BD,AC,...").
+  Codes rather than positions in the model's action list, so a result stays
+  readable after actions are added to or reordered in the decision matrix,
+- colors: a bitmask over the ranking positions, bit i set when the action at
+  position i is green,
+- ranking_version: the version of the decision matrix, TOPSIS settings and
+  action coloring content the result was computed with.
+
+A stored result is used as long as its version matches the current one, rows
+with another version are recomputed when they are read.
+'''
+
+# Bumped when the encoding of the stored results changes, so results stored
+# in another format get another version and are recomputed
+RESULT_FORMAT = "codes"
+CODE_SEPARATOR = ","
+
+# Columns of the answers table holding the stored result
+RESULT_COLUMNS = ('ranking', 'colors', 'ranking_version')
+
+def result_version(model_version, coloring_version):
+    """Version id of results computed with a TOPSIS model and action coloring.
+
+    Args:
+        model_version (str): TopsisModel.version (decision matrix and settings)
+        coloring_version (str): ActionColoring.version (mapping and relations)
+
+    Returns:
+        str: 12 character version id
+    """
+    return hashlib.sha256(f"{RESULT_FORMAT}:{model_version}:{coloring_version}"
+                          .encode()).hexdigest()[:12]
+
+def encode_ranking(codes):
+    """Encode ranked action codes for storage."""
+    if any(CODE_SEPARATOR in code for code in codes):
+        raise ValueError(f"Action codes must not contain '{CODE_SEPARATOR}'")
+    return CODE_SEPARATOR.join(codes).encode()
+
+def encode_colors(green):
+    mask = 0
+    for position, is_green in enumerate(green):
+        if is_green:
+            mask |= 1 << position
+    return mask.to_bytes((len(green) + 7) // 8, 'little')
+
+def encode_result(codes, green):
+    """Encode a ranking and its colors for storage.
+
+    Args:
+        codes (list): Action codes from best to worst
+        green (list): Whether the action at each position is green
+
+    Returns:
+        [bytes, bytes]: The encoded ranking and colors
+    """
+    return encode_ranking(codes), encode_colors(green)
+
+def decode_result(ranking, colors):
+    """Decode a stored ranking and its colors.
+
+    Args:
+        ranking (bytes): The encoded ranking
+        colors (bytes): The encoded colors
+
+    Returns:
+        [list, list]: Action codes from best to worst and whether the action
+        at each position is green, or [None, None] if there is no stored
+        result or it is not in this format
+    """
+    if not ranking or colors is None:
+        return None, None
+    try:
+        codes = bytes(ranking).decode().split(CODE_SEPARATOR)
+    except UnicodeDecodeError:
+        return None, None
+    if len(set(codes)) != len(codes) or len(colors) != (len(codes) + 7) // 8:
+        return None, None
+    mask = int.from_bytes(bytes(colors), 'little')
+    green = [mask >> position & 1 == 1 for position in range(len(codes))]
+    return codes, green
+
+def encode_results(codes, green):
+    """Encode the rankings and colors of many surveys at once.
+
+    Args:
+        codes (ndarray): Action codes from best to worst (N x n_actions)
+        green (ndarray): Whether the action at each position is green
+        (N x n_actions)
+
+    Returns:
+        [list, list]: The encoded rankings and colors, as encode_result
+    """
+    import numpy as np
+
+    colors = np.packbits(np.asarray(green, dtype=bool), axis=1, bitorder='little')
+    return ([encode_ranking(row) for row in np.asarray(codes).tolist()],
+            [row.tobytes() for row in colors])
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import bisect
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from config import METRICS_CONFIG
+
+'''
+In-process metrics of the app, exposed in the Prometheus text format at
+/metrics.
+
+- dbp_http_requests_total and dbp_http_request_duration_seconds: requests by
+  route (the URL rule, i.e. /survey-result/<int:survey_id>), method and status
+- dbp_stage_duration_seconds: the stages of the ranking path, i.e. reading
+  the decision matrix, check_data, distribute_DBP_weights, check_criteria,
+  do_TOPSIS, ranking and coloring a survey and rendering the template
+- dbp_db_query_duration_seconds: database statements by operation (select,
+  insert, update), and the connection pool counters of db.py
+
+A stage is timed with `with timed("stage"):` or the `@timed("stage")`
+decorator. Recording a sample is a dict lookup and a bisect under a lock,
+a few microseconds, so the metrics stay on in production.
+
+Every process counts for itself. With several gunicorn workers set
+METRICS_DIR to a directory shared by them (emptied before the server starts):
+each worker then writes its counts to a file there, at most every
+METRICS_FLUSH_INTERVAL seconds after a request and when it exits, and /metrics
+adds up the files of all workers, so it shows the totals whichever worker
+answers. Counters of exited workers are kept, the pool gauges only count
+running workers.
+'''
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'dbp_http_requests_total':
+        ('counter', "Requests by route, method and status.", None),
+    'dbp_http_request_duration_seconds':
+        ('histogram', "Request latency by route and method.", REQUEST_BUCKETS),
+    'dbp_stage_duration_seconds':
+        ('histogram', "Time spent in the stages of the ranking path.", STAGE_BUCKETS),
+    'dbp_db_query_duration_seconds':
+        ('histogram', "Database statements by operation.", QUERY_BUCKETS),
+    'dbp_db_pool_checkouts_total':
+        ('counter', "Connections checked out of the pool.", None),
+    'dbp_db_pool_timeouts_total':
+        ('counter', "Checkouts that gave up waiting for a connection.", None),
+    'dbp_db_pool_wait_seconds_total':
+        ('counter', "Time spent waiting for a pooled connection.", None),
+    'dbp_db_pool_connections':
+        ('gauge', "Open connections of the pool by state.", None),
+}
+
+class Registry:
+    """Counters, gauges and histograms of one process."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        # Name of the file of this process in METRICS_DIR, unique even if a pid is reused
+        self.file_id = f"{self.pid}_{time.time_ns()}"
+        self._lock = threading.Lock()
+        self._counters = {}
+        # (name, labels): [count per bucket..., +Inf count, sum]
+        self._histograms = {}
+        self.last_flush = time.monotonic()
+        self.flush_lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        """The samples as JSON-serializable lists of [name, labels, value(s)]."""
+        with self._lock:
+            counters = [[name, list(labels), value]
+                        for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(values)]
+                          for (name, labels), values in self._histograms.items()]
+        counters.extend([name, list(labels), value]
+                        for name, labels, value in pool_samples('counter'))
+        return {'pid': self.pid, 'counters': counters, 'histograms': histograms,
+                'gauges': [[name, list(labels), value]
+                           for name, labels, value in pool_samples('gauge')]}
+
+registry = Registry()
+
+def reset_registry():
+    """Start counting anew, i.e. in a forked worker, so the parent's counts are not added twice."""
+    global registry
+    registry = Registry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_registry)
+
+@contextmanager
+def timed(stage):
+    """Time a stage of the ranking path, as a context manager or decorator."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('dbp_stage_duration_seconds', (('stage', stage),),
+                         time.perf_counter() - start)
+
+def observe_query(sql, seconds):
+    """Record a database statement, labelled by its first keyword."""
+    operation = sql.lstrip().split(None, 1)[0].lower() if sql else 'unknown'
+    registry.observe('dbp_db_query_duration_seconds', (('operation', operation),), seconds)
+
+def pool_samples(kind):
+    """Samples of the database pool of this process (counters or gauges)."""
+    from db import pool_stats
+
+    stats = pool_stats()
+    if stats is None:
+        return []
+    if kind == 'counter':
+        return [('dbp_db_pool_checkouts_total', (), stats['checkouts']),
+                ('dbp_db_pool_timeouts_total', (), stats['timeouts']),
+                ('dbp_db_pool_wait_seconds_total', (), stats['wait_seconds_total'])]
+    return [('dbp_db_pool_connections', (('state', state),), stats[state])
+            for state in ('in_use', 'idle', 'open')]
+
+def flush():
+    """Write the counts of this process to METRICS_DIR."""
+    if not METRICS_CONFIG['dir']:
+        return
+    current = registry
+    if not current.flush_lock.acquire(blocking=False):
+        # Another request thread is writing them right now
+        return
+    try:
+        current.last_flush = time.monotonic()
+        filename = os.path.join(METRICS_CONFIG['dir'], f"metrics_{current.file_id}.json")
+        with open(filename + ".tmp", 'w') as file:
+            json.dump(current.snapshot(), file)
+        os.replace(filename + ".tmp", filename)
+    except OSError as e:
+        logging.warning(f"Could not write the metrics to '{METRICS_CONFIG['dir']}': {e}")
+    finally:
+        current.flush_lock.release()
+
+def maybe_flush():
+    if (METRICS_CONFIG['dir']
+            and time.monotonic() - registry.last_flush >= METRICS_CONFIG['flush_interval']):
+        flush()
+
+def pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def snapshots():
+    """Snapshots of this process and, with METRICS_DIR, of all the other workers."""
+    own = registry.snapshot()
+    result = [own]
+    directory = METRICS_CONFIG['dir']
+    if not directory:
+        return result
+    own_file = f"metrics_{registry.file_id}.json"
+    for filename in os.listdir(directory):
+        if (not filename.startswith("metrics_") or not filename.endswith(".json")
+                or filename == own_file):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if not pid_running(snapshot['pid']) or snapshot['pid'] == own['pid']:
+            # Gauges of exited workers are gone, their counters stay
+            snapshot['gauges'] = []
+        result.append(snapshot)
+    return result
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+def render(snapshot_list):
+    """Add up snapshots into the Prometheus text exposition format."""
+    values = {}
+    for snapshot in snapshot_list:
+        for kind in ('counters', 'gauges'):
+            for name, labels, value in snapshot[kind]:
+                key = (name, tuple(map(tuple, labels)))
+                values[key] = values.get(key, 0) + value
+        for name, labels, histogram in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = values.setdefault(key, [0] * len(histogram))
+            for i, value in enumerate(histogram):
+                total[i] += value
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        samples = sorted((labels, value) for (metric, labels), value in values.items()
+                         if metric == name)
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if kind != 'histogram':
+                lines.append(f"{name}{format_labels(labels)} {value:g}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*map("{:g}".format, buckets), "+Inf"), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-1]:g}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def init_app(app):
+    """Time every request of the app and its templates, and serve /metrics."""
+    from flask import g, request, before_render_template, template_rendered
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            registry.inc('dbp_http_requests_total', (('route', route), ('method', request.method),
+                                                     ('status', str(response.status_code))))
+            registry.observe('dbp_http_request_duration_seconds',
+                             (('route', route), ('method', request.method)),
+                             time.perf_counter() - start)
+        return response
+
+    @app.teardown_request
+    def flush_metrics(exception=None):
+        maybe_flush()
+
+    def start_render(sender, template, context, **extra):
+        g.metrics_render_start = time.perf_counter()
+
+    def end_render(sender, template, context, **extra):
+        start = g.pop('metrics_render_start', None)
+        if start is not None:
+            registry.observe('dbp_stage_duration_seconds', (('stage', 'render_template'),),
+                             time.perf_counter() - start)
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(end_render, app, weak=False)
+
+    # The last counts of a worker, i.e. when gunicorn restarts it
+    atexit.register(flush)
+
+    @app.route('/metrics')
+    def metrics():
+        return render(snapshots()), 200, {'Content-Type': CONTENT_TYPE}
@@ -0,0 +1,194 @@
+import os
+import logging
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import PASSWORD_HASH_CONFIG
+
+'''
+Password hashing and verification off the request threads.
+
+Werkzeug's password hashes (scrypt, pbkdf2) are deliberately slow, so a burst
+of logins keeps every request thread of a worker busy and the static pages
+wait. Here they run in a small process pool instead, with a bound on the
+hashes that may wait for it: when `workers + queue_depth` hashes are pending,
+a new one fails at once with HashingBusy (the app answers 503) instead of
+queueing behind them.
+
+The hash method is configurable (i.e. "scrypt:32768:8:1" or
+"pbkdf2:sha256:600000", see werkzeug.security.generate_password_hash).
+Verifying a password whose stored hash was made with other parameters also
+returns a new hash with the current ones, which the login stores, so changing
+the method upgrades the hashes of the users as they log in.
+
+The pool belongs to the process that created it, as the database pool in
+db.py. The settings are read from the PASSWORD_HASH_* variables in .env, see
+config.py; with workers = 0 the hashes are computed inline.
+'''
+
+class HashingBusy(Exception):
+    """Too many password hashes are pending, or one did not finish (in time)."""
+
+@functools.lru_cache(maxsize=None)
+def method_prefix(method):
+    """The parameters a hash made with a method starts with, i.e. 'scrypt:32768:8:1'."""
+    return generate_password_hash("", method).split("$", 1)[0]
+
+def needs_rehash(password_hash, method):
+    """Whether a stored hash was made with other parameters than method."""
+    return password_hash.split("$", 1)[0] != method_prefix(method)
+
+def hash_task(password, method):
+    return generate_password_hash(password, method)
+
+def verify_task(password_hash, password, method):
+    """Verify a password, and rehash it if the stored hash is outdated.
+
+    Returns:
+        [bool, str]: Whether the password matches, and its hash with the
+        current method if the stored one needs a rehash (None otherwise)
+    """
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a bounded process pool.
+
+    Args:
+        method (str, optional): Werkzeug hash method. Defaults to "scrypt".
+        workers (int, optional): Worker processes, 0 to hash inline.
+        Defaults to 1.
+        queue_depth (int, optional): Hashes that may wait for a worker.
+        Defaults to 8.
+        timeout (float, optional): Seconds to wait for a result. Defaults to 10.
+    """
+
+    def __init__(self, method="scrypt", workers=1, queue_depth=8, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(workers + queue_depth) if workers else None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'timeouts': 0, 'broken': 0}
+        self._stats_lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # Not fork: the web process has threads (and a database pool)
+                    method = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                              else 'spawn')
+                    self._executor = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    def _discard_executor(self, executor):
+        """Shut down a broken executor, the next hash starts a new one."""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _run(self, task, *args):
+        if not self.workers:
+            return task(*args)
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingBusy("Too many password hashes pending")
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(task, *args)
+            except BrokenProcessPool:
+                # A worker died since the last hash, i.e. killed by the OOM killer; start over
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(task, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        self._count('submitted')
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            raise HashingBusy(f"Password hash did not finish within {self.timeout:g} s")
+        except BrokenProcessPool:
+            # A worker died during this hash, the client may retry on a new pool
+            self._count('broken')
+            self._discard_executor(executor)
+            raise HashingBusy("Password hash worker died")
+
+    def hash(self, password):
+        """Hash a password with the configured method.
+
+        Raises:
+            HashingBusy: If the pool is saturated, or the hash timed out or its worker died
+
+        Returns:
+            str: The hash to store
+        """
+        return self._run(hash_task, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Verify a password against its stored hash.
+
+        Raises:
+            HashingBusy: If the pool is saturated, or the check timed out or its worker died
+
+        Returns:
+            [bool, str]: Whether the password matches, and a new hash to store
+            if the stored one was made with other parameters (None otherwise)
+        """
+        return self._run(verify_task, password_hash, password, self.method)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+hasher = None
+hasher_lock = threading.Lock()
+
+def get_hasher():
+    global hasher
+    if hasher is None or hasher.pid != os.getpid():
+        with hasher_lock:
+            if hasher is None or hasher.pid != os.getpid():
+                hasher = PasswordHasher(**PASSWORD_HASH_CONFIG)
+                logging.info(f"Password hashing: {hasher.method}, {hasher.workers} worker(s)")
+    return hasher
+
+def reset_hasher():
+    """Forget the hasher, i.e. in a forked child, without touching its workers."""
+    global hasher, hasher_lock
+    hasher = None
+    hasher_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_hasher)
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+def verify_password(password_hash, password):
+    return get_hasher().verify(password_hash, password)
@@ -0,0 +1,78 @@
+import itertools
+import logging
+
+import numpy as np
+
+from survey_codec import PREFERENCE_FIELDS
+
+'''
+Precomputed TOPSIS rankings for every combination of the survey preferences.
+
+The only user-specific input of the ranking are the four Likert answers
+(ti, cost, freq, effc), each in 1-5, so there are only 5**4 = 625 possible
+rankings. These are computed in one batched TOPSIS pass and stored as a
+compact array of action indices, keyed by the answer tuple.
+'''
+
+# Possible Likert answers for each preference
+LIKERT_LEVELS = (1, 2, 3, 4, 5)
+
+class RankingTable:
+    """Ranked actions for every combination of preference answers.
+
+    Rankings are stored as a (n_combinations x n_actions) array of indices into
+    `actions`, with the combination index computed from the answer tuple in a
+    mixed-radix fashion.
+    """
+
+    def __init__(self, actions, order, version, levels=LIKERT_LEVELS):
+        self.actions = actions
+        self.order = order
+        self.version = version
+        self.levels = tuple(levels)
+        self._level_index = {level: i for i, level in enumerate(self.levels)}
+
+    def key_index(self, answers):
+        """Return the table row for an answer tuple.
+
+        Args:
+            answers (tuple): The preference answers in PREFERENCE_FIELDS order,
+            as ints or numeric strings
+
+        Returns:
+            int: Row index, or None if the combination is not in the table
+        """
+        if len(answers) != len(PREFERENCE_FIELDS):
+            return None
+        index = 0
+        for answer in answers:
+            try:
+                level = self._level_index[int(answer)]
+            except (KeyError, TypeError, ValueError):
+                return None
+            index = index * len(self.levels) + level
+        return index
+
+def build_ranking_table(model, weights_for, levels=LIKERT_LEVELS):
+    """Precompute the ranking for every combination of preference answers.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model to rank with
+        weights_for (Callable): Maps an answer tuple (PREFERENCE_FIELDS order)
+        to the top-level criteria weights in `model.criteria` order
+        levels (tuple, optional): Possible answers per preference. Defaults to
+        LIKERT_LEVELS.
+
+    Returns:
+        RankingTable: The precomputed table
+    """
+    combinations = itertools.product(levels, repeat=len(PREFERENCE_FIELDS))
+    weight_matrix = np.array([weights_for(combo) for combo in combinations])
+
+    # Store rankings as the smallest integer type that holds every action index
+    index_dtype = np.min_scalar_type(max(len(model.actions) - 1, 0))
+    order = model.rank_indices(weight_matrix).astype(index_dtype)
+
+    logging.info(f"Ranking table built for {len(order)} preference combinations "
+                 f"(model version {model.version})")
+    return RankingTable(model.actions, order, model.version, levels)
@@ -0,0 +1,206 @@
+import time
+import logging
+
+from flask import g
+from mysql.connector import errorcode, IntegrityError
+
+from db import get_connection
+from metrics import observe_query
+from survey_codec import ANSWER_COLUMNS, SELECT_COLUMNS, decode_answers
+from materialized import RESULT_COLUMNS
+
+'''
+Data access of the app routes.
+
+Every request uses at most one database connection: it is checked out from
+the pool on the first query of the request, kept in flask.g and returned to
+the pool when the request ends (init_app registers the teardown). Queries run
+as prepared statements that are cached with the pooled connection, so they
+are parsed by the server once per connection.
+
+The follow-up lookups of the routes are folded into their main query, i.e.
+/login gets the user and their newest survey id in one query, and
+registration inserts the user and the survey in one transaction, relying on
+the UNIQUE username instead of checking for it first.
+
+All statements go through an InstrumentedCursor, which counts and times the
+queries of the request (logged at debug level when it ends) and records them
+in the metrics (metrics.py).
+'''
+
+LOGIN_SQL = ("SELECT u.id, u.username, u.password_hash, "
+             "(SELECT a.id FROM answers a WHERE a.user_id = u.id "
+             "ORDER BY a.answered_at DESC LIMIT 1) AS recent_survey_id "
+             "FROM users u WHERE u.username = %s")
+
+INSERT_USER_SQL = "INSERT INTO users (username, password_hash) VALUES (%s, %s)"
+
+UPDATE_PASSWORD_SQL = "UPDATE users SET password_hash = %s WHERE id = %s"
+
+INSERT_SURVEY_SQL = (f"INSERT INTO answers (user_id, {', '.join(ANSWER_COLUMNS + RESULT_COLUMNS)}) "
+                     f"VALUES ({', '.join(['%s'] * (len(ANSWER_COLUMNS + RESULT_COLUMNS) + 1))})")
+
+SURVEY_SQL = (f"SELECT {SELECT_COLUMNS}, {', '.join(RESULT_COLUMNS)} FROM answers "
+              f"WHERE id = %s AND user_id = %s")
+
+SURVEY_LIST_SQL = "SELECT id, answered_at FROM answers WHERE user_id = %s ORDER BY answered_at DESC"
+
+STORE_RESULT_SQL = ("UPDATE answers SET ranking = %s, colors = %s, ranking_version = %s "
+                    "WHERE id = %s")
+
+class UsernameTaken(Exception):
+    """The username of a new account is already registered."""
+
+class InstrumentedCursor:
+    """Cursor wrapper counting and timing the statements of a request.
+
+    Args:
+        cursor: The cursor to run the statements with
+        stats (Dict): Counters updated in place ('queries', 'seconds')
+    """
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            seconds = time.perf_counter() - start
+            self._stats['queries'] += 1
+            self._stats['seconds'] += seconds
+            observe_query(sql, seconds)
+
+class Repository:
+    """Queries of the app on one connection, checked out on first use.
+
+    Args:
+        connect (callable, optional): Returns a connection. Defaults to
+        db.get_connection.
+    """
+
+    def __init__(self, connect=None):
+        self.connect = connect or get_connection
+        self.conn = None
+        self.stats = {'queries': 0, 'seconds': 0.0}
+
+    def _execute(self, sql, params):
+        if self.conn is None:
+            self.conn = self.connect()
+        cursor = InstrumentedCursor(self.conn.prepared(sql), self.stats)
+        cursor.execute(sql, params)
+        return cursor
+
+    def _fetchone(self, sql, params):
+        # Prepared cursors must be read to the end before the next statement
+        rows = self._execute(sql, params).fetchall()
+        return rows[0] if rows else None
+
+    def commit(self):
+        if self.conn is not None:
+            self.conn.commit()
+
+    def rollback(self):
+        if self.conn is not None:
+            self.conn.rollback()
+
+    def close(self):
+        """Return the connection to the pool, rolling back uncommitted work.
+
+        A later query of the request checks out a connection again.
+        """
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            conn.close()
+
+    def find_login(self, username):
+        """User with a username, and the id of their newest survey.
+
+        Returns:
+            Dict: id, username, password_hash and recent_survey_id (None
+            without surveys), or None if there is no such user
+        """
+        return self._fetchone(LOGIN_SQL, (username,))
+
+    def update_password_hash(self, user_id, password_hash):
+        """Store a user's password hash made with new parameters and commit."""
+        self._execute(UPDATE_PASSWORD_SQL, (password_hash, user_id))
+        self.commit()
+
+    def add_survey(self, user_id, answer_values, result_values):
+        """Insert a survey, without committing.
+
+        Args:
+            user_id (int): Owner of the survey
+            answer_values (tuple): Values of ANSWER_COLUMNS, see encode_answers
+            result_values (list): Values of RESULT_COLUMNS
+
+        Returns:
+            int: Id of the survey
+        """
+        return self._execute(INSERT_SURVEY_SQL,
+                             (user_id, *answer_values, *result_values)).lastrowid
+
+    def create_user_with_survey(self, username, password_hash, answer_values, result_values):
+        """Register a user together with their first survey, in one transaction.
+
+        Raises:
+            UsernameTaken: If the username is already registered
+
+        Returns:
+            [int, int]: Id of the user and of the survey
+        """
+        try:
+            user_id = self._execute(INSERT_USER_SQL, (username, password_hash)).lastrowid
+            response_id = self.add_survey(user_id, answer_values, result_values)
+            self.commit()
+        except IntegrityError as e:
+            self.rollback()
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise UsernameTaken(username) from e
+            raise
+        except Exception:
+            self.rollback()
+            raise
+        return user_id, response_id
+
+    def get_survey(self, survey_id, user_id):
+        """A survey of a user, decoded, with its stored result columns.
+
+        Returns:
+            Dict: See decode_answers, or None if the user has no such survey
+        """
+        return decode_answers(self._fetchone(SURVEY_SQL, (survey_id, user_id)))
+
+    def list_surveys(self, user_id):
+        """Ids and times of the surveys of a user, newest first."""
+        return self._execute(SURVEY_LIST_SQL, (user_id,)).fetchall()
+
+    def store_result(self, survey_id, ranking, colors, version):
+        """Store the recomputed result of a survey and commit."""
+        self._execute(STORE_RESULT_SQL, (ranking, colors, version, survey_id))
+        self.commit()
+
+def get_repository():
+    """The repository of the current request."""
+    if 'repository' not in g:
+        g.repository = Repository()
+    return g.repository
+
+def close_repository(exception=None):
+    repository = g.pop('repository', None)
+    if repository is None:
+        return
+    repository.close()
+    if repository.stats['queries']:
+        logging.debug(f"{repository.stats['queries']} queries in "
+                      f"{repository.stats['seconds'] * 1000:.1f} ms")
+
+def init_app(app):
+    """Return the connection of each request to the pool when it ends."""
+    app.teardown_appcontext(close_repository)
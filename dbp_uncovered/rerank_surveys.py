@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+import mysql.connector
+
+from survey_codec import SELECT_COLUMNS, decode_answers
+from materialized import RESULT_COLUMNS, result_version, encode_results, decode_result
+
+'''
+Bulk re-ranking of all stored surveys after a model change.
+
+When the decision matrix, the DBP/action category rankings or the action
+coloring content change, the results stored with the surveys (see
+materialized.py) get another version. The results pages recompute them lazily,
+this job recomputes all of them at once, i.e.,
+
+python rerank_surveys.py --chunk-size 5000
+
+Surveys with an out-of-date (or no) result are streamed from the database
+through a server-side (unbuffered) cursor in primary key order. Every chunk is
+turned into a weight matrix with the same preference logic as the app, ranked
+in one vectorized TOPSIS call, colored in one pass and written back with one
+batched executemany. After every chunk the last survey id is saved to a
+checkpoint file, so an interrupted run resumes where it stopped.
+
+With --dry-run nothing is written, instead it reports for how many surveys
+(and users) the top 5 actions would change compared to the stored result.
+
+Run it from the dbp_uncovered directory, it uses the DB_* settings in .env.
+'''
+
+UPDATE_SQL = ("UPDATE answers SET ranking = %s, colors = %s, ranking_version = %s "
+              "WHERE id = %s")
+
+def select_sql(include_current):
+    """Query streaming the surveys to re-rank after a given id."""
+    where = "id > %s"
+    if not include_current:
+        where += " AND (ranking_version IS NULL OR ranking_version <> %s)"
+    return (f"SELECT {SELECT_COLUMNS}, {', '.join(RESULT_COLUMNS)} FROM answers "
+            f"WHERE {where} ORDER BY id")
+
+class Reranker:
+    """Ranks and colors chunks of surveys with the current model of the app."""
+
+    def __init__(self):
+        # The app holds the compiled model and the preference -> weight logic
+        import app
+
+        self.app = app
+        _, self.model, _ = app.get_compiled_model()
+        self.coloring = app.content.action_coloring()
+        self.version = result_version(self.model.version, self.coloring.version)
+
+        # Position of every model action in the action coloring, -1 if unknown
+        self.coloring_index = np.array([self.coloring.code_index.get(action, -1)
+                                        for action in self.model.actions.tolist()],
+                                       dtype=np.intp)
+        self._weights = {}
+
+    def weights(self, user_response):
+        """Top-level weights of a survey, memoized per preference combination.
+
+        Returns:
+            list: Weights in RATING_CRITERIA order, or None if the preferences
+            are incomplete
+        """
+        key = tuple(user_response.get(field) for field in self.app.PREFERENCE_FIELDS)
+        if key not in self._weights:
+            try:
+                self._weights[key] = self.app.preference_weights(key)
+            except (KeyError, TypeError, ValueError, ZeroDivisionError):
+                self._weights[key] = None
+        return self._weights[key]
+
+    def rank_chunk(self, user_responses):
+        """Rank and color a chunk of surveys.
+
+        Args:
+            user_responses (list): Decoded answers rows
+
+        Returns:
+            [list, ndarray, ndarray]: The surveys that could be ranked, their
+            ranked action indices and colors (N x n_actions)
+        """
+        weights = [self.weights(user_response) for user_response in user_responses]
+        ranked = [user_response for user_response, w in zip(user_responses, weights)
+                  if w is not None]
+        if not ranked:
+            n_actions = len(self.model.actions)
+            return ranked, np.empty((0, n_actions), dtype=np.intp), np.empty((0, n_actions), bool)
+
+        order = self.model.rank_indices(np.array([w for w in weights if w is not None]))
+        green = self.coloring.green(self.coloring_index[order], self.coloring.doing_masks(ranked))
+        return ranked, order, green
+
+def load_checkpoint(filename, version):
+    """Load the checkpoint of an interrupted run with the same version.
+
+    Returns:
+        Dict: The checkpoint, or a new one if there is none for this version
+    """
+    checkpoint = {'version': version, 'last_id': 0, 'processed': 0, 'skipped': 0}
+    if filename and os.path.exists(filename):
+        with open(filename, 'r') as file:
+            saved = json.load(file)
+        if saved.get('version') == version:
+            checkpoint = saved
+            logging.info(f"Resuming after survey id {checkpoint['last_id']} "
+                         f"({checkpoint['processed']} surveys done)")
+        else:
+            logging.info(f"Checkpoint is for version {saved.get('version')}, starting over")
+    return checkpoint
+
+def save_checkpoint(filename, checkpoint):
+    if not filename:
+        return
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_filename, filename)
+
+def top_k_changes(reranker, user_responses, order, k):
+    """Surveys whose top-k actions differ from their stored result.
+
+    The stored results hold action codes, so they are compared by code even
+    when the decision matrix has gained or reordered actions since.
+
+    Returns:
+        [list, int]: User ids of the changed surveys, and the number of
+        surveys without a comparable stored result
+    """
+    new_codes = reranker.model.actions[order[:, :k]].tolist()
+    changed_users = []
+    not_comparable = 0
+    for user_response, new_top in zip(user_responses, new_codes):
+        old_codes, _ = decode_result(user_response.get('ranking'), user_response.get('colors'))
+        if old_codes is None:
+            not_comparable += 1
+        elif old_codes[:k] != new_top:
+            changed_users.append(user_response['user_id'])
+    return changed_users, not_comparable
+
+def run_rerank(read_conn, write_conn, reranker, chunk_size=5000, checkpoint_file=None,
+               dry_run=False, include_current=False, top_k=5, limit=None):
+    """Re-rank the stored surveys.
+
+    Args:
+        read_conn: Connection the surveys are streamed from
+        write_conn: Connection the results are written with
+        reranker (Reranker): Ranks with the current model
+        chunk_size (int, optional): Surveys per chunk. Defaults to 5000.
+        checkpoint_file (str, optional): Checkpoint to resume from and update
+        dry_run (bool, optional): Only report the top-k changes. Defaults to False.
+        include_current (bool, optional): Also re-rank surveys whose result
+        has the current version. Defaults to False.
+        top_k (int, optional): k of the dry-run report. Defaults to 5.
+        limit (int, optional): Stop after this many surveys
+
+    Returns:
+        Dict: Summary of the run
+    """
+    checkpoint = (load_checkpoint(checkpoint_file, reranker.version) if not dry_run
+                  else {'version': reranker.version, 'last_id': 0, 'processed': 0, 'skipped': 0})
+    params = (checkpoint['last_id'],) if include_current else (checkpoint['last_id'], reranker.version)
+
+    # Unbuffered: rows are fetched from the server chunk by chunk
+    cursor = read_conn.cursor(dictionary=True, buffered=False)
+    cursor.execute(select_sql(include_current), params)
+    write_cursor = write_conn.cursor()
+
+    changed_users = set()
+    changed_surveys = 0
+    not_comparable = 0
+    processed = 0
+    start_time = time.perf_counter()
+    try:
+        while limit is None or processed < limit:
+            rows = cursor.fetchmany(chunk_size if limit is None
+                                    else min(chunk_size, limit - processed))
+            if not rows:
+                break
+            user_responses = [decode_answers(row) for row in rows]
+            ranked, order, green = reranker.rank_chunk(user_responses)
+
+            if dry_run:
+                users, n_not_comparable = top_k_changes(reranker, ranked, order, top_k)
+                changed_surveys += len(users)
+                changed_users.update(users)
+                not_comparable += n_not_comparable
+            else:
+                rankings, colors = encode_results(reranker.model.actions[order], green)
+                write_cursor.executemany(UPDATE_SQL, [
+                    (ranking, color, reranker.version, user_response['id'])
+                    for ranking, color, user_response in zip(rankings, colors, ranked)])
+                write_conn.commit()
+
+            processed += len(rows)
+            checkpoint['last_id'] = user_responses[-1]['id']
+            checkpoint['processed'] += len(ranked)
+            checkpoint['skipped'] += len(rows) - len(ranked)
+            if not dry_run:
+                save_checkpoint(checkpoint_file, checkpoint)
+
+            elapsed = time.perf_counter() - start_time
+            logging.info(f"{processed} surveys up to id {checkpoint['last_id']} "
+                         f"({processed / elapsed:.0f} surveys/s)")
+    finally:
+        write_cursor.close()
+        try:
+            cursor.close()
+        except mysql.connector.Error as e:
+            # Rows left unread after --limit or an error, the connection is closed anyway
+            logging.warning(f"Could not close the survey cursor: {e}")
+
+    elapsed = time.perf_counter() - start_time
+    summary = {'version': reranker.version, 'surveys': processed,
+               'ranked': checkpoint['processed'], 'skipped': checkpoint['skipped'],
+               'seconds': round(elapsed, 3),
+               'surveys_per_second': round(processed / elapsed, 1) if elapsed > 0 else None}
+    if dry_run:
+        summary.update({f'top_{top_k}_changed_surveys': changed_surveys,
+                        f'top_{top_k}_changed_users': len(changed_users),
+                        'not_comparable': not_comparable})
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-rank all stored surveys with the "
+                                     "current model.")
+    parser.add_argument('--chunk-size', type=int, default=5000,
+                        help="Surveys per chunk. Defaults to 5000")
+    parser.add_argument('--checkpoint', default='./output/rerank_checkpoint.json',
+                        help="Checkpoint file. Defaults to ./output/rerank_checkpoint.json")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report how many top-k rankings would change")
+    parser.add_argument('-k', '--top-k', type=int, default=5,
+                        help="k of the dry-run report. Defaults to 5")
+    parser.add_argument('--all', action='store_true',
+                        help="Also re-rank surveys whose result is up to date")
+    parser.add_argument('--limit', type=int, help="Stop after this many surveys")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    from config import DB_CONFIG
+
+    reranker = Reranker()
+    logging.info(f"Re-ranking surveys to version {reranker.version}")
+    if args.checkpoint:
+        os.makedirs(os.path.dirname(os.path.abspath(args.checkpoint)), exist_ok=True)
+
+    read_conn = mysql.connector.connect(**DB_CONFIG)
+    write_conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        summary = run_rerank(read_conn, write_conn, reranker, args.chunk_size, args.checkpoint,
+                             args.dry_run, args.all, args.top_k, args.limit)
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+    print(json.dumps(summary, indent=2))
+    if not args.dry_run and args.checkpoint and os.path.exists(args.checkpoint) \
+            and (args.limit is None or summary['surveys'] < args.limit):
+        # Finished, the next run starts from the beginning
+        os.remove(args.checkpoint)
+
+if __name__ == "__main__":
+    main()
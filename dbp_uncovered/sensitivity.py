@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import logging
+import argparse
+import concurrent.futures
+from math import comb
+
+import numpy as np
+import pandas as pd
+
+from topsis import TopsisModel
+
+'''
+Weight-space sensitivity sweep for a TOPSIS settings scenario.
+
+Samples the simplex of the top-level criteria weights (all_DBP, cost_tier,
+time_tier, repeat_tier) on a regular grid, i.e.,
+
+python sensitivity.py -s input/expert-weights_settings.json --step 0.01 -k 5
+
+and ranks the actions for every grid point in vectorized batches across worker
+processes. The rank of every action at every grid point is streamed to disk in
+chunks, only small aggregates are kept in memory. For each action this reports
+the fraction of the simplex where it is in the top-k, how stable its rank is
+compared to the scenario's own weights, and per criterion the weights at which
+its rank changes.
+
+Results are saved to ./output/<settings_name>/sensitivity_step-<step>/.
+'''
+
+def simplex_grid_size(n_criteria, divisions):
+    """Number of grid points on the weight simplex.
+
+    Args:
+        n_criteria (int): Number of criteria
+        divisions (int): Number of grid steps per unit weight (1/step)
+
+    Returns:
+        int: Number of grid points
+    """
+    return comb(divisions + n_criteria - 1, n_criteria - 1)
+
+def compositions(total, parts):
+    """All ways of writing `total` as an ordered sum of `parts` non-negative
+    integers.
+
+    Args:
+        total (int): The integer to split
+        parts (int): The number of parts
+
+    Returns:
+        ndarray: Compositions (n_compositions x parts)
+    """
+    if parts == 1:
+        return np.array([[total]])
+    blocks = []
+    for first in range(total + 1):
+        rest = compositions(total - first, parts - 1)
+        blocks.append(np.column_stack((np.full(len(rest), first), rest)))
+    return np.concatenate(blocks)
+
+def grid_chunk(first_level, divisions, n_criteria):
+    """Grid points of the weight simplex whose first criterion is at a given
+    level. Iterating over all levels covers the whole grid exactly once.
+
+    Args:
+        first_level (int): Level (in grid steps) of the first criterion
+        divisions (int): Number of grid steps per unit weight
+        n_criteria (int): Number of criteria
+
+    Returns:
+        ndarray: Grid levels (n_points x n_criteria), weights are levels/divisions
+    """
+    rest = compositions(divisions - first_level, n_criteria - 1)
+    return np.column_stack((np.full(len(rest), first_level), rest))
+
+def positions_from_order(order):
+    """Convert rankings (action indices from best to worst) into the rank
+    position of every action.
+
+    Args:
+        order (ndarray): Ranked action indices (N x n_actions)
+
+    Returns:
+        ndarray: Rank position (0 = best) of every action (N x n_actions)
+    """
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order,
+                      np.broadcast_to(np.arange(order.shape[1]), order.shape), axis=1)
+    return positions
+
+def sweep_chunk(model, first_level, divisions, top_k, baseline_ranks, chunk_dir,
+                batch_size):
+    """Rank the actions for one chunk of the simplex grid, save the ranks to
+    disk and return the aggregates of the chunk.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+        first_level (int): Level of the first criterion in this chunk
+        divisions (int): Number of grid steps per unit weight
+        top_k (int): Size of the top group
+        baseline_ranks (ndarray): Rank of every action at the scenario weights
+        chunk_dir (str): Directory the chunk ranks are saved to
+        batch_size (int): Number of grid points ranked per TOPSIS call
+
+    Returns:
+        Dict: Aggregated counts and rank statistics of the chunk
+    """
+    n_criteria = len(model.criteria)
+    n_actions = len(model.actions)
+    levels = grid_chunk(first_level, divisions, n_criteria)
+
+    ranks = np.empty((len(levels), n_actions), dtype=np.uint16)
+    for start in range(0, len(levels), batch_size):
+        batch_levels = levels[start:start + batch_size]
+        order = model.rank_indices(batch_levels / divisions)
+        ranks[start:start + batch_size] = positions_from_order(order)
+
+    np.savez(os.path.join(chunk_dir, f"chunk_{first_level:05d}.npz"),
+             levels=levels.astype(np.uint16), ranks=ranks)
+
+    # Aggregates per action, and per criterion weight level and action
+    level_shape = (n_criteria, divisions + 1, n_actions)
+    level_rank_sum = np.zeros(level_shape)
+    level_rank_min = np.full(level_shape, n_actions, dtype=np.int64)
+    level_rank_max = np.full(level_shape, -1, dtype=np.int64)
+    level_count = np.zeros((n_criteria, divisions + 1), dtype=np.int64)
+    for c in range(n_criteria):
+        np.add.at(level_rank_sum[c], levels[:, c], ranks)
+        np.minimum.at(level_rank_min[c], levels[:, c], ranks)
+        np.maximum.at(level_rank_max[c], levels[:, c], ranks)
+        np.add.at(level_count[c], levels[:, c], 1)
+
+    return {
+        'n_points': len(levels),
+        'top_k_count': (ranks < top_k).sum(axis=0),
+        'stable_count': (ranks == baseline_ranks).sum(axis=0),
+        'rank_sum': ranks.sum(axis=0, dtype=np.float64),
+        'rank_min': ranks.min(axis=0).astype(np.int64),
+        'rank_max': ranks.max(axis=0).astype(np.int64),
+        'level_rank_sum': level_rank_sum,
+        'level_rank_min': level_rank_min,
+        'level_rank_max': level_rank_max,
+        'level_count': level_count,
+    }
+
+def merge_aggregates(total, part):
+    """Merge the aggregates of a chunk into the running totals."""
+    if total is None:
+        return part
+    for key in ('n_points', 'top_k_count', 'stable_count', 'rank_sum',
+                'level_rank_sum', 'level_count'):
+        total[key] = total[key] + part[key]
+    for key in ('rank_min', 'level_rank_min'):
+        total[key] = np.minimum(total[key], part[key])
+    for key in ('rank_max', 'level_rank_max'):
+        total[key] = np.maximum(total[key], part[key])
+    return total
+
+def rank_changes(model, aggregates, divisions):
+    """Find, per action and criterion, the weights at which the action's
+    (rounded) mean rank changes when moving along that criterion's axis.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+        aggregates (Dict): Merged aggregates of all chunks
+        divisions (int): Number of grid steps per unit weight
+
+    Returns:
+        Dict: {action: {criterion: [{'weight', 'from_rank', 'to_rank',
+        'min_rank', 'max_rank'}, ...]}} with 1-based ranks
+    """
+    mean_rank = (aggregates['level_rank_sum']
+                 / aggregates['level_count'][:, :, np.newaxis])
+    rounded_rank = np.rint(mean_rank).astype(int) + 1
+
+    changes = {}
+    for a, action in enumerate(model.actions):
+        changes[str(action)] = {}
+        for c, criterion in enumerate(model.criteria):
+            steps = np.flatnonzero(np.diff(rounded_rank[c, :, a])) + 1
+            changes[str(action)][criterion] = [
+                {'weight': round(level / divisions, 6),
+                 'from_rank': int(rounded_rank[c, level - 1, a]),
+                 'to_rank': int(rounded_rank[c, level, a]),
+                 'min_rank': int(aggregates['level_rank_min'][c, level, a]) + 1,
+                 'max_rank': int(aggregates['level_rank_max'][c, level, a]) + 1}
+                for level in steps]
+    return changes
+
+def run_sweep(model, step, top_k, out_dir, jobs, batch_size=4096):
+    """Sweep the weight simplex of a compiled model.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+        step (float): Grid step size of the weights, e.g. 0.01
+        top_k (int): Size of the top group
+        out_dir (str): Directory the results are saved to
+        jobs (int): Number of worker processes
+        batch_size (int, optional): Grid points per TOPSIS call. Defaults to 4096.
+
+    Returns:
+        [DataFrame, Dict]: Rank stability per action and the rank changes per
+        action and criterion
+    """
+    divisions = int(round(1 / step))
+    if not np.isclose(divisions * step, 1):
+        raise ValueError(f"Step {step} does not divide 1 into whole steps")
+
+    n_points = simplex_grid_size(len(model.criteria), divisions)
+    chunk_dir = os.path.join(out_dir, 'chunks')
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    baseline_ranks = positions_from_order(model.rank_indices(model.default_weights)[np.newaxis])[0]
+    logging.info(f"Sweeping {n_points} weightings of '{model.settings_name}' "
+                 f"(step {step}) on {jobs} process(es)")
+
+    start_time = time.perf_counter()
+    aggregates = None
+    task_args = (divisions, top_k, baseline_ranks, chunk_dir, batch_size)
+    if jobs == 1:
+        for first_level in range(divisions + 1):
+            aggregates = merge_aggregates(aggregates, sweep_chunk(model, first_level, *task_args))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(sweep_chunk, model, first_level, *task_args)
+                       for first_level in range(divisions + 1)]
+            for future in concurrent.futures.as_completed(futures):
+                aggregates = merge_aggregates(aggregates, future.result())
+    run_time = time.perf_counter() - start_time
+    logging.info(f"Swept {aggregates['n_points']} weightings in {run_time:.2f} s "
+                 f"({aggregates['n_points'] / run_time:.0f} weightings/s)")
+
+    changes = rank_changes(model, aggregates, divisions)
+    stability_df = pd.DataFrame({
+        'baseline_rank': baseline_ranks + 1,
+        f'top_{top_k}_fraction': aggregates['top_k_count'] / aggregates['n_points'],
+        'stable_fraction': aggregates['stable_count'] / aggregates['n_points'],
+        'mean_rank': aggregates['rank_sum'] / aggregates['n_points'] + 1,
+        'best_rank': aggregates['rank_min'] + 1,
+        'worst_rank': aggregates['rank_max'] + 1,
+    }, index=pd.Index(model.actions, name='action'))
+    for criterion in model.criteria:
+        stability_df[f'{criterion}_rank_changes'] = [len(changes[str(action)][criterion])
+                                                     for action in model.actions]
+    stability_df = stability_df.sort_values('baseline_rank')
+
+    stability_df.to_csv(os.path.join(out_dir, 'rank_stability.csv'))
+    with open(os.path.join(out_dir, 'rank_changes.json'), 'w') as file:
+        json.dump({'settings_name': model.settings_name, 'step': step, 'top_k': top_k,
+                   'criteria': list(model.criteria), 'n_points': int(aggregates['n_points']),
+                   'actions': changes}, file, indent=2)
+
+    return stability_df, changes
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the weight simplex of a "
+                                     "TOPSIS settings scenario.")
+    parser.add_argument('-s', '--settings', required=True, help="Settings file")
+    parser.add_argument('--step', type=float, default=0.05,
+                        help="Grid step size of the weights. Defaults to 0.05")
+    parser.add_argument('-k', '--top-k', type=int, default=5,
+                        help="Size of the top group. Defaults to 5")
+    parser.add_argument('-o', '--output', default='./output/',
+                        help="Output directory. Defaults to ./output/")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="Number of worker processes. Defaults to the number of cores")
+    parser.add_argument('--batch-size', type=int, default=4096,
+                        help="Grid points per TOPSIS call. Defaults to 4096")
+    args = parser.parse_args()
+
+    model = TopsisModel.from_settings_file(args.settings)
+    out_dir = os.path.join(args.output, model.settings_name, f"sensitivity_step-{args.step:g}")
+    stability_df, _ = run_sweep(model, args.step, args.top_k, out_dir,
+                                max(1, args.jobs), args.batch_size)
+
+    print(stability_df.to_string())
+    print(f"\nResults saved to '{out_dir}'")
+
+if __name__ == "__main__":
+    main()
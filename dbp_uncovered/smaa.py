@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from topsis import TopsisModel, normalize_TOPSIS_matrix, TOPSIS_separation, rank_according_to
+from sensitivity import positions_from_order
+
+'''
+Stochastic multicriteria acceptability analysis (SMAA) of the TOPSIS ranking.
+
+Instead of ranking with one weighting (i.e., the expert or the conjoint
+weights), weights are sampled from the simplex of the top-level criteria and,
+optionally, the decision matrix values are perturbed within their IQR. For
+every action this gives its rank acceptability indices (the share of samples
+in which it takes each rank) and its central weight vector (the mean weights
+of the samples in which it ranks first), i.e.,
+
+python smaa.py -s input/expert-weights_settings.json input/conjoint_analysis_settings.json \
+    -n 1000000 --distribution dirichlet --perturb-iqr
+
+The bundled decision matrix holds one (merged) value per action and column,
+not its spread, so by default every value is perturbed by up to half the IQR
+of its column across the actions. This is a deliberate simplification: it
+treats all actions as equally uncertain. Where the per-value IQRs are known,
+pass them with --iqr-file (a sheet with the actions as rows and the model
+columns as columns, holding q3 - q1 of each value); a missing action, column
+or cell falls back to the column IQR.
+
+Perturbed values are not clipped to the observed range of their column, as
+that would only push the best and worst actions inward and bias the
+acceptability indices against them. The only bound is a floor of 0 for the
+columns whose observed values are all non-negative (i.e., the DBP effects),
+which cannot turn negative.
+
+Samples are drawn in chunks with their own seeds spawned from one root seed,
+so results are reproducible regardless of the number of worker processes.
+
+Results are saved to ./output/<settings_name>/smaa/.
+'''
+
+def column_iqr_half_widths(model):
+    """Half the interquartile range of every decision matrix column, which is
+    the range within which the values are perturbed when their own IQR is not
+    known. The same range applies to all actions of a column.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+
+    Returns:
+        ndarray: Half IQR per column
+    """
+    q1, q3 = np.percentile(model.data, [25, 75], axis=0)
+    return (q3 - q1) / 2
+
+def value_iqr_half_widths(model, iqr_df):
+    """Half the IQR of every decision matrix value, taken from a per-value IQR
+    table where it has the value, and from the column IQR otherwise.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+        iqr_df (DataFrame): IQR (q3 - q1) per value, actions as index and the
+        model columns as columns
+
+    Raises:
+        ValueError: If the table has a negative IQR
+
+    Returns:
+        ndarray: Half IQR per value (n_actions x n_columns)
+    """
+    iqr_df = iqr_df.reindex(index=model.actions, columns=list(model.columns))
+    iqr = iqr_df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    if (iqr < 0).any():
+        raise ValueError("The per-value IQR table has negative values")
+    missing = np.isnan(iqr)
+    if missing.all():
+        logging.warning("The per-value IQR table matches no action and column of the model")
+    elif missing.any():
+        logging.info(f"{missing.sum()} of {missing.size} values use the column IQR")
+    return np.where(missing, column_iqr_half_widths(model), iqr / 2)
+
+def value_floors(model):
+    """Lower bound of the perturbed values per column: 0 for the columns
+    whose observed values are all non-negative, none otherwise. There is no
+    upper bound, so the extreme actions can move outward as well as inward.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+
+    Returns:
+        ndarray: Floor per column
+    """
+    return np.where(model.data.min(axis=0) >= 0, 0.0, -np.inf)
+
+def read_iqr_file(path):
+    """Read a per-value IQR table (xlsx or csv, the actions in the first column)."""
+    if path.endswith(('.xlsx', '.xls')):
+        return pd.read_excel(path, index_col=0)
+    return pd.read_csv(path, index_col=0)
+
+def sample_weights(rng, alpha, n_samples):
+    """Sample top-level weight vectors from a Dirichlet distribution (alpha of
+    all ones is uniform on the simplex).
+
+    Args:
+        rng (Generator): Random number generator
+        alpha (ndarray): Dirichlet concentration per criterion
+        n_samples (int): Number of weight vectors
+
+    Returns:
+        ndarray: Weights (n_samples x n_criteria)
+    """
+    return rng.dirichlet(alpha, n_samples)
+
+def smaa_chunk(model, seed, n_samples, alpha, iqr_half, batch_size):
+    """Run the SMAA for one chunk of samples.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+        seed (SeedSequence): Seed of this chunk
+        n_samples (int): Number of samples in this chunk
+        alpha (ndarray): Dirichlet concentration per criterion
+        iqr_half (ndarray): Half IQR per column or per value, or None to keep
+        the decision matrix fixed
+        batch_size (int): Samples per TOPSIS call
+
+    Returns:
+        [ndarray, ndarray]: Rank counts (n_actions x n_actions) and the sum of
+        the weights of the samples where each action ranks first
+        (n_actions x n_criteria)
+    """
+    rng = np.random.default_rng(seed)
+    n_actions = len(model.actions)
+    action_index = np.arange(n_actions)
+    rank_counts = np.zeros(n_actions * n_actions, dtype=np.int64)
+    central_sum = np.zeros((n_actions, len(model.criteria)))
+    floors = None if iqr_half is None else value_floors(model)
+
+    for start in range(0, n_samples, batch_size):
+        size = min(batch_size, n_samples - start)
+        weights = sample_weights(rng, alpha, size)
+        column_weights = model.column_weights(weights)
+
+        if iqr_half is None:
+            norm_np = model.norm
+        else:
+            noise = rng.uniform(-1, 1, (size,) + model.data.shape) * iqr_half
+            data_np = np.maximum(model.data + noise, floors)
+            norm_np = normalize_TOPSIS_matrix(data_np)
+
+        _, _, cs = TOPSIS_separation(norm_np, column_weights, model.crit_type)
+        order = rank_according_to(cs, action_index)
+
+        positions = positions_from_order(order)
+        rank_counts += np.bincount((action_index * n_actions + positions).ravel(),
+                                   minlength=n_actions * n_actions)
+        np.add.at(central_sum, order[:, 0], weights)
+
+    return rank_counts.reshape(n_actions, n_actions), central_sum
+
+def run_smaa(model, n_samples, alpha, perturb_iqr, seed, jobs,
+             chunk_size=50000, batch_size=2000, iqr_df=None):
+    """Run the SMAA with chunks spread over a process pool.
+
+    Args:
+        model (TopsisModel): Compiled TOPSIS model
+        n_samples (int): Total number of samples
+        alpha (ndarray): Dirichlet concentration per criterion
+        perturb_iqr (bool): Whether to perturb the decision matrix within IQR
+        seed (int): Root seed
+        jobs (int): Number of worker processes
+        chunk_size (int, optional): Samples per chunk. Defaults to 50000.
+        batch_size (int, optional): Samples per TOPSIS call. Defaults to 2000.
+        iqr_df (DataFrame, optional): IQR per value (see value_iqr_half_widths).
+        Defaults to None, which perturbs within the column IQR.
+
+    Returns:
+        [DataFrame, DataFrame]: Rank acceptability indices (actions x ranks)
+        and central weight vectors (actions x criteria, plus the first rank
+        acceptability)
+    """
+    n_actions = len(model.actions)
+    if not perturb_iqr:
+        iqr_half = None
+    elif iqr_df is not None:
+        iqr_half = value_iqr_half_widths(model, iqr_df)
+    else:
+        iqr_half = column_iqr_half_widths(model)
+
+    chunk_sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    task_args = (alpha, iqr_half, batch_size)
+
+    rank_counts = np.zeros((n_actions, n_actions), dtype=np.int64)
+    central_sum = np.zeros((n_actions, len(model.criteria)))
+    done = 0
+    start_time = time.perf_counter()
+
+    def collect(result, size):
+        nonlocal rank_counts, central_sum, done
+        rank_counts += result[0]
+        central_sum += result[1]
+        done += size
+        elapsed = time.perf_counter() - start_time
+        rate = done / elapsed
+        sys.stderr.write(f"\r{done}/{n_samples} samples ({100 * done / n_samples:.1f}%), "
+                         f"{rate:.0f} evaluations/s, ETA {(n_samples - done) / rate:.0f} s ")
+        sys.stderr.flush()
+
+    if jobs == 1:
+        for chunk_seed, size in zip(seeds, chunk_sizes):
+            collect(smaa_chunk(model, chunk_seed, size, *task_args), size)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(smaa_chunk, model, chunk_seed, size, *task_args): size
+                       for chunk_seed, size in zip(seeds, chunk_sizes)}
+            for future in concurrent.futures.as_completed(futures):
+                collect(future.result(), futures[future])
+    sys.stderr.write("\n")
+    logging.info(f"{n_samples} TOPSIS evaluations in {time.perf_counter() - start_time:.2f} s")
+
+    actions = pd.Index(model.actions, name='action')
+    acceptability_df = pd.DataFrame(rank_counts / n_samples, index=actions,
+                                    columns=[f"rank_{r}" for r in range(1, n_actions + 1)])
+
+    first_counts = rank_counts[:, 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        central = central_sum / first_counts[:, np.newaxis]
+    central_df = pd.DataFrame(central, index=actions, columns=list(model.criteria))
+    central_df.insert(0, 'first_rank_acceptability', first_counts / n_samples)
+
+    return acceptability_df, central_df
+
+def main():
+    parser = argparse.ArgumentParser(description="Stochastic multicriteria "
+                                     "acceptability analysis of the TOPSIS ranking.")
+    parser.add_argument('-s', '--settings', nargs='+', required=True,
+                        help="Settings file(s). The first defines the model, the "
+                        "weights of all of them centre the Dirichlet distribution")
+    parser.add_argument('-n', '--samples', type=int, default=1000000,
+                        help="Number of samples. Defaults to 1000000")
+    parser.add_argument('--distribution', choices=['uniform', 'dirichlet'], default='uniform',
+                        help="Weight distribution: uniform on the simplex, or a "
+                        "Dirichlet centred on the settings weights. Defaults to uniform")
+    parser.add_argument('--concentration', type=float, default=20.0,
+                        help="Concentration of the Dirichlet distribution. Defaults to 20")
+    parser.add_argument('--perturb-iqr', action='store_true',
+                        help="Perturb the decision matrix values within their IQR "
+                        "(by default the IQR of their column)")
+    parser.add_argument('--iqr-file',
+                        help="Per-value IQR table (xlsx or csv, actions x model columns) "
+                        "to perturb within, implies --perturb-iqr")
+    parser.add_argument('--seed', type=int, default=0, help="Root seed. Defaults to 0")
+    parser.add_argument('-o', '--output', default='./output/',
+                        help="Output directory. Defaults to ./output/")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="Number of worker processes. Defaults to the number of cores")
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help="Samples per chunk. Defaults to 50000")
+    args = parser.parse_args()
+
+    if args.iqr_file:
+        args.perturb_iqr = True
+    models = [TopsisModel.from_settings_file(path) for path in args.settings]
+    model = models[0]
+
+    if args.distribution == 'uniform':
+        alpha = np.ones(len(model.criteria))
+    else:
+        mean_weights = np.mean([m.default_weights for m in models], axis=0)
+        alpha = args.concentration * mean_weights / mean_weights.sum()
+
+    iqr_df = read_iqr_file(args.iqr_file) if args.iqr_file else None
+    acceptability_df, central_df = run_smaa(model, args.samples, alpha, args.perturb_iqr,
+                                            args.seed, max(1, args.jobs), args.chunk_size,
+                                            iqr_df=iqr_df)
+
+    out_dir = os.path.join(args.output, model.settings_name, 'smaa')
+    os.makedirs(out_dir, exist_ok=True)
+    acceptability_df.to_csv(os.path.join(out_dir, 'rank_acceptability.csv'))
+    central_df.to_csv(os.path.join(out_dir, 'central_weights.csv'))
+    with open(os.path.join(out_dir, 'smaa_settings.json'), 'w') as file:
+        json.dump({'settings': args.settings, 'samples': args.samples,
+                   'distribution': args.distribution, 'alpha': alpha.tolist(),
+                   'perturb_iqr': args.perturb_iqr, 'iqr_file': args.iqr_file,
+                   'seed': args.seed,
+                   'chunk_size': args.chunk_size}, file, indent=4)
+
+    print(central_df.sort_values('first_rank_acceptability', ascending=False).to_string())
+    print(f"\nResults saved to '{out_dir}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import numbers
+
+'''
+Encoding of the action-reaction survey answers for the compact `answers`
+table.
+
+The 16 yes/no questions are stored as two bitfields (bit i-1 is question q<i>):
+`yes_answers` has the bit set for a "Yes", `answered_mask` for any answer, so
+unanswered questions (NULL) survive the round trip. The four Likert
+preferences (ti, cost, freq, effc) are stored as TINYINT.
+
+Rows read from the table are decoded back into the survey dict the app works
+with, i.e., user_response['q1'] == 'Yes' and user_response['ti'] == 3.
+'''
+
+# Yes/no questions of the survey, in submission order
+QUESTION_FIELDS = tuple(f"q{i}" for i in range(1, 17))
+
+# Likert preferences of the survey, in submission order
+PREFERENCE_FIELDS = ('ti', 'cost', 'freq', 'effc')
+
+# All survey answers, in the order the survey submits them
+ANSWER_FIELDS = QUESTION_FIELDS + PREFERENCE_FIELDS
+
+YES = "Yes"
+NO = "No"
+
+# Possible preference answers
+PREFERENCE_LEVELS = range(1, 6)
+
+# Columns of the compact answers table holding the survey answers
+ANSWER_COLUMNS = ('yes_answers', 'answered_mask') + PREFERENCE_FIELDS
+
+# Columns to select for decode_answers
+SELECT_COLUMNS = "id, user_id, " + ", ".join(ANSWER_COLUMNS) + ", answered_at"
+
+def parse_int(value):
+    """An integer given as an int or a string of digits, None for anything
+    else (bools, floats like 3.7 or 3.0, other strings)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isascii() and value.isdigit():
+            return int(value)
+    return None
+
+def encode_answers(selected_values):
+    """Encode the submitted survey answers into the compact columns.
+
+    Args:
+        selected_values (list): The 20 answers in ANSWER_FIELDS order, "Yes"/"No"
+        (or None) for the questions and 1-5 (int or string of digits, or None)
+        for the preferences
+
+    Raises:
+        ValueError: If the number of answers or an answer is invalid
+
+    Returns:
+        tuple: Values of ANSWER_COLUMNS
+    """
+    if len(selected_values) != len(ANSWER_FIELDS):
+        raise ValueError(f"Expected {len(ANSWER_FIELDS)} answers, got {len(selected_values)}")
+
+    yes_answers = 0
+    answered_mask = 0
+    for bit, (field, value) in enumerate(zip(QUESTION_FIELDS, selected_values)):
+        if value is None:
+            continue
+        if value not in (YES, NO):
+            raise ValueError(f"Invalid answer for {field}: {value!r}")
+        answered_mask |= 1 << bit
+        if value == YES:
+            yes_answers |= 1 << bit
+
+    preferences = []
+    for field, value in zip(PREFERENCE_FIELDS, selected_values[len(QUESTION_FIELDS):]):
+        if value is None:
+            preferences.append(None)
+            continue
+        level = parse_int(value)
+        if level not in PREFERENCE_LEVELS:
+            raise ValueError(f"Invalid preference for {field}: {value!r}")
+        preferences.append(level)
+
+    return (yes_answers, answered_mask, *preferences)
+
+def decode_questions(yes_answers, answered_mask):
+    """Decode the question bitfields into {'q1': 'Yes'/'No'/None, ...}."""
+    return {field: (YES if yes_answers >> bit & 1 else NO) if answered_mask >> bit & 1 else None
+            for bit, field in enumerate(QUESTION_FIELDS)}
+
+def decode_answers(row):
+    """Decode a row of the compact answers table into the survey dict.
+
+    Args:
+        row (Dict): Row with (at least) the ANSWER_COLUMNS, as returned by a
+        dictionary cursor
+
+    Returns:
+        Dict: The other columns of the row (i.e. id, user_id, answered_at),
+        q1-q16 as "Yes"/"No"/None and the preferences as int or None
+    """
+    if row is None:
+        return None
+    user_response = {key: value for key, value in row.items() if key not in ANSWER_COLUMNS}
+    user_response.update(decode_questions(row['yes_answers'], row['answered_mask']))
+    for field in PREFERENCE_FIELDS:
+        user_response[field] = row[field]
+    return user_response
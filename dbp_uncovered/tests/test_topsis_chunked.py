@@ -0,0 +1,25 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topsis import do_TOPSIS_chunked
+
+def test_chunked_leaves_float64_dataframe_unchanged():
+    rng = np.random.default_rng(0)
+    # One float64 block, so pandas can hand out views of it
+    input_df = pd.DataFrame(rng.uniform(0, 10, (50, 4)), columns=list("abcd"))
+    original = input_df.copy()
+    weight_np = np.array([0.4, 0.3, 0.2, 0.1])
+    crit_type_np = np.array([1, -1, 1, -1])
+
+    first = do_TOPSIS_chunked(input_df, weight_np, crit_type_np, chunk_rows=7)
+    pd.testing.assert_frame_equal(input_df, original)
+
+    second = do_TOPSIS_chunked(input_df, weight_np, crit_type_np, chunk_rows=7)
+    pd.testing.assert_frame_equal(input_df, original)
+    for before, after in zip(first, second):
+        np.testing.assert_array_equal(before, after)
@@ -5,19 +5,21 @@ import sys
 import argparse
 import time
 import json
+import hashlib
+import glob
+import concurrent.futures
 
-# Add path so we can import acronym_dictionary
-sys.path.append('../')
 logging.basicConfig(format='%(name)s - %(levelname)s - %(message)s')
 logging.getLogger().setLevel(logging.INFO)
 
 # Data analysis
 import pandas as pd
 import numpy as np
-from scipy.stats import rankdata # for ranking the candidates
 
-# Own imports
-from acronym_dictionary import direct_acronym_keyword_dict
+from metrics import timed
+
+# acronym_dictionary (pycountry reference data) is slow to import and only
+# needed by some code paths, it is imported there
 
 '''
 Script that performs the TOPSIS analysis using a settings files which is provided
@@ -25,19 +27,35 @@ through command-line arguments.
 
 I.e., 
 
-python run_TOPSIS.py -s example_settings.json
+python topsis.py -s input/expert-weights_settings.json
+
+Several settings files or glob patterns can be given at once, i.e.,
+
+python topsis.py -s 'input/*_settings.json' -j 4
+
+in which case the scenarios are run in parallel over a process pool.
+
+With --memory-limit 512MB the actions are streamed through the TOPSIS
+calculation in row chunks, which bounds its working arrays. The decision
+matrix is still read whole, and the checks of each scenario make one copy of
+the columns it uses.
 
 It also preps and checks the data before.
 
-Results are saved to ./output/ with additional directory structuring and naming
-based on the information containing within the settings file.
+Results are saved to ./output/<settings_name>/ with naming based on the 
+information containing within the settings file.
 '''
 
+@timed('check_data')
 def check_data(input_df, map_acronyms = False):
     """Check the data before analysis, some DBP-related actions are completely
     empty (for example if only positive/negative measurements were made for a 
     certain DBP). This function adds a 1 to all entries in such cases for numerical
     reasons,
+    
+    The input is not changed, it may be shared (i.e. by several scenarios or
+    memory-mapped); the altered data is a new dataframe, and the input itself
+    is returned when nothing needs altering.
 
     Args:
         input_df (DataFrame): Dataframe containing the TOPSIS input data
@@ -58,16 +76,20 @@ def check_data(input_df, map_acronyms = False):
     # of different columns in a TOPSIS analysis
     
     if cols_with_all_zeros:
-        input_df[cols_with_all_zeros] = input_df[cols_with_all_zeros] + 1
+        input_df = input_df.assign(**{col: input_df[col] + 1 for col in cols_with_all_zeros})
         logging.warning(f"The following columns were adjusted by adding 1 due to their values being all 0: {list(cols_with_all_zeros)} ")
     else:
         logging.info("No columns with all zero values found.")
     
     if map_acronyms:
+        from acronym_dictionary import direct_acronym_keyword_dict
+        # Shallow copy, the values stay shared
+        input_df = input_df.copy(deep=False)
         input_df.index = input_df.index.map(direct_acronym_keyword_dict)
     
     return input_df
 
+@timed('check_criteria')
 def check_criteria(input_df, settings_dict, action_rank_dict):
     """Performs some checks on the criteria that will be used for the TOPSIS 
     analysis:
@@ -144,6 +166,7 @@ def check_weights(settings_dict):
         
     return weight_dict
 
+@timed('distribute_DBP_weights')
 def distribute_DBP_weights(input_df, settings_dict, DBP_dict, 
                            DBP_merged = False):
     """Distribute weights assigned to general DBP criteria over individual DBP
@@ -167,6 +190,10 @@ def distribute_DBP_weights(input_df, settings_dict, DBP_dict,
     Returns:
         Dict: Updated settings dict. 
     """
+    # Work on copies so the caller's settings and DBP ranking are not altered
+    settings_dict = dict(settings_dict)
+    DBP_dict = dict(DBP_dict)
+    
     if DBP_merged:
         dbp_column_start = ('all',)
     else:
@@ -244,7 +271,261 @@ def prep_data_for_TOPSIS(input_df, weight_dict, criteria_dict):
     # Return results
     return data_np, weight_np, crit_type_np
     
-def do_TOPSIS(input_df, weight_dict, crit_type_dict):
+def normalize_TOPSIS_matrix(data_np):
+    """Vector-normalise the columns of a decision matrix (step 1 of TOPSIS).
+    
+    Works on a single matrix (n_rows x n_columns) or on a stack of matrices
+    (... x n_rows x n_columns), normalising every matrix separately.
+
+    Args:
+        data_np (ndarray): The decision matrix (or stack of matrices)
+
+    Returns:
+        ndarray: The column-normalised matrix (or stack of matrices)
+    """
+    divisors = np.sqrt(np.einsum('...ij,...ij->...j', data_np, data_np))
+    return data_np / divisors[..., np.newaxis, :]
+
+def TOPSIS_separation(norm_np, weight_np, crit_type_np):
+    """Calculate the separation measures and closeness scores (steps 2-4 of
+    TOPSIS) on an already normalised decision matrix.
+    
+    All steps are broadcasted, so `weight_np` can be a single weight vector
+    (n_columns) or a weight matrix (N x n_columns) that scores N weightings in
+    one pass. Likewise `norm_np` can be a stack of normalised matrices.
+
+    Args:
+        norm_np (ndarray): Normalised decision matrix (... x n_rows x n_columns)
+        weight_np (ndarray): Weights per column (... x n_columns)
+        crit_type_np (ndarray): Criteria type per column (1 = higher is 
+        better, -1 = lower is better)
+
+    Returns:
+        [ndarray, ndarray, ndarray]: S+, S- and closeness score per action, 
+        each with shape (... x n_rows)
+    """
+    # 2) Calculate weighted normalized ratings
+    weighted_np = norm_np * np.asarray(weight_np)[..., np.newaxis, :]
+    
+    # 3) Calculate best/worst possible alternatives, maximizing benefit 
+    # (type 1) or minimizing cost (type -1)
+    max_val = weighted_np.max(axis=-2)
+    min_val = weighted_np.min(axis=-2)
+    a_pos = np.where(crit_type_np == 1, max_val, 
+                     np.where(crit_type_np == -1, min_val, 0.0))
+    a_neg = np.where(crit_type_np == 1, min_val, 
+                     np.where(crit_type_np == -1, max_val, 0.0))
+    
+    # 4) Calculating seperation measures and topsis score of best/worst 
+    # alternatives for each of the actions
+    diff_pos = weighted_np - a_pos[..., np.newaxis, :]
+    diff_neg = weighted_np - a_neg[..., np.newaxis, :]
+    sp = np.sqrt(np.einsum('...ij,...ij->...i', diff_pos, diff_pos))
+    sn = np.sqrt(np.einsum('...ij,...ij->...i', diff_neg, diff_neg))
+    
+    denom = sp + sn
+    cs = np.divide(sn, denom, out=np.zeros_like(sn), where=denom != 0)
+    
+    return sp, sn, cs
+
+def rank_according_to(data, actions):
+    """Order the actions from highest to lowest value of `data`.
+    
+    Ties are broken in favour of the action that comes first in `actions`,
+    as in rank_top_k, so the top-k ranking is a prefix of the full ranking.
+    Works on a single score vector (n_rows) or on a score matrix (N x n_rows),
+    in which case every row is ordered separately.
+
+    Args:
+        data (ndarray): Scores to rank on (... x n_rows)
+        actions (ndarray): Action labels (n_rows)
+
+    Returns:
+        ndarray: Ordered action labels (... x n_rows)
+    """
+    # A stable sort of the negated scores keeps tied actions in their order
+    ind = np.argsort(-np.asarray(data), axis=-1, kind='stable')
+    return actions[ind]
+
+def rank_top_k(data, actions, k):
+    """Return only the k actions with the highest values of `data`, using a
+    partial selection instead of a full sort.
+    
+    Ties are broken deterministically in favour of the action that comes first
+    in `actions`, as in rank_according_to. Works on a single score vector (n_rows) or on a score matrix
+    (N x n_rows), in which case every row is handled separately.
+
+    Args:
+        data (ndarray): Scores to rank on (... x n_rows)
+        actions (ndarray): Action labels (n_rows)
+        k (int): Number of actions to return, at least 1
+
+    Returns:
+        ndarray: The top-k action labels, best first (... x k)
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    data = np.asarray(data)
+    squeeze = data.ndim == 1
+    data = np.atleast_2d(data)
+    n_rows = data.shape[-1]
+    k = min(k, n_rows)
+    
+    # k-th highest value of each row via partial selection
+    kth = np.partition(data, n_rows - k, axis=-1)[:, n_rows - k, np.newaxis]
+    
+    # Keep everything above the k-th value, and fill the remaining places with
+    # the first actions that are tied with it
+    above = data > kth
+    tied = data == kth
+    n_tied_needed = k - above.sum(axis=-1, keepdims=True)
+    selected = above | (tied & (np.cumsum(tied, axis=-1) <= n_tied_needed))
+    ind = np.nonzero(selected)[1].reshape(len(data), k)
+    
+    # Order the k selected actions by value (descending), then by position
+    values = np.take_along_axis(data, ind, axis=-1)
+    ind = np.take_along_axis(ind, np.lexsort((ind, -values), axis=-1), axis=-1)
+    
+    ranked = actions[ind]
+    return ranked[0] if squeeze else ranked
+
+def rank_actions(data, actions, k=None):
+    """Order the actions from highest to lowest value of `data`, either fully
+    (rank_according_to) or only the top-k (rank_top_k).
+
+    Args:
+        data (ndarray): Scores to rank on (... x n_rows)
+        actions (ndarray): Action labels (n_rows)
+        k (int, optional): Number of actions to return, at least 1. Defaults
+        to None, returning all actions.
+
+    Returns:
+        ndarray: Ordered action labels (... x n_rows, or ... x k)
+    """
+    if k is None:
+        return rank_according_to(data, actions)
+    return rank_top_k(data, actions, k)
+
+def parse_memory_limit(memory_limit):
+    """Parse a memory limit such as 512MB, 2G or a plain number of bytes.
+
+    Args:
+        memory_limit (int or str): The memory limit
+
+    Returns:
+        int: The memory limit in bytes
+    """
+    if isinstance(memory_limit, (int, np.integer)):
+        return int(memory_limit)
+    
+    text = str(memory_limit).strip().upper().removesuffix('B').removesuffix('I')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+def TOPSIS_chunk_rows(n_rows, n_columns, memory_limit, dtype=np.float64):
+    """Number of decision matrix rows per chunk that keeps the working memory 
+    of do_TOPSIS_chunked within a memory limit.
+
+    Args:
+        n_rows (int): Number of alternatives
+        n_columns (int): Number of criteria
+        memory_limit (int or str): Memory limit, see parse_memory_limit
+        dtype (dtype, optional): Floating point type of the calculations.
+        Defaults to np.float64.
+
+    Returns:
+        int: Rows per chunk
+    """
+    itemsize = np.dtype(dtype).itemsize
+    
+    # Result arrays (S+, S-, closeness score) and the ranking that follows
+    fixed_bytes = n_rows * (3 * itemsize + 3 * 8)
+    # Chunk as read (float64), weighted chunk and the two differences
+    row_bytes = n_columns * (8 + 3 * itemsize)
+    
+    chunk_rows = (parse_memory_limit(memory_limit) - fixed_bytes) // row_bytes
+    if chunk_rows < 1:
+        raise ValueError(f"Memory limit {memory_limit} is too small for "
+                         f"{n_rows} x {n_columns} decision matrix")
+    return int(min(chunk_rows, n_rows))
+
+def do_TOPSIS_chunked(data, weight_np, crit_type_np, memory_limit=None, 
+                      chunk_rows=None, dtype=np.float64):
+    """TOPSIS separation measures and closeness scores, streaming the 
+    alternatives in row chunks so that large decision matrices can be ranked
+    within a fixed memory budget.
+    
+    The first pass computes the column norms (accumulated in float64) and the
+    column extremes, from which the ideal/anti-ideal points follow. The second
+    pass computes the separation measures chunk by chunk.
+
+    Args:
+        data (ndarray, memmap or DataFrame): Decision matrix 
+        (n_rows x n_columns), only read one chunk at a time
+        weight_np (ndarray): Weights per column
+        crit_type_np (ndarray): Criteria type per column
+        memory_limit (int or str, optional): Memory budget used to size the
+        chunks, see TOPSIS_chunk_rows
+        chunk_rows (int, optional): Rows per chunk, overrides memory_limit
+        dtype (dtype, optional): Floating point type of the calculations and
+        the results, i.e. np.float32 to halve memory. Defaults to np.float64.
+
+    Returns:
+        [ndarray, ndarray, ndarray]: S+, S- and closeness score per action
+    """
+    n_rows, n_columns = data.shape
+    if chunk_rows is None:
+        chunk_rows = (TOPSIS_chunk_rows(n_rows, n_columns, memory_limit, dtype) 
+                      if memory_limit is not None else n_rows)
+    
+    # Chunks are always copies, as the second pass scales them in place and the
+    # input may be shared (i.e. a memory-mapped, read-only decision matrix)
+    if isinstance(data, pd.DataFrame):
+        read_chunk = lambda start, stop, dtype: data.iloc[start:stop].to_numpy(dtype=dtype, copy=True)
+    else:
+        read_chunk = lambda start, stop, dtype: np.array(data[start:stop], dtype=dtype)
+    
+    # First pass: column norms and extremes
+    sum_squares = np.zeros(n_columns)
+    col_max = np.full(n_columns, -np.inf)
+    col_min = np.full(n_columns, np.inf)
+    for start in range(0, n_rows, chunk_rows):
+        chunk = read_chunk(start, start + chunk_rows, np.float64)
+        sum_squares += np.einsum('ij,ij->j', chunk, chunk)
+        np.maximum(col_max, chunk.max(axis=0), out=col_max)
+        np.minimum(col_min, chunk.min(axis=0), out=col_min)
+    
+    # Weighted normalisation as a single scale per column; as the scale is not
+    # negative the ideal points follow directly from the column extremes
+    scale = np.asarray(weight_np, dtype=np.float64) / np.sqrt(sum_squares)
+    a_pos = np.where(crit_type_np == 1, col_max * scale, 
+                     np.where(crit_type_np == -1, col_min * scale, 0.0)).astype(dtype)
+    a_neg = np.where(crit_type_np == 1, col_min * scale, 
+                     np.where(crit_type_np == -1, col_max * scale, 0.0)).astype(dtype)
+    scale = scale.astype(dtype)
+    
+    # Second pass: separation measures
+    sp = np.empty(n_rows, dtype=dtype)
+    sn = np.empty(n_rows, dtype=dtype)
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        weighted = read_chunk(start, stop, dtype)
+        weighted *= scale
+        diff = weighted - a_pos
+        sp[start:stop] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        np.subtract(weighted, a_neg, out=diff)
+        sn[start:stop] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+    
+    denom = sp + sn
+    cs = np.divide(sn, denom, out=np.zeros_like(sn), where=denom != 0)
+    
+    return sp, sn, cs
+
+@timed('do_TOPSIS')
+def do_TOPSIS(input_df, weight_dict, crit_type_dict, memory_limit=None, 
+              dtype=np.float64, k=None, orderings=("Score", "Splus", "Sminus")):
     """Main function that carries out the TOPSIS analysis.
     
     Takes as input the data, the weights, and the criteria types and produces
@@ -254,6 +535,17 @@ def do_TOPSIS(input_df, weight_dict, crit_type_dict):
         input_df (DataFrame): Dataframe containing the data
         weight_dict (Dict): Dictionary containing the assigned weights
         crit_type_dict (Dict): Dictionary containing the criteria types
+        memory_limit (int or str, optional): When given, the alternatives are
+        streamed in row chunks so the working arrays of the calculation stay
+        within this memory budget (i.e., '512MB'); `input_df` itself is not
+        counted. Defaults to None, computing on the whole matrix at once.
+        dtype (dtype, optional): Floating point type of the calculations when
+        streaming. Defaults to np.float64.
+        k (int, optional): Only rank the top-k actions, using a partial 
+        selection; a ValueError is raised for k < 1. Defaults to None, 
+        ranking all actions.
+        orderings (tuple, optional): Which orderings to return, out of "Score",
+        "Splus" and "Sminus". Defaults to all three.
         
     Returns:
         DataFrame: A dataframe containing the final ranked actions.
@@ -262,75 +554,39 @@ def do_TOPSIS(input_df, weight_dict, crit_type_dict):
     # TOPSIS calculation inspired by 
     # https://www.kaggle.com/code/hungrybluedev/topsis-implementation/notebook
     
-    # 0) Format TOPSIS input into numpy arrays/lists
-    data_np, weight_np, crit_type_np = prep_data_for_TOPSIS(input_df, 
-                                                            weight_dict, 
-                                                            crit_type_dict)
+    if k is not None and k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
     
     all_actions = np.array(input_df.index.to_series())
+    n_rows = len(input_df)
     
-    # 1) Normalize ratings
-    n_rows = len(data_np)
-    n_columns = len(weight_np)
-    
-    divisors = np.empty(n_columns)
-    for j in range(n_columns):
-        column = data_np[:, j]
-        divisors[j] = np.sqrt(column@column) # The '@' performs matrix multiplication
-    
-    data_np /= divisors
-    
-    # 2) Calculate weighted normalized ratings
-    data_np *= weight_np
-    
-    # 3) Calculate best/worst possible alternatives
-    a_pos = np.zeros(n_columns)
-    a_neg = np.zeros(n_columns)
-    for j in range(n_columns):
-        column = data_np[:,j]
-        max_val = np.max(column)
-        min_val = np.min(column)
-    
-        # See if we want to maximize benefit or minimize cost
-        if crit_type_np[j] == 1: # Where higher value is better
-            a_pos[j] = max_val
-            a_neg[j] = min_val
-        elif crit_type_np[j] == -1: # Where lower value is better
-            a_pos[j] = min_val
-            a_neg[j] = max_val
+    if memory_limit is None:
+        # 0) Format TOPSIS input into numpy arrays/lists
+        data_np, weight_np, crit_type_np = prep_data_for_TOPSIS(input_df, 
+                                                                weight_dict, 
+                                                                crit_type_dict)
+        
+        # 1) Normalize ratings
+        norm_np = normalize_TOPSIS_matrix(data_np)
+        
+        # 2-4) Weighted ratings, ideal points, separation measures and scores
+        sp, sn, cs = TOPSIS_separation(norm_np, weight_np, crit_type_np)
+    else:
+        # 1-4) Same steps, streaming the alternatives in row chunks
+        weight_np = np.array([weight_dict[key] for key in input_df.keys()])
+        crit_type_np = np.array([crit_type_dict[key] for key in input_df.keys()])
+        sp, sn, cs = do_TOPSIS_chunked(input_df, weight_np, crit_type_np, 
+                                       memory_limit=memory_limit, dtype=dtype)
 
-    # 4) Calculating seperation measures and topsis score of best/worst 
-    # alternatives for each of the actions
-    sp = np.zeros(n_rows)
-    sn = np.zeros(n_rows)
-    cs = np.zeros(n_rows)
-
-    for i in range(n_rows):
-        diff_pos = data_np[i] - a_pos
-        diff_neg = data_np[i] - a_neg
-        sp[i] = np.sqrt(diff_pos @ diff_pos)
-        sn[i] = np.sqrt(diff_neg @ diff_neg)
-        denom = sp[i] + sn[i]
-        cs[i] = sn[i] / denom if denom != 0 else 0
-
-    # 5) Rank according to seperation measures and topsis scores
-    def rank_according_to(data, actions):
-        ranks = rankdata(data).astype(int)
-        ranks -= 1
-        # Sort according to rank
-        ind = np.argsort(ranks)
-        ranks = ranks[ind]
-        actions = actions[ind][::-1]
-        return actions
-    
-    cs_order = rank_according_to(cs, all_actions)
-    sp_order = rank_according_to(sp, all_actions)
-    sn_order = rank_according_to(sn, all_actions)
+    # 5) Rank according to seperation measures and topsis scores, only for
+    # the requested orderings
+    scores = {"Score": cs, "Splus": sp, "Sminus": sn}
+    orders = {name: rank_actions(scores[name], all_actions, k) for name in orderings}
 
     # Create the final ranked dataframe
-    ranked_df = pd.DataFrame(data=zip(cs_order, sp_order, sn_order), 
-                             index=range(1, n_rows + 1), 
-                             columns=["Score", "Splus", "Sminus"])
+    ranked_df = pd.DataFrame(data=orders, 
+                             index=range(1, (n_rows if k is None else min(k, n_rows)) + 1), 
+                             columns=list(orderings))
     
     # Save the final ranked dataframe to an excel file
     # folder_name = out_dir.split('/')[-2]
@@ -340,89 +596,414 @@ def do_TOPSIS(input_df, weight_dict, crit_type_dict):
     logging.info("Ranked actions returned as DataFrame")
     # Return the final ranked dataframe
     return ranked_df
-      
 
+@timed('do_TOPSIS_batch')
+def do_TOPSIS_batch(input_df, weight_matrix, crit_type_dict, k=None):
+    """Carries out the TOPSIS analysis for many weightings at once.
+    
+    The decision matrix is normalised once, after which all N weight vectors
+    are scored in one broadcasted pass. Rankings are identical to calling
+    do_TOPSIS once per weight vector.
 
-# def main():
+    Args:
+        input_df (DataFrame): Dataframe containing the data
+        weight_matrix (ndarray or DataFrame): Weights (N x n_columns), either
+        as an array in the column order of `input_df` or as a dataframe with
+        the criteria as columns
+        crit_type_dict (Dict): Dictionary containing the criteria types
+        k (int, optional): Only rank the top-k actions. Defaults to None.
+
+    Returns:
+        [ndarray, ndarray, ndarray, ndarray]: Ranked actions according to 
+        the closeness score (N x n_rows, or N x k), the closeness scores, S+
+        and S- (each N x n_rows, in the row order of `input_df`)
+    """
+    if isinstance(weight_matrix, pd.DataFrame):
+        weight_matrix = weight_matrix[list(input_df.keys())].to_numpy()
+    weight_matrix = np.atleast_2d(np.asarray(weight_matrix, dtype=np.float64))
+    
+    if weight_matrix.shape[1] != input_df.shape[1]:
+        raise ValueError(f"Weight matrix has {weight_matrix.shape[1]} columns, "
+                         f"expected {input_df.shape[1]}")
+    
+    crit_type_np = np.array([crit_type_dict[key] for key in input_df.keys()])
+    data_np = input_df.to_numpy(dtype=np.float64)
+    all_actions = np.array(input_df.index.to_series())
+    
+    norm_np = normalize_TOPSIS_matrix(data_np)
+    sp, sn, cs = TOPSIS_separation(norm_np, weight_matrix, crit_type_np)
+    ranked_actions = rank_actions(cs, all_actions, k)
+    
+    logging.info(f"Ranked actions returned for {len(weight_matrix)} weightings")
+    return ranked_actions, cs, sp, sn
+
+class TopsisModel:
+    """Immutable TOPSIS model compiled once from a settings dict/file.
+    
+    Compiling runs check_data, distribute_DBP_weights, check_criteria and
+    check_weights a single time and keeps the result as arrays:
+    
+    - `norm`: the column-normalised decision matrix (n_actions x n_columns)
+    - `crit_type`: the criteria type per column
+    - `expansion`: a (n_criteria x n_columns) matrix mapping the top-level
+      weights (i.e., all_DBP, cost_tier, ...) onto the per-DBP columns
+    
+    Scoring a weighting is then a small matrix-vector product followed by the
+    separation measures and a rank, with no dataframe or dict handling.
+    
+    `data` and `norm` are built for the settings (the columns they use, the
+    mapped action tiers) and belong to the process that compiled the model,
+    also when the decision matrix is memory-mapped (see decision_matrix.py).
+    """
+    
+    __slots__ = ('settings_name', 'criteria', 'columns', 'actions', 'data', 
+                 'norm', 'crit_type', 'expansion', 'default_weights', 
+                 'version', '_action_index')
+    
+    def __init__(self, settings_dict, input_df, matrix_version=""):
+        """Compile a model from a settings dict and a decision matrix.
+
+        Args:
+            settings_dict (Dict): TOPSIS settings (same schema as the
+            input/*_settings.json files)
+            input_df (DataFrame): Dataframe containing the TOPSIS input data
+            matrix_version (str, optional): Version id of the decision matrix,
+            used in the model version. Defaults to "".
+        """
+        # Copied into plain dicts, the settings may be read-only (MappingProxyType)
+        weight_settings = {key: dict(value) for key, value in settings_dict['weight_settings'].items()}
+        criteria = list(weight_settings.keys())
         
-#     # Load settings
-
-#     weight_settings = {"all_DBP": {"type": 1,"weight": 0.428},"cost_tier": {"type": 1,"weight": 0.142},"time_tier": {"type": 1,"weight": 0.215},"repeat_tier": {"type": 1,"weight": 0.215}}
-
-#     DBP_ranking_dict = {
-#         "THM": 1,
-#         "IDBP": 1,
-#         "BrDBP": 1,
-#         "HAA": 2,
-#         "HAN": 3,
-#         "CB": 4,
-#         "NS": 5,
-#         "HAL": 6,
-#         "HAM": 7,
-#         "HNM": 8,
-#         "HBQ": 9,
-#         "PDBP": 10,
-#         "HP": 11,
-#         "BPA": 12,
-#         "VOC": 12,
-#         "HDBP": 12,
-#         "AOX": 12
-#     }
-
-    
-#     action_cat_ranking_dict = {
-#         "RW": 1,
-#         "CA": 1,
-#         "PN": 1,
-#         "PC": 1,
-#         "FL": 1,
-#         "BL": 1,
-#         "CK": 1,
-#         "A_other": 1
-#     }
-
-    
-#     dec_matrix_settings = {
-#         "input_file": "./input/input_data_topsis_IQR_merge-DBP_all-DBP.xlsx",
-#         "cost_time_setting": "IQR",
-#         "collect_DBP": "all-DBP"
-#     }
-
-#     # Load data file
-#     input_filename = dec_matrix_settings['input_file']
-
-#     input_data_df = pd.read_excel(input_filename,index_col = [0])
-#     input_data_df = input_data_df.drop(columns=["all_Other"], errors="ignore")
-    
-#     logging.info(f"Starting TOPSIS run: {"expert-weights"}")
-    
-#     # Check the data for zero columns (i.e., all entries zero)
-#     input_data_df = check_data(input_data_df, map_acronyms = False)
-    
-#     # Set DBP weight distributions
-#     weight_settings = distribute_DBP_weights(input_data_df, weight_settings, 
-#                                              DBP_ranking_dict, 
-#                                              DBP_merged = True)
-    
-#     # Check settings for criteria
-#     input_data_df, crit_type_dict = check_criteria(input_data_df, 
-#                                                    weight_settings, 
-#                                                    action_cat_ranking_dict)
-#     for col in input_data_df.columns:
-#         if col not in weight_settings:
-#             logging.warning(f"⚠️ Column '{col}' not found in weight settings!")
-
-
-#     # Check settings for weights and retrieve direct weights dictionary
-#     weight_dict = check_weights(weight_settings)
-    
-
-
-#     # Do TOPSIS
-#     out_df = do_TOPSIS(input_data_df, weight_dict, crit_type_dict)
-#     print(out_df)
-
-#     logging.info("Finished TOPSIS run.")
-    
-# if __name__ == "__main__":
-#     main()
+        # Validate the weights given in the settings
+        check_weights(weight_settings)
+        
+        # Check the data for zero columns (i.e., all entries zero). check_data
+        # leaves its input alone, so a shared or memory-mapped matrix is not copied
+        input_df = check_data(input_df, map_acronyms = False)
+        
+        # Distribute a unit weight over the DBP columns, which gives the share
+        # of each top-level criterion that ends up in each column
+        unit_settings = {key: {'type': value['type'], 'weight': 1.0} 
+                         for key, value in weight_settings.items()}
+        unit_settings = distribute_DBP_weights(input_df, unit_settings, 
+                                               settings_dict['DBP_ranking'], 
+                                               DBP_merged = settings_dict.get('DBP-merged', True))
+        input_df, crit_type_dict = check_criteria(input_df, unit_settings, 
+                                                  settings_dict['action_category_ranking'])
+        columns = list(input_df.keys())
+        
+        expansion = np.zeros((len(criteria), len(columns)))
+        for j, col in enumerate(columns):
+            source = col if col in weight_settings else col.split('_')[0] + '_DBP'
+            expansion[criteria.index(source), j] = unit_settings[col]['weight']
+        
+        data_np = input_df.to_numpy(dtype=np.float64)
+        settings_hash = hashlib.sha256(json.dumps(
+            {key: value for key, value in settings_dict.items() if key != 'settings_name'},
+            sort_keys=True, default=dict).encode()).hexdigest()
+        
+        arrays = {
+            'data': data_np,
+            'norm': normalize_TOPSIS_matrix(data_np),
+            'crit_type': np.array([crit_type_dict[col] for col in columns]),
+            'expansion': expansion,
+            'default_weights': np.array([weight_settings[key]['weight'] for key in criteria]),
+            'actions': np.array(input_df.index.to_series()),
+            '_action_index': np.arange(len(input_df)),
+        }
+        for name, array in arrays.items():
+            array.setflags(write=False)
+            object.__setattr__(self, name, array)
+        
+        object.__setattr__(self, 'settings_name', settings_dict.get('settings_name'))
+        object.__setattr__(self, 'criteria', tuple(criteria))
+        object.__setattr__(self, 'columns', tuple(columns))
+        object.__setattr__(self, 'version', 
+                           hashlib.sha256((matrix_version + settings_hash).encode()).hexdigest()[:12])
+        
+        logging.info(f"TOPSIS model compiled: {self.settings_name} "
+                     f"({len(self.actions)} actions, {len(columns)} columns)")
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("TopsisModel is immutable")
+    
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+    
+    def __setstate__(self, state):
+        # Used when a model is sent to worker processes
+        for name, value in state.items():
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            object.__setattr__(self, name, value)
+    
+    @classmethod
+    def from_settings_file(cls, settings_filename, input_df=None, matrix_version=""):
+        """Compile a model from a settings json file.
+
+        Args:
+            settings_filename (str): Path to the settings file
+            input_df (DataFrame, optional): Decision matrix to use. Defaults to
+            loading the 'input_file' given in the settings.
+            matrix_version (str, optional): Version id of the decision matrix.
+            Defaults to "".
+
+        Returns:
+            TopsisModel: The compiled model
+        """
+        with open(settings_filename, 'r') as file:
+            settings_dict = json.load(file)
+        
+        if input_df is None:
+            from decision_matrix import load_decision_matrix
+            input_df = load_decision_matrix(settings_dict['dec_matrix_settings']['input_file'])
+        
+        return cls(settings_dict, input_df, matrix_version)
+    
+    def column_weights(self, weights=None):
+        """Expand top-level criteria weights onto the decision matrix columns.
+
+        Args:
+            weights (array-like or Dict, optional): Weights in `criteria` order,
+            either a vector (n_criteria), a matrix (N x n_criteria) or a dict 
+            keyed by criterion. Defaults to the weights in the settings.
+
+        Returns:
+            ndarray: Column weights (n_columns or N x n_columns)
+        """
+        if weights is None:
+            weights = self.default_weights
+        elif isinstance(weights, dict):
+            weights = [weights[key] for key in self.criteria]
+        return np.asarray(weights, dtype=np.float64) @ self.expansion
+    
+    def score(self, weights=None):
+        """Calculate S+, S- and the closeness score of every action.
+
+        Args:
+            weights (array-like or Dict, optional): Top-level criteria weights,
+            see column_weights. Defaults to the weights in the settings.
+
+        Returns:
+            [ndarray, ndarray, ndarray]: S+, S- and closeness score per action
+            (n_actions or N x n_actions)
+        """
+        return TOPSIS_separation(self.norm, self.column_weights(weights), 
+                                 self.crit_type)
+    
+    def rank_indices(self, weights=None, k=None):
+        """Rank the actions by closeness score, returning row indices into
+        `actions`.
+
+        Args:
+            weights (array-like or Dict, optional): Top-level criteria weights,
+            see column_weights. Defaults to the weights in the settings.
+            k (int, optional): Only rank the top-k actions, at least 1. 
+            Defaults to None.
+
+        Returns:
+            ndarray: Ranked action indices (n_actions or N x n_actions, or k
+            instead of n_actions)
+        """
+        _, _, cs = self.score(weights)
+        return rank_actions(cs, self._action_index, k)
+    
+    def rank(self, weights=None, k=None):
+        """Rank the actions by closeness score.
+
+        Args:
+            weights (array-like or Dict, optional): Top-level criteria weights,
+            see column_weights. Defaults to the weights in the settings.
+            k (int, optional): Only rank the top-k actions, at least 1. 
+            Defaults to None.
+
+        Returns:
+            ndarray: Ranked action codes (n_actions or N x n_actions, or k 
+            instead of n_actions)
+        """
+        return self.actions[self.rank_indices(weights, k)]
+    
+    def ranked_dataframe(self, weights=None, k=None, 
+                         orderings=("Score", "Splus", "Sminus")):
+        """Rank the actions like do_TOPSIS does.
+
+        Args:
+            weights (array-like or Dict, optional): Top-level criteria weights,
+            see column_weights. Defaults to the weights in the settings.
+            k (int, optional): Only rank the top-k actions. Defaults to None.
+            orderings (tuple, optional): Which orderings to return, out of 
+            "Score", "Splus" and "Sminus". Defaults to all three.
+
+        Returns:
+            DataFrame: A dataframe containing the final ranked actions.
+        """
+        sp, sn, cs = self.score(weights)
+        scores = {"Score": cs, "Splus": sp, "Sminus": sn}
+        orders = {name: rank_actions(scores[name], self.actions, k) for name in orderings}
+        n_ranked = len(self.actions) if k is None else min(k, len(self.actions))
+        return pd.DataFrame(data=orders, 
+                            index=range(1, n_ranked + 1), 
+                            columns=list(orderings))
+      
+
+
+def expand_settings_paths(patterns):
+    """Expand settings file arguments, which can be file paths or glob 
+    patterns, into an ordered list of unique paths.
+
+    Args:
+        patterns (list): Settings file paths and/or glob patterns
+
+    Returns:
+        list: The settings file paths
+    """
+    settings_paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logging.warning(f"No settings files match '{pattern}'")
+        for path in matches:
+            if path not in settings_paths:
+                settings_paths.append(path)
+    return settings_paths
+
+# Decision matrices shared with the worker processes, keyed by input file
+_worker_matrices = {}
+
+def _init_worker(matrices):
+    _worker_matrices.update(matrices)
+
+def prepare_settings(input_df, settings_dict):
+    """Run the checks on data, criteria and weights of a settings scenario.
+
+    Args:
+        input_df (DataFrame): Dataframe containing the TOPSIS input data
+        settings_dict (Dict): TOPSIS settings of the scenario
+
+    Returns:
+        [DataFrame, Dict, Dict]: The checked data, the weight per column and
+        the criteria type per column
+    """
+    input_df = check_data(input_df, map_acronyms = False)
+    weight_settings = distribute_DBP_weights(input_df, settings_dict['weight_settings'], 
+                                             settings_dict['DBP_ranking'], 
+                                             DBP_merged = settings_dict.get('DBP-merged', True))
+    input_df, crit_type_dict = check_criteria(input_df, weight_settings, 
+                                              settings_dict['action_category_ranking'])
+    weight_dict = check_weights(weight_settings)
+    return input_df, weight_dict, crit_type_dict
+
+def run_scenario(settings_dict, out_dir, memory_limit=None, dtype=np.float64):
+    """Run the TOPSIS analysis for one settings scenario and save the ranked
+    actions to <out_dir>/<settings_name>/.
+
+    Args:
+        settings_dict (Dict): TOPSIS settings of the scenario
+        out_dir (str): Output directory
+        memory_limit (int or str, optional): Stream the alternatives in row
+        chunks, bounding the working memory of the TOPSIS calculation (not
+        of the decision matrix and its checked copy). Defaults to None.
+        dtype (dtype, optional): Floating point type used when streaming.
+        Defaults to np.float64.
+
+    Returns:
+        [str, str, float]: Settings name, output file and run time in seconds
+    """
+    start_time = time.perf_counter()
+    settings_name = settings_dict['settings_name']
+    input_df, matrix_version = _worker_matrices[settings_dict['dec_matrix_settings']['input_file']]
+    
+    logging.info(f"Starting TOPSIS run: {settings_name}")
+    if memory_limit is None:
+        model = TopsisModel(settings_dict, input_df, matrix_version)
+        ranked_df = model.ranked_dataframe()
+    else:
+        input_df, weight_dict, crit_type_dict = prepare_settings(input_df, settings_dict)
+        ranked_df = do_TOPSIS(input_df, weight_dict, crit_type_dict, 
+                              memory_limit=memory_limit, dtype=dtype)
+    
+    # Save the final ranked dataframe, together with the settings used
+    scenario_dir = os.path.join(out_dir, settings_name)
+    os.makedirs(scenario_dir, exist_ok=True)
+    output_name = os.path.join(scenario_dir, settings_name + "_TOPSIS-result-ranked.xlsx")
+    ranked_df.to_excel(output_name)
+    with open(os.path.join(scenario_dir, settings_name + "_settings.json"), 'w') as file:
+        json.dump(settings_dict, file, indent=4)
+    logging.info(f"Ranked actions saved as '{output_name}'")
+    
+    return settings_name, output_name, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the TOPSIS analysis for "
+                                     "one or more settings files.")
+    parser.add_argument('-s', '--settings', nargs='+', required=True,
+                        help="Settings file(s) or glob pattern(s), e.g. 'input/*_settings.json'")
+    parser.add_argument('-o', '--output', default='./output/',
+                        help="Output directory. Defaults to ./output/")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="Number of worker processes. Defaults to the number of cores")
+    parser.add_argument('--memory-limit', default=None,
+                        help="Stream the actions in row chunks so the TOPSIS working "
+                        "arrays stay within this budget per scenario, e.g. 512MB. The "
+                        "decision matrix itself is still loaded whole")
+    parser.add_argument('--float32', action='store_true',
+                        help="Use float32 instead of float64 when streaming")
+    args = parser.parse_args()
+    dtype = np.float32 if args.float32 else np.float64
+    
+    from decision_matrix import file_sha256, load_decision_matrix
+    
+    # Load settings
+    scenarios = []
+    for settings_filename in expand_settings_paths(args.settings):
+        with open(settings_filename, 'r') as file:
+            settings_dict = json.load(file)
+        settings_dict.setdefault('settings_name', 
+                                 os.path.basename(settings_filename).replace('_settings.json', '')
+                                 .replace('.json', ''))
+        scenarios.append(settings_dict)
+    
+    if not scenarios:
+        logging.error("No settings files found.")
+        sys.exit(1)
+    
+    # Load each distinct decision matrix only once
+    start_time = time.perf_counter()
+    matrices = {}
+    for settings_dict in scenarios:
+        input_filename = settings_dict['dec_matrix_settings']['input_file']
+        if input_filename not in matrices:
+            matrices[input_filename] = (load_decision_matrix(input_filename), 
+                                        file_sha256(input_filename)[:12])
+    load_time = time.perf_counter() - start_time
+    
+    # Run the scenarios across a process pool
+    jobs = max(1, min(args.jobs, len(scenarios)))
+    results = []
+    if jobs == 1:
+        _init_worker(matrices)
+        for settings_dict in scenarios:
+            results.append(run_scenario(settings_dict, args.output, args.memory_limit, dtype))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, 
+                                                    initializer=_init_worker, 
+                                                    initargs=(matrices,)) as executor:
+            futures = [executor.submit(run_scenario, settings_dict, args.output, 
+                                       args.memory_limit, dtype) 
+                       for settings_dict in scenarios]
+            for future in futures:
+                results.append(future.result())
+    total_time = time.perf_counter() - start_time
+    
+    # Timing summary
+    name_width = max(len(name) for name, _, _ in results)
+    print(f"\n{'Scenario':<{name_width}}  {'Time (s)':>8}  Output")
+    for settings_name, output_name, run_time in results:
+        print(f"{settings_name:<{name_width}}  {run_time:>8.3f}  {output_name}")
+    print(f"\n{len(matrices)} decision matrix file(s) loaded in {load_time:.3f} s")
+    print(f"{len(results)} scenario(s) on {jobs} process(es) in {total_time:.3f} s")
+    
+    logging.info("Finished TOPSIS run.")
+    
+if __name__ == "__main__":
+    main()